@@ -1,5 +1,174 @@
-from aumh import *
-from aumhConfig import *
-from aumhDigital import *
-from aumhNeopixel import *
-from aumhMQTT import *
\ No newline at end of file
+###############################################################################
+#                                 __init__.py                                 #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+#  The package loads its submodules lazily, 'import aumh' only sets up this    #
+# module and each submodule is imported the first time one of its names is    #
+# looked up (aumh.aumhDigital, from aumh import aumhNeopixel, ...)  The MQTT  #
+# handler (And paho) is only loaded when one of its names is used.            #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+import sys
+import types
+import importlib
+
+#  Submodules in the order their names are exported, a name more than one of
+# them defines comes from the later one (As with the star imports this file
+# used to do.)
+submodules = (
+	"aumh",
+	"aumhScheduler",
+	"aumhMetrics",
+	"aumhConfig",
+	"aumhDigital",
+	"aumhColor",
+	"aumhNeopixel",
+	"aumhEffects",
+	"aumhAnimation",
+	"aumhClip",
+	"aumhMapping",
+	"aumhMQTT",
+	"aumhAsync",
+	"aumhCache",
+	"aumhEmulator",
+	"aumhManager",
+)
+
+#  Submodules which need something that may not be installed.  They are
+# searched last for unknown names and left out of star imports when their
+# import fails.
+optional = ("aumhMQTT",)
+
+# aumhPackage
+#
+#  Module type for the package.  Names which aren't set yet end up in
+# __getattr__, which imports the submodule providing them and copies its
+# exports into the package (So the lookup only happens once.)
+class aumhPackage(types.ModuleType):
+	# __getattr__
+	#
+	# @name, attribute being looked up
+	# @ret, the attribute, AttributeError if no submodule has it.
+	def __getattr__(self, name):
+		if name.startswith("__"):
+			if name == "__all__":
+				self.__all__ = self.exportNames()
+				return self.__all__
+
+			raise AttributeError(name)
+
+		if name in submodules: #Class named after its module.
+			self.load(name)
+
+		else:
+			for submodule in searchOrder():
+				if self.load(submodule) and name in self.lazyLoaded[submodule]:
+					break
+
+		try:
+			return self.__dict__[name]
+		except KeyError:
+			raise AttributeError("module '%s' has no attribute '%s'" % (self.__name__, name))
+
+	# __getattribute__
+	#
+	#  Importing a submodule directly (import aumh.aumhNeopixel, or one
+	# submodule importing another without going through load()) has the import
+	# system store it as a package attribute, hiding the export named after
+	# it.  Looking such a name up records the submodule as loaded and lays the
+	# exports back down.
+	def __getattribute__(self, name):
+		value = types.ModuleType.__getattribute__(self, name)
+		if name not in submodules or not isinstance(value, types.ModuleType):
+			return value
+
+		loaded = self.lazyLoaded
+		if name in loaded and name not in loaded[name]: #The module is all the name is.
+			return value
+
+		if value.__name__ != "%s.%s" % (self.__name__, name):
+			return value
+
+		loaded[name] = exports(value)
+		self.relay()
+
+		return self.__dict__[name]
+
+	def __dir__(self):
+		return sorted(set(self.__dict__) | set(submodules))
+
+	# load
+	#
+	# @submodule, name from submodules
+	# @ret, True if it's loaded.
+	def load(self, submodule):
+		if submodule in self.lazyLoaded:
+			return True
+
+		if submodule in self.lazyFailed:
+			return False
+
+		try:
+			module = importlib.import_module("%s.%s" % (self.__name__, submodule))
+		except ImportError:
+			if submodule not in optional:
+				raise
+
+			self.lazyFailed.add(submodule)
+			return False
+
+		self.lazyLoaded[submodule] = exports(module)
+		self.relay()
+
+		return True
+
+	# relay
+	#
+	#  Importing sets package attributes to submodules (And the submodule may
+	# have imported others), so every loaded export set is laid back down in
+	# order.
+	def relay(self):
+		for name in submodules:
+			if name in self.lazyLoaded:
+				self.__dict__.update(self.lazyLoaded[name])
+
+	# exportNames
+	#
+	# @ret, what 'from aumh import *' gives, every available submodule's exports.
+	def exportNames(self):
+		for submodule in submodules:
+			self.load(submodule)
+
+		return sorted(set(name for submodule in self.lazyLoaded for name in self.lazyLoaded[submodule]))
+
+# searchOrder
+#
+# @ret, submodules with the optional ones last.
+def searchOrder():
+	return [ name for name in submodules if name not in optional ] + list(optional)
+
+# exports
+#
+# @module, submodule
+# @ret, dict of the names 'from module import *' would bind.
+def exports(module):
+	names = getattr(module, "__all__", None)
+	if names is None:
+		names = [ name for name in module.__dict__ if not name.startswith("_") ]
+
+	return dict((name, getattr(module, name)) for name in names)
+
+package = aumhPackage(__name__, sys.modules[__name__].__doc__)
+package.__dict__.update(dict((key, value) for key, value in globals().items() if key.startswith("__") and key != "__builtins__"))
+package.lazyLoaded = {} #submodule:exports
+package.lazyFailed = set()
+package.lazyOriginal = sys.modules[__name__] #Python 2 clears a module's globals when it's freed, this module's code still needs them.
+
+sys.modules[__name__] = package
@@ -16,13 +16,20 @@ from __future__ import print_function
 
 import serial
 import pprint
+import os
 import sys
 import struct
 import time
 import socket
-import math #We needed the ceil() function.
 import multiprocessing
 import logging
+import select
+import random
+import collections
+import threading
+
+from aumhScheduler import *
+from aumhMetrics import *
 
 # Debug value
 DEBUG=0
@@ -58,6 +65,56 @@ g_uart_frag_bad = "FF"
 arduino_frag_size = 63
 arduino_frag_wait_sec = 2
 
+# Most fragments msg_frag can describe.
+arduino_max_frags = 255
+
+# Pipelined submission (submitMessage/batch.)  Unfragmented frames are written
+# back to back while they fit in the firmware's receive fifo together.
+arduino_fifo_size = 64
+max_in_flight = 4
+
+#  Fragment window, chunks written ahead of their CT/FF reply.  Chunks carry
+# no sequence number and the stock firmware takes whatever arrives after a FF
+# as the chunk it rejected, so with it fragments go out stop-and-wait (A
+# window of 1, the default.)  Firmware which drops its input after a FF until
+# the line has been quiet for arduino_frag_resync_sec can be given a larger
+# window (aumh's fragWindow); a FF then waits out the resync and goes back to
+# the rejected chunk, the ones behind it having been dropped.  The firmware
+# reads one chunk while its rx fifo holds the next, which bounds the window.
+# The chunk size can't adapt, the firmware cuts the frame into
+# arduino_frag_size chunks from the header's msg_frag count.
+arduino_frag_resync_sec = 0.02
+frag_window_max = 1 + arduino_fifo_size // arduino_frag_size
+
+# serialReset tuning.  Opening the port usually resets the board, so rather
+# than sleeping we probe with a config manage message until it answers.
+reset_boot_timeout = 5		#Give up waiting for a boot response after this.
+reset_probe_interval = 0.1	#Time allowed for each probe to be answered.
+reset_attempts = 6			#Port open attempts before giving up.
+reset_backoff_base = 0.05	#First retry delay, doubled for every attempt...
+reset_backoff_max = 5		#...but never longer than this.
+
+# Precompiled frame structures.  The out/in length words are little endian on
+# the wire, everything else in the header is a single byte.
+headerStruct = struct.Struct("<BBBBBBHHBB")
+uint8Struct = struct.Struct("B")
+uint16Struct = struct.Struct("<H")
+uint16BEStruct = struct.Struct(">H")
+
+# Frame delimiters
+key_start = 0xaa
+key_end = 0xfb
+
+# to_bytes lookup for the common integer widths, keyed by (length, big endian)
+intStructs = {
+	(1, True):struct.Struct(">B"),
+	(1, False):struct.Struct("<B"),
+	(2, True):struct.Struct(">H"),
+	(2, False):struct.Struct("<H"),
+	(4, True):struct.Struct(">I"),
+	(4, False):struct.Struct("<I"),
+}
+
 # isInt
 #
 # @i, type that can be casted to int.
@@ -75,10 +132,19 @@ def isInt(i):
 # @length, size in bytes that the integer should become
 # @endianess, guess.
 def to_bytes(n, length, endianess='big'):
-	#print("to_bytes n is: '%s'" % str(n))
-	h = '%x' % n
-	s = ('0'*(len(h) % 2) + h).zfill(length*2).decode('hex')
-	return s if endianess == 'big' else s[::-1]
+	big = (endianess == 'big')
+	packer = intStructs.get((length, big))
+	if packer:
+		return packer.pack(n)
+
+	out = bytearray(length)
+	for i in range(0, length):
+		out[i] = (n >> (8 * i)) & 0xff
+
+	if big:
+		out.reverse()
+
+	return bytes(out)
 
 # listOverlay
 #
@@ -94,27 +160,473 @@ def listOverlay(listBase, listAdd, offset):
 
 	return listBase
 
+# lrc
+#
+# @buf, bytearray (or anything indexable which yields ints)
+# @end, number of leading bytes to sum, defaults to the whole buffer
+# @ret, integer xor sum
+def lrc(buf, end=None):
+	if end is None:
+		end = len(buf)
+
+	out = 0
+	for i in range(0, end):
+		out ^= buf[i]
+
+	return out
+
 # lrcsum
 #
 # @dataIn, list of ints (Less than 255)
 # @ret, sum output
 def lrcsum(dataIn):
-	lrc = 0
+	if not isinstance(dataIn, bytearray):
+		dataIn = bytearray(b"".join(dataIn))
+
+	return to_bytes(lrc(dataIn), 1, 1)
+
+# aumhFrame
+#
+#  A single message on its way to the device.  The header fields live as
+# attributes until finishMessage() packs them into the first headerStruct.size
+# bytes of buf, the payload is written in place behind the header.  Only the
+# first size bytes of buf are part of the frame.
+class aumhFrame(object):
+	__slots__ = ("buf", "size", "cmd", "scmd", "version", "outLen", "inLen", "frag")
+
+	def __init__(self, cmd, version, reserve=0):
+		self.buf = bytearray(headerStruct.size + reserve)
+		self.size = headerStruct.size
+		self.cmd = cmd
+		self.scmd = 0
+		self.version = version
+		self.outLen = 0
+		self.inLen = 0
+		self.frag = 0
+
+	def __len__(self):
+		return self.size
+
+	# extend
+	#
+	# @count, number of payload bytes to add
+	# @ret, offset of the first new byte inside buf
+	def extend(self, count):
+		offset = self.size
+		self.size += count
+		if self.size > len(self.buf):
+			self.buf.extend(bytearray(self.size - len(self.buf)))
+
+		return offset
+
+	# pack
+	#
+	# @packer, precompiled struct.Struct
+	# @values, values for the struct
+	#
+	# Packs values straight into the tail of the frame.
+	def pack(self, packer, *values):
+		packer.pack_into(self.buf, self.extend(packer.size), *values)
+
+	# write
+	#
+	# @data, bytes-like object appended to the payload
+	def write(self, data):
+		offset = self.extend(len(data))
+		self.buf[offset:self.size] = data
+
+	# view
+	#
+	# @ret, memoryview over the used portion of the frame (No copy is made.)
+	def view(self):
+		return memoryview(self.buf)[:self.size]
+
+	# tobytes
+	#
+	# @ret, the frame as a byte string
+	def tobytes(self):
+		return self.view().tobytes()
+
+# frameView
+#
+# @buf, aumhFrame or an already encoded bytes/bytearray frame
+# @ret, memoryview over the frame data
+def frameView(buf):
+	if isinstance(buf, aumhFrame):
+		return buf.view()
+
+	return memoryview(buf)
+
+# frameLane
+#
+# @view, memoryview of an encoded frame
+# @ret, scheduler lane for the frame
+#
+#  Digital commands are interactive, neopixel frames go in the frame lane and
+# config, manage and neopixel get requests are background work.
+def frameLane(view):
+	cmd = uint8Struct.unpack_from(view, headerOffsets["cmd_0"])[0]
+	scmd = uint8Struct.unpack_from(view, headerOffsets["scmd"])[0]
+
+	if cmd == 0x00 or scmd == 0xfd:
+		return LANE_BACKGROUND
 
-	for b in dataIn:
-		lrc ^= struct.unpack('B', str(b))[0]
+	if cmd == 0x01:
+		return LANE_INTERACTIVE
 
-	return to_bytes(lrc, 1, 1)
+	if scmd in (0x03, 0x04): #neopixel get/get_all
+		return LANE_BACKGROUND
+
+	return LANE_FRAME
+
+# framePipelinable
+#
+# @view, memoryview of an encoded frame
+# @ret, True if the frame is answered with a bare ACK/NAK and can be written
+#  ahead of the replies to earlier frames.
+def framePipelinable(view):
+	if len(view) > arduino_fifo_size:
+		return False
+
+	if uint8Struct.unpack_from(view, headerOffsets["msg_frag"])[0]:
+		return False
+
+	if frameLane(view) == LANE_BACKGROUND:
+		return False
+
+	cmd = uint8Struct.unpack_from(view, headerOffsets["cmd_0"])[0]
+	scmd = uint8Struct.unpack_from(view, headerOffsets["scmd"])[0]
+
+	return not (cmd == 0x01 and scmd == 0x00) #digital get carries data back
+
+# aumhFuture
+#
+#  Result of a submitted message.  result() blocks until the transport has
+# the reply, the value is whatever sendMessage() would have returned.
+class aumhFuture(object):
+	def __init__(self):
+		self.event = threading.Event()
+		self.lock = threading.Lock()
+		self.value = None
+		self.callbacks = []
+
+	def done(self):
+		return self.event.is_set()
+
+	# result
+	#
+	# @timeout, seconds to wait, None waits forever
+	# @ret, the sendMessage style result, or None if it timed out.
+	def result(self, timeout=None):
+		self.event.wait(timeout)
+		return self.value
+
+	def set_result(self, value):
+		with self.lock:
+			self.value = value
+			self.event.set()
+			callbacks, self.callbacks = self.callbacks, []
+
+		for fn in callbacks:
+			fn(self)
+
+	# add_done_callback
+	#
+	# @fn, called with the future once it completes (Immediately if it has.)
+	def add_done_callback(self, fn):
+		with self.lock:
+			if not self.event.is_set():
+				self.callbacks.append(fn)
+				return
+
+		fn(self)
+
+	# resolved
+	#
+	# @value, sendMessage style result
+	# @ret, a future which has already completed with value.
+	@staticmethod
+	def resolved(value):
+		future = aumhFuture()
+		future.set_result(value)
+		return future
+
+	# combine
+	#
+	# @futures, list of aumhFuture
+	# @ret, a future which completes once all of them have, with the first
+	#  non-zero result (Or 0, straight away for no futures.)
+	@staticmethod
+	def combine(futures):
+		if not futures:
+			return aumhFuture.resolved(0)
+
+		if len(futures) == 1:
+			return futures[0]
+
+		out = aumhFuture()
+		remaining = [ len(futures) ]
+
+		def finished(future):
+			with out.lock:
+				remaining[0] -= 1
+				last = (remaining[0] == 0)
+
+			if last:
+				results = [ f.value for f in futures if f.value ]
+				out.set_result(results[0] if results else 0)
+
+		for future in futures:
+			future.add_done_callback(finished)
+
+		return out
+
+# aumhBatch
+#
+#  Context manager returned by aumh.batch().  Messages submitted on this
+# thread while it's active are held back and handed to the transport
+# together when the block exits, which then waits for all of them.
+class aumhBatch(object):
+	def __init__(self, device):
+		self.device = device
+		self.items = []
+		self.futures = []
+		self.previous = None
+
+	def add(self, view, lane):
+		future = aumhFuture()
+		self.items.append((view, lane, future))
+		self.futures.append(future)
+		return future
+
+	def __enter__(self):
+		self.previous = getattr(self.device.batchLocal, "batch", None)
+		self.device.batchLocal.batch = self
+		return self
+
+	def __exit__(self, excType, excValue, tb):
+		self.device.batchLocal.batch = self.previous
+		self.device.enqueue(self.items)
+		self.items = []
+
+		if excType is None:
+			self.wait()
+
+		return False
+
+	# wait
+	#
+	# @timeout, seconds to wait for each future
+	# @ret, list of results in submission order
+	def wait(self, timeout=None):
+		return [ future.result(timeout) for future in self.futures ]
+
+# aumhReader
+#
+#  Blocking, select() driven reader for device responses.  Bytes are pulled
+# off the port as soon as they arrive and kept in buf, the parse methods then
+# consume whole responses from the front of it:
+#
+#  fragment replies, a single CT\r\n or FF\r\n line.
+#  final replies, optional payload bytes terminated by ACK\r\n or NAK\r\n.
+#
+#  Anything left over after a complete response stays in buf for the next
+# call.  Ports without a usable fileno() fall back to a blocking read(1).
+# The parse* methods only look at buf, so an event loop can feed buf itself.
+class aumhReader(object):
+	def __init__(self, ser, metrics=None):
+		self.ser = ser
+		self.buf = bytearray()
+		self.metrics = metrics
+		self.firstByteAt = None #When buf last went from empty to not.
+
+		try:
+			self.fd = ser.fileno()
+		except:
+			self.fd = None
+
+	# wait
+	#
+	# @timeout, maximum seconds to block
+	# @ret, number of bytes added to buf
+	def wait(self, timeout):
+		if timeout <= 0:
+			return self.drain()
+
+		if self.fd is not None:
+			readable = select.select([ self.fd ], [], [], timeout)[0]
+			if not readable:
+				return 0
+
+			return self.drain()
+
+		#No fd to select on, let the port's own timeout do the blocking.
+		lastTimeout = self.ser.timeout
+		self.ser.timeout = timeout
+		try:
+			first = self.ser.read(1)
+		finally:
+			self.ser.timeout = lastTimeout
+
+		if first and not self.buf:
+			self.firstByteAt = time.time()
+
+		self.buf.extend(first)
+		return len(first) + self.drain()
+
+	# drain
+	#
+	# @ret, number of bytes moved from the port into buf without blocking
+	def drain(self):
+		pending = self.ser.inWaiting()
+		if not pending:
+			return 0
+
+		data = self.ser.read(pending)
+		if data and not self.buf:
+			self.firstByteAt = time.time()
+
+		self.buf.extend(data)
+		if self.metrics:
+			self.metrics.add("bytesReceived", len(data))
+
+		return len(data)
+
+	# discard
+	#
+	# Drops anything buffered, used after a timeout so stale bytes don't
+	# leak into the next response.
+	def discard(self):
+		del self.buf[:]
+
+	# fragmentReply
+	#
+	# @timeout, seconds to wait for the reply line
+	# @ret, g_uart_frag_ok, g_uart_frag_bad, "" for an unrecognised line or
+	#  None on timeout.
+	def fragmentReply(self, timeout):
+		deadline = time.time() + timeout
+
+		while True:
+			reply = self.parseFragmentReply()
+			if reply is not None:
+				return reply
+
+			if not self.wait(deadline - time.time()) and time.time() >= deadline:
+				self.timedOut()
+				return None
+
+	# parseFragmentReply
+	#
+	# @ret, same as fragmentReply, but None just means no complete line is
+	#  buffered yet.  Never touches the port.
+	def parseFragmentReply(self):
+		end = self.buf.find(b"\n")
+		if end < 0:
+			return None
+
+		line = bytes(self.buf[:end + 1])
+		del self.buf[:end + 1]
+
+		if line.startswith(g_uart_frag_ok):
+			return g_uart_frag_ok
+
+		if line.startswith(g_uart_frag_bad):
+			return g_uart_frag_bad
+
+		return ""
+
+	# nextStatus
+	#
+	# @timeout, seconds to wait
+	# @ret, r_ack, r_nak or None on timeout
+	#
+	#  Consumes up to and including the first ACK/NAK in the buffer.  Used for
+	# pipelined frames where several replies may already be queued up.
+	def nextStatus(self, timeout):
+		deadline = time.time() + timeout
+
+		while True:
+			hits = [ (self.buf.find(status), status) for status in (r_ack, r_nak) ]
+			hits = [ hit for hit in hits if hit[0] >= 0 ]
+			if hits:
+				idx, status = min(hits)
+				del self.buf[:idx + len(status)]
+				self.received(status)
+				return status
+
+			if not self.wait(deadline - time.time()) and time.time() >= deadline:
+				self.timedOut()
+				return None
+
+	# response
+	#
+	# @timeout, seconds to wait for the whole response
+	# @ret, (status, raw) where status is r_ack, r_nak or None on timeout and
+	#  raw is every byte of the response including the terminator.
+	def response(self, timeout):
+		deadline = time.time() + timeout
+
+		while True:
+			self.drain()
+
+			out = self.parseResponse()
+			if out:
+				return out
+
+			if not self.wait(deadline - time.time()) and time.time() >= deadline:
+				self.timedOut()
+				return (None, bytes(self.buf))
+
+	# parseResponse
+	#
+	# @ret, (status, raw) as response() if a complete response is buffered,
+	#  otherwise None.  Never touches the port.
+	def parseResponse(self):
+		if self.buf.startswith(r_nak):
+			self.discard()
+			self.received(r_nak)
+			return (r_nak, r_nak)
+
+		for status in (r_ack, r_nak):
+			if self.buf.endswith(status):
+				raw = bytes(self.buf)
+				self.discard()
+				self.received(status)
+				return (status, raw)
+
+		return None
+
+	# received
+	#
+	# @status, r_ack or r_nak that ended a response
+	def received(self, status):
+		if self.metrics:
+			self.metrics.add("responses")
+			if status == r_nak:
+				self.metrics.add("naks")
+
+	def timedOut(self):
+		if self.metrics:
+			self.metrics.add("timeouts")
 
 # This is the UART_MH class.  Only one class instance per serial device unless
 # you want to see resource conflicts.
 class aumh:
-	def __init__(self, serialInterface=None, lbaud=None, logmethod=None, logfile=None):
+	def __init__(self, serialInterface=None, lbaud=None, logmethod=None, logfile=None, bootTimeout=reset_boot_timeout, fragWindow=1):
 
 		self.logmethod = logmethod
 		if logfile:
 			self.logConfigure(logfile)
 
+		#  Most fragment chunks in flight, only firmware which resyncs after a
+		# FF can take more than 1 (See arduino_frag_resync_sec.)
+		self.fragWindow = max(1, min(frag_window_max, fragWindow))
+
+		#  Seconds serialReset waits for the firmware to answer, 0 leaves the
+		# first contact to the caller (A cached device verified straight away.)
+		self.bootTimeout = bootTimeout
+
 		self.running = False
 		if serialInterface:
 			self.serName = serialInterface
@@ -163,23 +675,68 @@ class aumh:
 			sys.exit(1)
 
 		self.serialSema = multiprocessing.Semaphore()
+		#Counters and latency histograms, see aumhMetrics.
+		self.metrics = aumhMetrics()
+		#Per-stage timing callbacks, see addStageHook().
+		self.stageHooks = []
+		#Everything in this process goes through the scheduler, which also holds serialSema.
+		self.scheduler = aumhScheduler(self.serialSema, metrics=self.metrics)
 		#Here we define a bunch of class variables
 		self.serialBaud = BAUD #This is the baud rate utilized by the device, we should probably define this higher for easy access.
 
-		self.key_start = '\xaa'
-		self.key_end = '\xfb'
+		self.key_start = key_start
+		self.key_end = key_end
 		self.body_end = '\xdead' #We don't need this at the moment.
 		self.uart_frag_ok = "CT"
 		self.uart_frag_bad = "FF"
 
 		self.ser = None
+		self.reader = None
+
+		#  Reset/reconnect counters.  openFailures counts individual failed port
+		# opens, downtime is the total seconds spent inside serialReset.
+		self.resetStats = {
+			"resets":0,
+			"reconnects":0,
+			"openFailures":0,
+			"failures":0,
+			"downtime":0.0,
+			"lastReset":None,
+		}
+
+		#  Transmit debug counters.  'writes' counts calls into the serial
+		# write path (One per frame or fragment), lastFrameWrites is the count
+		# for the most recent frame.
+		self.txStats = {
+			"frames":0,
+			"writes":0,
+			"bytes":0,
+			"lastFrameWrites":0,
+			"fragments":0,
+			"fragRetransmits":0,
+		}
+
+		#  Fragment window in use, it grows by one after a window's worth of CT
+		# replies and halves on FF, up to fragWindow.  See sendFragments().
+		self.fragState = {
+			"window":1,
+			"streak":0,
+		}
+
+		#Pipelined submission state, see submitMessage().
+		self.batchLocal = threading.local()
+		self.submitCond = threading.Condition(threading.Lock())
+		self.submitQueue = collections.deque()
+		self.submitThread = None
 
 		self.mhcommands = {
-			"mhconfig":b'\x00\x00', #This isn't used, but  it will be.
-			"digital":b'\x01\x00',
-			"neopixel":b'\x02\x00',
+			"mhconfig":0x0000, #This isn't used, but  it will be.
+			"digital":0x0001, #cmd_0 is the low byte.
+			"neopixel":0x0002,
 		}
 
+		self.metrics.commandNames.update((value, name) for name, value in self.mhcommands.items())
+
 		self.versions = [ 0x00 ] #This variable must be adjusted to accomodate
 								# other compatible firmware versions.
 
@@ -210,8 +767,49 @@ class aumh:
 
 	#  This method performs a hard open/close of the serial device for 
 	# situations where calling open() just wasn't enough.
+	#
+	#  If the port can't be opened it is retried with capped exponential
+	# backoff (With jitter so several devices don't retry in lockstep.)  Once
+	# it's open we wait for the firmware to answer rather than for a fixed
+	# amount of time.  Counts and downtime end up in self.resetStats.
 	def serialReset(self):
-		time.sleep(5)
+		tStart = time.time()
+		self.resetStats["resets"] += 1
+		self.metrics.add("resets")
+
+		for attempt in range(0, reset_attempts):
+			if attempt:
+				delay = min(reset_backoff_max, reset_backoff_base * (2 ** (attempt - 1)))
+				time.sleep(random.uniform(delay / 2.0, delay))
+
+			ret = self.serialOpen()
+			if not ret:
+				break
+
+			self.resetStats["openFailures"] += 1
+		else:
+			self.resetStats["failures"] += 1
+			self.resetStats["downtime"] += time.time() - tStart
+			self.metrics.add("resetFailures")
+			return ret
+
+		self.resetStats["reconnects"] += 1
+		self.metrics.add("reconnects")
+
+		if self.bootTimeout and self.waitForBoot(self.bootTimeout):
+			self.log("UART_MH.serialReset() no response from firmware after reopening the port.","warn")
+
+		self.resetStats["downtime"] += time.time() - tStart
+		self.resetStats["lastReset"] = time.time()
+
+		return 0
+
+	# serialOpen
+	#
+	# @ret, 0 on success, negative on failure
+	#
+	# Closes the current serial instance (If any) and opens a fresh one.
+	def serialOpen(self):
 		if not isinstance(self.ser, serial.Serial):
 			try:
 				self.ser = serial.Serial(str(self.serName), self.serialBaud, timeout=5)
@@ -242,58 +840,242 @@ class aumh:
 			self.log("UART_MH.serialReset() unable to call serial.isOpen().","err")
 			return -3
 
+		self.reader = aumhReader(self.ser, self.metrics)
+
 		return 0
 
+	# waitForBoot
+	#
+	# @timeout, seconds to keep probing
+	# @ret, 0 once the firmware answered, 1 on timeout
+	#
+	#  Repeatedly sends a config manage request until a complete response
+	# comes back.  Anything the bootloader prints in the meantime is dropped.
+	def waitForBoot(self, timeout):
+		probe = self.assembleHeader("mhconfig")
+		probe.scmd = 0xff #aumhConfig manage
+		probe.outLen = 1
+		self.finishMessage(probe)
+		probe.pack(uint8Struct, 0)
+
+		deadline = time.time() + timeout
+
+		while time.time() < deadline:
+			try:
+				self.reader.drain()
+				self.reader.discard()
+				self.serialWrite(probe.view())
+				status = self.reader.response(min(reset_probe_interval, deadline - time.time()))[0]
+			except:
+				return 1
+
+			if status == r_ack:
+				return 0
+
+		self.reader.discard()
+		return 1
+
+
+	# addStageHook
+	#
+	# @hook, callable(stage, seconds, frame) where stage is one of stageNames
+	#  and frame is the aumhFrame/view concerned (Or None.)
+	#
+	#  Hooks can be added and removed at any time, with none installed the
+	# send path only pays for a few time.time() calls.  aumhStageRecorder is a
+	# ready made sampling hook.
+	def addStageHook(self, hook):
+		self.stageHooks = self.stageHooks + [ hook ] #Copied so senders can iterate without a lock.
+
+	def removeStageHook(self, hook):
+		self.stageHooks = [ entry for entry in self.stageHooks if entry != hook ] #Bound methods are equal, not identical.
+
+	# stageDone
+	#
+	# @stage, stage name
+	# @tStart, time.time() the stage started at
+	# @frame, frame the stage belongs to
+	# @tEnd, time.time() the stage ended at, now if omitted
+	def stageDone(self, stage, tStart, frame=None, tEnd=None):
+		hooks = self.stageHooks
+		if not hooks:
+			return
+
+		elapsed = (tEnd or time.time()) - tStart
+		for hook in hooks:
+			try:
+				hook(stage, elapsed, frame)
+			except:
+				self.log("UART_MH.stageDone(), stage hook failed.","warn")
+
+	# responseStages
+	#
+	# @frame, frame which was answered
+	# @tWritten, time.time() the last byte was written
+	#
+	#  Splits the wait for a response into firstByte (Until its first byte was
+	# buffered) and drain (The rest of it.)
+	def responseStages(self, frame, tWritten):
+		if not self.stageHooks:
+			return
+
+		tEnd = time.time()
+		first = self.reader.firstByteAt
+		if first is None or first < tWritten or first > tEnd: #Arrived with a fragment reply.
+			first = tWritten
+
+		self.stageDone("firstByte", tWritten, frame, first)
+		self.stageDone("drain", first, frame, tEnd)
+
+	# serialWrite
+	#
+	# @parts, one or more bytes-like objects making up one frame or fragment
+	#
+	#  Writes everything with a single call.  When a frame is split over
+	# several buffers they're gathered with os.writev where the platform has
+	# it, otherwise they're joined first.
+	def serialWrite(self, *parts):
+		if len(parts) == 1:
+			data = parts[0]
+			self.ser.write(data)
+
+		elif hasattr(os, "writev") and hasattr(self.ser, "fileno"):
+			data = b"".join([ memoryview(p).tobytes() for p in parts ]) #Only used if writev comes up short.
+			written = os.writev(self.ser.fileno(), parts)
+			if written < len(data):
+				self.ser.write(data[written:])
+				self.txStats["writes"] += 1
+				self.txStats["lastFrameWrites"] += 1
+
+		else:
+			data = b"".join([ memoryview(p).tobytes() for p in parts ])
+			self.ser.write(data)
+
+		self.txStats["writes"] += 1
+		self.txStats["lastFrameWrites"] += 1
+		self.txStats["bytes"] += len(data)
+		self.metrics.add("bytesSent", len(data))
+
+	# sendFragments
+	#
+	# @buf, memoryview of a frame with msg_frag set
+	# @ret, 0 on success, 20 if a chunk timed out, 11 if a write failed
+	#
+	#  Writes chunks up to the fragment window ahead of their replies, which
+	# come back in order.  A FF (Or a line we didn't understand) is for the
+	# oldest chunk in flight; with a window of 1 it's resent straight away,
+	# otherwise the firmware's resync is waited out and sending goes back to
+	# it.  Every chunk gets arduino_frag_wait_sec to be accepted.
+	def sendFragments(self, buf):
+		chunks = [ buf[ x:(x+arduino_frag_size) ] for x in xrange(0, len(buf), arduino_frag_size) ]
+		state = self.fragState
+		acked = 0 #The firmware is waiting for chunks[acked].
+		sent = 0
+		deadline = time.time() + arduino_frag_wait_sec
+
+		while acked < len(chunks):
+			while sent < len(chunks) and sent - acked < state["window"]:
+				try:
+					self.serialWrite(chunks[sent])
+				except:
+					self.log("UART_MH.sendMessage(), failed to write to serial interface with fragment.")
+					#  If we have a failure to write, it's unlikely that we'll get it on the second pass.
+					# Bail out now so that the controller doesn't need to deal with bullshit.
+					return 11
 
-	#This prepares the initial message based on the main command type
-	def assembleHeader(self,messageType):
-		outBuf = [
-			self.key_start,
-			b'\x00',	#This is the fragment set, this needs to be set in finishMessage
-			b'\x00',	#These are the two commands, they'll get set afterwards.
-			b'\x00',	#cmd 1
-			b'\x00',	#subcommand
-			to_bytes(self.version, 1, 1), #We always want to present the highest compat version.
-			b'\x00',	#out 0
-			b'\x00',	#out 1
-			b'\x00',	#in 0
-			b'\x00',	#in 1
-			b'\x00',	#sum, needs to be here as a dummy for the classes to populate via .append()
-			self.key_end,
-		]
+				sent += 1
+				self.txStats["fragments"] += 1
+				self.metrics.add("fragmentsSent")
 
-		listOverlay(outBuf, self.mhcommands[messageType], headerOffsets["cmd_0"]) #Shifted the offset over to accomodate the fragment
+			reply = self.reader.fragmentReply(max(deadline - time.time(), 0))
 
-		return outBuf
+			if reply == g_uart_frag_ok:
+				acked += 1
+				deadline = time.time() + arduino_frag_wait_sec
+
+				state["streak"] += 1
+				if state["streak"] >= state["window"]:
+					state["streak"] = 0
+					state["window"] = min(self.fragWindow, state["window"] + 1)
+
+				continue
+
+			if reply is None or time.time() > deadline:
+				self.log("UART_MH.sendMessage(), chunk send timed out, abandoning attempt.")
+				self.reader.discard()
+				return 20
+
+			self.txStats["fragRetransmits"] += 1
+			self.metrics.add("fragRetransmits")
+			state["streak"] = 0
+			state["window"] = max(1, state["window"] // 2)
+
+			if self.fragWindow > 1: #Anything written meanwhile is being dropped.
+				time.sleep(arduino_frag_resync_sec * 2)
+				self.reader.drain()
+				self.reader.discard()
+
+			sent = acked
+
+		return 0
+
+	# frameSent
+	#
+	# Bookkeeping once every byte of a frame is out the door.
+	def frameSent(self):
+		self.txStats["frames"] += 1
+		self.metrics.add("framesSent")
+		if DEBUG:
+			self.log("UART_MH, frame sent with %d write(s)." % self.txStats["lastFrameWrites"])
+
+	#This prepares the initial message based on the main command type
+	#
+	# @messageType, key into self.mhcommands
+	# @reserve, optional payload size hint so the buffer is allocated once
+	# @ret, aumhFrame
+	def assembleHeader(self, messageType, reserve=0):
+		return aumhFrame(self.mhcommands[messageType], self.version, reserve)
 
 
 	#Compute the lrcsum for the message
 	def finishMessage(self,curMsg):
-		if len(curMsg) > 63:
-			msgFrags = int(math.ceil((float(len(curMsg))/float(63))))
-			if (msgFrags <= 255): #If it's in our range, cool, we'll set it.
-				curMsg[headerOffsets["msg_frag"]] = to_bytes(msgFrags, 1)
-		
+		if curMsg.size > arduino_frag_size:
+			msgFrags = (curMsg.size + arduino_frag_size - 1) // arduino_frag_size
+			if (msgFrags > arduino_max_frags): #msg_frag can't describe it, the caller has to split the message.
+				self.log("UART_MH.finishMessage(), message needs %d fragments, limit is %d." % (msgFrags, arduino_max_frags), "err")
+				return 9
+
+			curMsg.frag = msgFrags
+
+		headerStruct.pack_into(curMsg.buf, 0,
+			self.key_start,
+			curMsg.frag,
+			curMsg.cmd & 0xff,
+			(curMsg.cmd >> 8) & 0xff,
+			curMsg.scmd,
+			curMsg.version,
+			curMsg.outLen,
+			curMsg.inLen,
+			0,	#sum, computed below
+			self.key_end
+		)
+
 		#Provided we don't move the sum to some strange place, this should be fine.
-		curMsg[headerOffsets["sum"]] = lrcsum(curMsg[:headerOffsets["sum"]])
+		curMsg.buf[headerOffsets["sum"]] = lrc(curMsg.buf, headerOffsets["sum"])
 
 		return curMsg
 
 	#wait for uart input to contain expected characters within timeout seconds
 	def UARTWaitIn(self, timeout, expected=5):
 		ltimeout = time.time() + timeout
-		if not isinstance(self.ser, serial.Serial):
+		if not self.reader:
 			self.log("UART_MH.UARTWaitIn(), serial instance does not exist.")
 			return -1
 
-		counter = 0
-
 		try:
-			while self.ser.inWaiting() < expected : #While we have no input data
-				if (counter % 1000) == 0:
-					if time.time() > ltimeout:
-						return 1
-				counter+=1
+			while len(self.reader.buf) < expected: #While we have no input data
+				if not self.reader.wait(ltimeout - time.time()) and time.time() >= ltimeout:
+					return 1
 		except:
 			self.log("UART_MH.UARTWaitIn(), failed to read serial interface.","err")
 			self.ser.flush()
@@ -304,113 +1086,99 @@ class aumh:
 
 
 	#This sends the message
-	def sendMessage(self,buf):
+	#
+	# @buf, aumhFrame (Or encoded frame bytes.)
+	# @lane, scheduler lane, picked from the frame's command when omitted.
+	def sendMessage(self,buf,lane=None):
 		t_000 = time.time()
 
 		if isinstance(buf, int):
 			self.log("UART_MH.sendMessage(), buffer incomplete.","warn")
 			return 1
-	
-		self.serialSema.acquire()
+
+		buf = frameView(buf)
+
+		if lane is None:
+			lane = frameLane(buf)
+
+		ret = self.sendFrame(buf, lane)
+		self.metrics.command(buf, time.time() - t_000, ret)
+
+		return ret
+
+	# sendFrame
+	#
+	# @buf, frame view
+	# @lane, scheduler lane
+	# @ret, see sendMessage
+	def sendFrame(self, buf, lane):
+		tLock = time.time()
+		self.scheduler.acquire(lane)
+		tWrite = time.time()
+		self.stageDone("lock", tLock, buf, tWrite)
 
 		try:
 			if isinstance(self.ser, serial.Serial):
 				if not self.ser.isOpen():
 					if self.serialReset():
 						self.log("UART_MH.sendMessage(), Serial reset failed.","err")
-						self.serialSema.release()
+						self.scheduler.release()
 						return 2
 			else:
 				if self.serialReset():
 					self.log("UART_MH.sendMessage(), serial create failed.","crit")
-					self.serialSema.release()
+					self.scheduler.release()
 					return 2
 
 		except:
 			self.log("UART_MH.sendMessage(), failed when polling serial interface.","err")
-			self.serialSema.release()
+			self.scheduler.release()
 			return 2
 
-		msgFrag = struct.unpack('B', str(buf[headerOffsets["msg_frag"]]))[0]
+		msgFrag = uint8Struct.unpack_from(buf, headerOffsets["msg_frag"])[0]
+		self.txStats["lastFrameWrites"] = 0
 
 		# If we are using fragmentation for this packet series.
 		if (int(msgFrag) > 0):
-			chunkTL = 0
-
-			#Split the buffer into msg_frag lists 64 elements in size
-			packetChunks = [ buf[ x:(x+arduino_frag_size) ] for x in xrange(0, len(buf), arduino_frag_size) ]
-	
-			for chunk in packetChunks:
-				chunkTL = time.time() + arduino_frag_wait_sec #2 seconds to complete each chunk.
-				chunkComplete = False
-
-				while not chunkComplete:
-					if time.time() > chunkTL:
-						self.log("UART_MH.sendMessage(), chunk send timed out, abandoning attempt.")
-						if (self.serialReset()): #Try to do a serial reset
-							self.log("UART_MH.sendMessage(), serial reset failed.")
-							return 21
-						self.serialSema.release()
-						return 20
-
-					for b in chunk:
-						try:
-							self.ser.write(b)
-						except:
-							self.log("UART_MH.sendMessage(), failed to write to serial interface with fragment.")
-							if (self.serialReset()): #Try to do a serial reset
-								self.log("UART_MH.sendMessage(), serial reset failed.")
-								return 21
-							self.serialSema.release()
-							#  If we have a failure to write, it's unlikely that we'll get it on the second pass.
-							# Bail out now so that the controller doesn't need to deal with bullshit.
-							return 11 
-
-					state = self.ser.readline()
-
-					if state.startswith(g_uart_frag_bad):
-						time.sleep(0.1)
-
-					elif state.startswith(g_uart_frag_ok):
-						chunkComplete = True
-
-						break #We probably don't need the stupid chunkComplete stuff.
+			ret = self.sendFragments(buf)
+			if ret:
+				if (self.serialReset()): #Try to do a serial reset
+					self.log("UART_MH.sendMessage(), serial reset failed.")
+					ret = 21
+
+				self.scheduler.release()
+				return ret
 
 		# If we are NOT using fragmentation...
 		else:
-			for b in buf:
-				try:
-					self.ser.write(b)
-				except:
-					self.log("UART_MH.sendMessage(), failed to write to serial interface")
-					self.serialSema.release()
-					return 10
+			try:
+				self.serialWrite(buf)
+			except:
+				self.log("UART_MH.sendMessage(), failed to write to serial interface")
+				self.scheduler.release()
+				return 10
 
-		if self.UARTWaitIn(5):
-			self.log("UART_MH.sendMessage(), input data timed out.")
-			self.serialSema.release()
-			return 4
-	
-		retd=""
+		self.frameSent()
+		tWritten = time.time()
+		self.stageDone("write", tWrite, buf, tWritten)
 
 		try:
-			#We can no longer simply perform a readline for this command.  We should read until no more data is in the buffer.
-			retd = self.ser.readline()
-
-			#time.sleep(0.01)
-			#If we still have data after performing the readline, continue reading lines.
-			while(self.ser.inWaiting()):
-				retd+=self.ser.readline()
-				time.sleep(0.05) #I really do not want this delay here, but I can't think of a better way
-				self.log("Read another line during message")
-
-
+			#Read until a complete ACK/NAK terminated response is in.
+			status, retd = self.reader.response(5)
+			self.responseStages(buf, tWritten)
 		except:
-			self.log("UART_MH.sendMessage(), failed to readline (Response data unknown).")
-			self.serialSema.release()
+			self.log("UART_MH.sendMessage(), failed to read response (Response data unknown).")
+			self.reader.discard()
+			self.scheduler.release()
 			return 5
 
-		self.serialSema.release()
+		if status is None:
+			self.log("UART_MH.sendMessage(), input data timed out.")
+			self.reader.discard()
+			self.scheduler.release()
+			return 4
+
+		self.scheduler.release()
 
 		if retd.startswith(r_ack):
 			return 0
@@ -421,86 +1189,221 @@ class aumh:
 
 		return 7
 
+	# submitMessage
+	#
+	# @buf, aumhFrame (Or encoded frame bytes.)
+	# @lane, scheduler lane, picked from the frame's command when omitted.
+	# @ret, aumhFuture for the sendMessage style result.
+	#
+	#  Non-blocking counterpart to sendMessage.  Inside a batch() block the
+	# message is held until the block exits.
+	def submitMessage(self, buf, lane=None):
+		if isinstance(buf, int):
+			return aumhFuture.resolved(1)
+
+		view = frameView(buf)
+		if lane is None:
+			lane = frameLane(view)
+
+		batch = getattr(self.batchLocal, "batch", None)
+		if batch:
+			return batch.add(view, lane)
+
+		future = aumhFuture()
+		self.enqueue([ (view, lane, future) ])
+		return future
+
+	# batch
+	#
+	# @ret, aumhBatch context manager
+	def batch(self):
+		return aumhBatch(self)
+
+	# enqueue
+	#
+	# @items, list of (view, lane, future) tuples
+	#
+	# Queues messages for the transport thread, starting it if needed.
+	def enqueue(self, items):
+		if not items:
+			return
+
+		with self.submitCond:
+			self.submitQueue.extend(items)
+
+			if not self.submitThread or not self.submitThread.is_alive():
+				self.submitThread = threading.Thread(target=self.submitWorker)
+				self.submitThread.daemon = True
+				self.submitThread.start()
+
+			self.submitCond.notify()
+
+	# submitWorker
+	#
+	#  Transport thread.  Takes runs of pipelinable frames which fit in the
+	# firmware fifo together (Up to max_in_flight) and sends them back to back,
+	# anything else goes through sendMessage on its own.
+	def submitWorker(self):
+		while True:
+			with self.submitCond:
+				while not self.submitQueue:
+					self.submitCond.wait()
+
+				group = [ self.submitQueue.popleft() ]
+
+				if framePipelinable(group[0][0]):
+					size = len(group[0][0])
+					while self.submitQueue and len(group) < max_in_flight:
+						view = self.submitQueue[0][0]
+						if not framePipelinable(view) or (size + len(view)) > arduino_fifo_size:
+							break
+
+						size += len(view)
+						group.append(self.submitQueue.popleft())
+
+			try:
+				if len(group) == 1:
+					results = [ self.sendMessage(group[0][0], group[0][1]) ]
+				else:
+					results = self.sendPipelined([ item[0] for item in group ], min(item[1] for item in group))
+			except:
+				self.log("UART_MH.submitWorker(), exception while sending.","err")
+				results = [ 5 ] * len(group)
+
+			for item, result in zip(group, results):
+				item[2].set_result(result)
+
+	# sendPipelined
+	#
+	# @views, list of pipelinable frame views
+	# @lane, scheduler lane for the whole group
+	# @ret, list of sendMessage style results, one per frame
+	def sendPipelined(self, views, lane):
+		t_000 = time.time()
+		self.scheduler.acquire(lane)
+		tWrite = time.time()
+		self.stageDone("lock", t_000, views[0], tWrite)
+
+		try:
+			if not isinstance(self.ser, serial.Serial) or not self.ser.isOpen():
+				if self.serialReset():
+					self.log("UART_MH.sendPipelined(), serial reset failed.","err")
+					return [ 2 ] * len(views)
+
+			written = 0
+			for view in views:
+				self.txStats["lastFrameWrites"] = 0
+				try:
+					self.serialWrite(view)
+				except:
+					self.log("UART_MH.sendPipelined(), failed to write to serial interface")
+					break
+
+				self.frameSent()
+				self.stageDone("write", tWrite, view)
+				tWrite = time.time()
+				written += 1
+
+			results = []
+			for i in range(0, written):
+				status = self.reader.nextStatus(5)
+
+				if status is None:
+					self.log("UART_MH.sendPipelined(), input data timed out.")
+					self.reader.discard()
+					results.extend([ 4 ] * (written - i))
+					break
+
+				results.append(0 if status == r_ack else 7)
+				self.metrics.command(views[i], time.time() - t_000, results[-1])
+
+			results.extend([ 10 ] * (len(views) - written))
+			return results
+		finally:
+			self.scheduler.release()
+
 	# Send a management message request to the firmware.
-	def sendManageMessage(self,buf):
+	def sendManageMessage(self,buf,lane=LANE_BACKGROUND):
+		t_000 = time.time()
+
 		if isinstance(buf, int):
 			self.log("UART_MH.sendManageMessage(), buffer incomplete.")
 			return 1
 
-		self.serialSema.acquire()
+		buf = frameView(buf)
+
+		ret = self.sendManageFrame(buf, lane)
+		self.metrics.command(buf, time.time() - t_000, ret)
+
+		return ret
+
+	# sendManageFrame
+	#
+	# @buf, frame view
+	# @lane, scheduler lane
+	# @ret, see sendManageMessage
+	def sendManageFrame(self, buf, lane):
+		tLock = time.time()
+		self.scheduler.acquire(lane)
+		tWrite = time.time()
+		self.stageDone("lock", tLock, buf, tWrite)
 
 		try:
 			if isinstance(self.ser, serial.Serial):
 				if not self.ser.isOpen():
 					if self.serialReset():
 						self.log("UART_MH.sendManageMessage(), serial reset failed.")
-						self.serialSema.release()
+						self.scheduler.release()
 						return 2
 			else:
 				if self.serialReset():
 					self.log("UART_MH.sendManageMessage(), serial create failed.")
-					self.serialSema.release()
+					self.scheduler.release()
 					return 2
 		except:
 			self.log("UART_MH.sendManageMessage(), failed when polling serial interface.")
-			self.serialSema.release()
+			self.scheduler.release()
 			return 2
 
-		for b in buf:
-			try:
-				self.ser.write(b)
-			except:
-				self.log("UART_MH.sendManageMessage(), failed to write to serial interface")
-				self.serialSema.release()
-				return 10
+		self.txStats["lastFrameWrites"] = 0
 
-		#Custom timing method
-		ltimeout = time.time() + 1
+		try:
+			self.serialWrite(buf)
+		except:
+			self.log("UART_MH.sendManageMessage(), failed to write to serial interface")
+			self.scheduler.release()
+			return 10
 
-		counter = 0
+		self.frameSent()
+		tWritten = time.time()
+		self.stageDone("write", tWrite, buf, tWritten)
 
 		try:
-			#When it opens break
-			while not self.ser.inWaiting():
-				if (counter % 1000) == 0:
-					if time.time() > ltimeout:
-						self.log("UART_MH.sendManageMessage(), timeout in first completion loop.")
-						self.serialSema.release()
-						return 1
-				counter+=1
+			if not self.reader.buf and not self.reader.wait(1):
+				self.log("UART_MH.sendManageMessage(), timeout waiting for first response.")
+				self.metrics.add("timeouts")
+				self.scheduler.release()
+				return 1
 		except:
 			self.log("UART_MH.sendManageMessage(), failed when waiting for first response.")
-			self.serialSema.release()
+			self.scheduler.release()
 			return 4
 
-		ltimeout = time.time() + 1
-		complete = False
-		counter = 0
-		oBuf = ""
-
-		while not complete:
-			if (counter % 1000) == 0:
-				if time.time() > ltimeout:
-					self.log("UART_MH.sendManageMessage(), timeout in second completion loop.")
-					self.serialSema.release()
-					return 5
-
-			try:
-				while self.ser.inWaiting() > 0:
-					oBuf+=self.ser.read(1)
-			except:
-				self.log("UART_MH.sendManageMessage(), failed when waiting for second response.")
-				self.serialSema.release()
-				return 6
-
-			#If we've got at least 5 characters we can start performing the checks....
-			if len(oBuf) >= 5:
-				if oBuf[-5:].startswith("ACK") or oBuf[:5].startswith("NAK"):
-					#We're good (Possibly)
-					break
-
-			counter+=1
+		try:
+			status, oBuf = self.reader.response(1)
+			self.responseStages(buf, tWritten)
+		except:
+			self.log("UART_MH.sendManageMessage(), failed when waiting for second response.")
+			self.reader.discard()
+			self.scheduler.release()
+			return 6
+
+		if status is None:
+			self.log("UART_MH.sendManageMessage(), timeout waiting for response completion.")
+			self.reader.discard()
+			self.scheduler.release()
+			return 5
 
-		self.serialSema.release()
+		self.scheduler.release()
 
 		return oBuf
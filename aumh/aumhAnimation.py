@@ -0,0 +1,447 @@
+###############################################################################
+#                              aumhAnimation.py                               #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the animation engine, it renders and commits strand frames at a    #
+#  target frame rate on a monotonic clock, dropping frames the link can't     #
+#  keep up with rather than queueing them.                                    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import sys
+import time
+import logging
+import threading
+import collections
+
+try:
+	import numpy as np
+except ImportError:
+	np = None #Frames are lists of [r, g, b].
+
+from aumh import *
+from aumhMetrics import aumhHistogram
+from aumhEffects import aumhEffectPlayer
+
+# Defaults
+animation_fps = 30
+animation_stats_window = 2.0 #Seconds of acknowledged frames the achieved rate is taken over.
+animation_stop_timeout = 2.0
+
+# monotonicClock
+#
+# @ret, a function returning seconds from a clock which never steps backwards
+#  time.monotonic where there is one, CLOCK_MONOTONIC through ctypes on linux
+#  and time.time otherwise.
+def monotonicClock():
+	if hasattr(time, "monotonic"):
+		return time.monotonic
+
+	if sys.platform.startswith("linux"):
+		try:
+			import ctypes
+			import ctypes.util
+
+			class timespec(ctypes.Structure):
+				_fields_ = [ ("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long) ]
+
+			libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+			clock_gettime = libc.clock_gettime
+			clock_gettime.argtypes = [ ctypes.c_int, ctypes.POINTER(timespec) ]
+
+			ts = timespec()
+			if clock_gettime(1, ctypes.byref(ts)): #CLOCK_MONOTONIC
+				raise OSError(ctypes.get_errno())
+
+			def monotonic():
+				clock_gettime(1, ctypes.byref(ts))
+				return ts.tv_sec + ts.tv_nsec * 1e-9
+
+			return monotonic
+		except (ImportError, OSError, AttributeError):
+			pass
+
+	return time.time
+
+monotonic = monotonicClock()
+
+# blankFrame
+#
+# @length, pixels
+# @ret, an all black frame, N x 3 uint8 array (List of [r, g, b] without numpy.)
+def blankFrame(length):
+	if np is not None:
+		return np.zeros((length, 3), dtype=np.uint8)
+
+	return [ [ 0, 0, 0 ] for i in range(0, length) ]
+
+# AnimationStrand
+#
+#  Per strand animation state.  Frames are double buffered, the render
+# function fills back while front is what was last committed; a new frame
+# in back is 'ready' until a tick hands it to np_commit and the buffers swap.
+# A ready frame which is replaced before it was sent is dropped.
+#
+#  Strands playing an aumhEffect have no buffers, each tick plays the
+# effect's frame for that moment through the animator's aumhEffectPlayer.
+class AnimationStrand:
+	def __init__(self, id, length, render=None, effect=None):
+		self.id = id
+		self.length = length
+		self.render = render
+		self.effect = effect
+		self.started = monotonic()
+
+		self.front = blankFrame(length)
+		self.back = blankFrame(length)
+		self.ready = False
+		self.readyTime = None
+		self.inFlight = None #aumhFuture of the frame being committed.
+
+		self.lock = threading.Lock() #Frames
+		self.statsLock = threading.Lock()
+		self.rendered = 0
+		self.sent = 0
+		self.acked = 0
+		self.dropped = 0
+		self.failed = 0
+		self.latency = aumhHistogram()
+		self.lastLatency = None
+		self.ackTimes = collections.deque()
+
+	# fill
+	#
+	# @frame, N x 3 array or list of [r, g, b], copied into back (Pixels past
+	#  the strand are ignored, missing ones keep their color.)
+	def fill(self, frame):
+		if frame is self.back:
+			return
+
+		if np is not None:
+			frame = np.asarray(frame, dtype=np.uint8).reshape(-1, 3)[:self.length]
+			self.back[:len(frame)] = frame
+			return
+
+		for i, color in enumerate(frame[:self.length]):
+			self.back[i] = [ int(color[0]) & 0xff, int(color[1]) & 0xff, int(color[2]) & 0xff ]
+
+	# present
+	#
+	# @frame, next frame
+	# @now, monotonic time it was ready
+	def present(self, frame, now):
+		self.fill(frame)
+
+		with self.statsLock:
+			self.rendered += 1
+			if self.ready:
+				self.dropped += 1 #Never sent, the link was still busy.
+
+		self.ready = True
+		self.readyTime = now
+
+	# acknowledged
+	#
+	# @ret, sendMessage style result of the commit
+	# @readyTime, when the committed frame was ready
+	def acknowledged(self, ret, readyTime):
+		now = monotonic()
+
+		with self.statsLock:
+			if ret:
+				self.failed += 1
+				return
+
+			self.acked += 1
+			self.lastLatency = now - readyTime
+			self.latency.observe(self.lastLatency)
+
+			self.ackTimes.append(now)
+			while self.ackTimes and self.ackTimes[0] < now - animation_stats_window:
+				self.ackTimes.popleft()
+
+	# stats
+	#
+	# @ret, dict of frame counters, achieved fps and the latency (Seconds from
+	#  a frame being ready to the strand acknowledging it) summary.
+	def stats(self):
+		with self.statsLock:
+			times = list(self.ackTimes)
+			out = {
+				"rendered":self.rendered,
+				"sent":self.sent,
+				"acked":self.acked,
+				"dropped":self.dropped,
+				"failed":self.failed,
+				"lastLatency":self.lastLatency,
+				"latency":self.latency.snapshot(),
+			}
+
+		fps = 0.0
+		if len(times) > 1 and monotonic() - times[-1] < animation_stats_window:
+			fps = (len(times) - 1) / (times[-1] - times[0])
+
+		out["fps"] = fps
+
+		return out
+
+# aumhAnimator
+#
+#  Drives any number of strands of one aumhNeopixel instance at a target
+# frame rate.  Each strand either has a render function, called every tick
+# as render(seconds, frame) with the seconds since it was added and its back
+# buffer (It returns the frame to show, usually that buffer filled in, or
+# None to keep the current one), plays an effect (addEffect(), one effect
+# frame a tick) or gets frames pushed with submit().
+#
+#  Ticks come off a monotonic clock, one every 1/fps seconds.  A ready frame
+# is committed (np_commit, so only changed pixels are sent) once the
+# strand's previous commit has been acknowledged, when the link is slower
+# than the frame rate the frames in between are dropped and the strand shows
+# the newest one as soon as it can.  Ticks the engine itself falls behind on
+# are skipped rather than run in a burst.
+#
+#  animator = aumhAnimator(neopixel, fps=30)
+#  animator.add(0, render)
+#  animator.start()
+#  ...
+#  animator.stats(0)
+#  animator.stop()
+class aumhAnimator:
+	def __init__(self, neopixel, fps=animation_fps, logmethod=None, logfile=None):
+		self.logmethod = logmethod
+		if logfile:
+			self.logConfigure(logfile)
+
+		self.neopixel = neopixel
+		self.fps = fps
+		self.period = 1.0 / fps
+
+		self.lock = threading.Lock()
+		self.strands = {} #id:AnimationStrand
+		self.player = aumhEffectPlayer(neopixel)
+		self.ticks = 0
+		self.skipped = 0
+
+		self.thread = None
+		self.stopEvent = threading.Event()
+
+	def logConfigure(self, logfile=None):
+		if self.logmethod == "logger":
+			if not logfile:
+				print("aumh.logConfigure() called as logger type without filename for log.")
+				sys.exit(1)
+
+			self.logger = logging.getLogger("aumh")
+			self.logger.setLevel(logging.INFO)
+			self.logformatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+			self.loghandler = logging.FileHandler(logfile)
+			self.loghandler.setFormatter(self.logformatter)
+			self.logger.addHandler(self.loghandler)
+
+	def log(self, data, mode=None):
+		if not self.logmethod or self.logmethod == "print":
+			print(data)
+		elif self.logmethod == "logger":
+			if mode == "err":
+				self.logger.error(data)
+			elif mode == "warn":
+				self.logger.warning(data)
+			elif mode == "crit":
+				self.logger.critical(data)
+			else: #Mode is info or something else.
+				self.logger.info(data)
+
+	# add
+	#
+	# @id, strand id (Known to the neopixel instance, added or managed.)
+	# @render, render(seconds, frame) function, None for submit() frames
+	# @ret, the strand's AnimationStrand, or None if the strand is unknown.
+	def add(self, id, render=None):
+		strand = self.neopixel.strand(id)
+		if strand is None or not strand.length:
+			self.log("aumhAnimator.add(), unknown strand %s." % str(id), "err")
+			return None
+
+		state = AnimationStrand(id, strand.length, render)
+		with self.lock:
+			self.strands[id] = state
+
+		return state
+
+	# addEffect
+	#
+	# @id, strand id
+	# @effect, aumhEffect for the strand's length
+	# @ret, the strand's AnimationStrand, or None if the strand is unknown.
+	#
+	#  Frame n of the effect is shown n ticks after it was added, frames the
+	# link is too busy for are skipped.  Once a cycle has been shown the
+	# player only replays its cached messages.
+	def addEffect(self, id, effect):
+		state = self.add(id)
+		if state is not None:
+			state.effect = effect
+
+		return state
+
+	# remove
+	#
+	# @id, strand id
+	def remove(self, id):
+		with self.lock:
+			self.strands.pop(id, None)
+
+	# submit
+	#
+	# @id, strand id
+	# @frame, N x 3 array or list of [r, g, b] (Copied, the caller keeps it.)
+	# @ret, 0, or 1 if the strand isn't animated.
+	#
+	#  The frame goes out on the next tick the link is free for, replacing
+	# any earlier one which hasn't been sent yet.
+	def submit(self, id, frame):
+		state = self.strands.get(id)
+		if state is None:
+			return 1
+
+		with state.lock:
+			state.present(frame, monotonic())
+
+		return 0
+
+	# tick
+	#
+	# @now, monotonic time of the tick
+	#
+	#  Renders every strand with a render function and commits the ready
+	# frames of strands whose last commit has been acknowledged.
+	def tick(self, now=None):
+		if now is None:
+			now = monotonic()
+
+		self.ticks += 1
+
+		with self.lock:
+			states = list(self.strands.values())
+
+		for state in states:
+			with state.lock:
+				busy = state.inFlight is not None and not state.inFlight.done()
+
+				if state.effect is not None:
+					with state.statsLock:
+						state.rendered += 1
+						if busy:
+							state.dropped += 1
+
+					if busy:
+						continue
+
+					readyTime = now
+					future = self.player.play(state.id, state.effect, int(round((now - state.started) * self.fps)), wait=False)
+
+				else:
+					if state.render is not None:
+						try:
+							frame = state.render(now - state.started, state.back)
+						except Exception as e:
+							self.log("aumhAnimator.tick(), strand %s render failed, %s" % (str(state.id), str(e)), "err")
+							frame = None
+
+						if frame is not None:
+							state.present(frame, now)
+
+					if not state.ready or busy:
+						continue
+
+					state.front, state.back = state.back, state.front
+					state.ready = False
+					readyTime = state.readyTime
+
+					future = self.neopixel.np_commit(state.id, state.front, wait=False)
+
+				state.inFlight = future
+
+			with state.statsLock:
+				state.sent += 1
+
+			future.add_done_callback(lambda done, state=state, readyTime=readyTime: state.acknowledged(done.value, readyTime))
+
+	# run
+	#
+	#  Tick loop, start() runs it in a thread until stop().
+	def run(self):
+		deadline = monotonic()
+
+		while not self.stopEvent.is_set():
+			now = monotonic()
+			if now < deadline:
+				time.sleep(min(deadline - now, self.period))
+				continue
+
+			behind = int((now - deadline) / self.period)
+			if behind: #Skip the ticks we missed, their frames would be stale.
+				self.skipped += behind
+				deadline += behind * self.period
+
+			self.tick(deadline)
+			deadline += self.period
+
+	def start(self):
+		if self.thread is not None and self.thread.is_alive():
+			return
+
+		self.stopEvent.clear()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop
+	#
+	# @timeout, seconds to wait for frames still in flight
+	def stop(self, timeout=animation_stop_timeout):
+		self.stopEvent.set()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+		with self.lock:
+			states = list(self.strands.values())
+
+		for state in states:
+			if state.inFlight is not None:
+				state.inFlight.result(timeout)
+
+	# stats
+	#
+	# @id, strand id, None for every strand
+	# @ret, the strand's AnimationStrand.stats() with the target fps, or a
+	#  dict of id:stats plus the engine's tick counts.
+	def stats(self, id=None):
+		if id is not None:
+			state = self.strands.get(id)
+			if state is None:
+				return None
+
+			out = state.stats()
+			out["target"] = self.fps
+			return out
+
+		with self.lock:
+			ids = list(self.strands)
+
+		return {
+			"fps":self.fps,
+			"ticks":self.ticks,
+			"skippedTicks":self.skipped,
+			"strands":dict((sid, self.stats(sid)) for sid in ids),
+		}
@@ -0,0 +1,366 @@
+###############################################################################
+#                                aumhAsync.py                                 #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the asyncio transport.  It speaks the same protocol as aumh, but    #
+#  the serial fd is read from the event loop so one loop can run any number   #
+#  of devices.                                                                #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import sys
+import time
+
+try:
+	import asyncio
+except ImportError:
+	try:
+		import trollius as asyncio #Python 2 backport.
+	except ImportError:
+		asyncio = None
+
+from aumh import *
+from aumh import aumh
+
+# aumhAsync
+#
+#  Drop-in aumh for event loops.  Messages are built with the usual codec,
+# the *Async methods return asyncio futures which resolve to whatever the
+# blocking call would have returned.  Every transaction queues for the
+# device's aumhScheduler with acquireAsync() and is started on the loop once
+# it's granted, so async and blocking callers (sendMessage, submitMessage's
+# worker, the animator) take turns on the port under the same lane deadlines
+# and burst fairness.  The loop only watches the serial fd while one of its
+# transactions owns the port, the rest of the time a blocking owner reads it.
+# Blocking calls must not be made on the loop's thread, one queued behind an
+# async transaction would wait for the loop forever.
+#
+#  Fragments go out stop-and-wait, as sendFragments() does with a fragWindow
+# of 1 (There's no window here.)  Each chunk has arduino_frag_wait_sec to be
+# accepted however many times it is resent.
+class aumhAsync(aumh):
+	def __init__(self, serialInterface=None, lbaud=None, logmethod=None, logfile=None, loop=None):
+		if asyncio is None:
+			print("aumhAsync requires asyncio (Or trollius on python 2).")
+			sys.exit(1)
+
+		self.loop = loop or asyncio.get_event_loop()
+		self.current = None
+		self.timer = None
+		self.reader = None
+		self.watching = None #fd the loop is reading for the current transaction.
+
+		aumh.__init__(self, serialInterface, lbaud, logmethod, logfile)
+
+	#  Opens the port.  There's no blocking boot wait here, see bootAsync().
+	# It's only called by whoever owns the port, so the loop isn't watching the
+	# fd it replaces.
+	def serialReset(self):
+		self.resetStats["resets"] += 1
+		self.metrics.add("resets")
+
+		ret = self.serialOpen()
+		if ret:
+			self.resetStats["failures"] += 1
+			self.metrics.add("resetFailures")
+			return ret
+
+		if self.reader.fd is None:
+			self.log("aumhAsync.serialReset(), serial interface has no fd to watch.","err")
+			return -4
+
+		self.resetStats["reconnects"] += 1
+		self.metrics.add("reconnects")
+		self.resetStats["lastReset"] = time.time()
+
+		return 0
+
+	# newFuture
+	#
+	# @ret, a future bound to our loop
+	def newFuture(self):
+		if hasattr(self.loop, "create_future"):
+			return self.loop.create_future()
+
+		return asyncio.Future(loop=self.loop)
+
+	# sendMessageAsync
+	#
+	# @buf, aumhFrame (Or encoded frame bytes.)
+	# @lane, scheduler lane, picked from the frame's command when omitted.
+	# @ret, future for the sendMessage style result.
+	def sendMessageAsync(self, buf, lane=None):
+		return self.queue(buf, lane, False)
+
+	# sendManageMessageAsync
+	#
+	# @buf, aumhFrame (Or encoded frame bytes.)
+	# @ret, future for the raw manage response (Or an error code.)
+	def sendManageMessageAsync(self, buf, lane=LANE_BACKGROUND):
+		return self.queue(buf, lane, True)
+
+	# bootAsync
+	#
+	# @timeout, seconds to keep probing
+	# @ret, future, 0 once the firmware answered a config manage probe, 1 on timeout
+	def bootAsync(self, timeout=reset_boot_timeout):
+		out = self.newFuture()
+		deadline = time.time() + timeout
+
+		probe = self.assembleHeader("mhconfig")
+		probe.scmd = 0xff #aumhConfig manage
+		probe.outLen = 1
+		self.finishMessage(probe)
+		probe.pack(uint8Struct, 0)
+
+		def answered(future):
+			if not future.cancelled() and not isinstance(future.result(), int) and future.result().endswith(r_ack):
+				out.set_result(0)
+			elif time.time() >= deadline:
+				out.set_result(1)
+			else:
+				self.queue(probe, LANE_BACKGROUND, True, reset_probe_interval).add_done_callback(answered)
+
+		self.queue(probe, LANE_BACKGROUND, True, reset_probe_interval).add_done_callback(answered)
+
+		return out
+
+	# asyncThen
+	#
+	# @future, source future
+	# @fn, called with the source result
+	# @ret, future for fn's return value
+	def asyncThen(self, future, fn):
+		out = self.newFuture()
+
+		def finished(source):
+			if source.cancelled():
+				out.cancel()
+				return
+
+			try:
+				out.set_result(fn(source.result()))
+			except Exception as e:
+				out.set_exception(e)
+
+		future.add_done_callback(finished)
+
+		return out
+
+	# asyncCombine
+	#
+	# @futures, list of futures
+	# @ret, future for the first non-zero result, or 0.
+	def asyncCombine(self, futures):
+		def first(results):
+			results = [ result for result in results if result ]
+			return results[0] if results else 0
+
+		return self.asyncThen(asyncio.gather(*futures), first)
+
+	# queue
+	#
+	# @buf, frame
+	# @lane, lane
+	# @manage, True for manage messages (Raw response is the result.)
+	# @timeout, response timeout override
+	# @ret, future
+	def queue(self, buf, lane, manage, timeout=None):
+		future = self.newFuture()
+
+		if isinstance(buf, int):
+			future.set_result(1)
+			return future
+
+		view = frameView(buf)
+		if lane is None:
+			lane = frameLane(view)
+
+		if timeout is None:
+			timeout = 1 if manage else 5
+
+		txn = {
+			"view":view,
+			"manage":manage,
+			"timeout":timeout,
+			"future":future,
+			"chunks":None,
+			"chunk":0,
+			"deadline":None,
+			"queued":time.time(),
+		}
+
+		self.scheduler.acquireAsync(lane, lambda: self.granted(txn))
+
+		return future
+
+	# granted
+	#
+	# @txn, transaction which now owns the port
+	#
+	#  Scheduler callback, run on whichever thread released the port.
+	def granted(self, txn):
+		try:
+			self.loop.call_soon_threadsafe(self.startTxn, txn)
+		except RuntimeError: #Loop closed, nobody will run it.
+			self.scheduler.release()
+
+	# startTxn
+	#
+	# @txn, granted transaction
+	#
+	# Starts a transaction on the loop's thread.
+	def startTxn(self, txn):
+		if txn["future"].cancelled():
+			self.scheduler.release()
+			return
+
+		if self.reader.fd is None:
+			self.scheduler.release()
+			txn["future"].set_result(2)
+			return
+
+		self.current = txn
+		self.watching = self.reader.fd
+		self.loop.add_reader(self.watching, self.onReadable)
+		self.txStats["lastFrameWrites"] = 0
+
+		if not txn["manage"] and uint8Struct.unpack_from(txn["view"], headerOffsets["msg_frag"])[0]:
+			view = txn["view"]
+			txn["chunks"] = [ view[ x:(x+arduino_frag_size) ] for x in xrange(0, len(view), arduino_frag_size) ]
+			txn["deadline"] = time.time() + arduino_frag_wait_sec
+			self.writeCurrent(txn["chunks"][0], arduino_frag_wait_sec)
+		else:
+			self.writeCurrent(txn["view"], txn["timeout"])
+
+	# writeCurrent
+	#
+	# @data, bytes to write for the current transaction
+	# @timeout, seconds until the transaction is failed
+	def writeCurrent(self, data, timeout):
+		try:
+			self.serialWrite(data)
+		except:
+			self.log("aumhAsync, failed to write to serial interface.","err")
+			self.finish(11 if self.current["chunks"] else 10)
+			return
+
+		txn = self.current
+		if txn["chunks"]:
+			self.txStats["fragments"] += 1
+			self.metrics.add("fragmentsSent")
+
+		if not txn["chunks"] or txn["chunk"] == len(txn["chunks"]) - 1:
+			self.frameSent()
+
+		self.armTimer(timeout)
+
+	def armTimer(self, timeout):
+		if self.timer:
+			self.timer.cancel()
+
+		self.timer = self.loop.call_later(timeout, self.onTimeout)
+
+	# onReadable
+	#
+	# Loop callback, moves whatever arrived into the reader and advances.
+	def onReadable(self):
+		try:
+			self.reader.drain()
+		except:
+			self.log("aumhAsync, failed to read serial interface.","err")
+			if self.current:
+				self.finish(5)
+			return
+
+		self.advance()
+
+	# advance
+	#
+	# Runs the current transaction's state machine over the buffered bytes.
+	def advance(self):
+		while self.current:
+			txn = self.current
+
+			if txn["chunks"] and txn["chunk"] < len(txn["chunks"]):
+				reply = self.reader.parseFragmentReply()
+				if reply is None:
+					return
+
+				if reply == g_uart_frag_ok:
+					txn["chunk"] += 1
+					if txn["chunk"] < len(txn["chunks"]):
+						txn["deadline"] = time.time() + arduino_frag_wait_sec
+						self.writeCurrent(txn["chunks"][txn["chunk"]], arduino_frag_wait_sec)
+					else:
+						self.armTimer(txn["timeout"])
+				else:
+					remaining = txn["deadline"] - time.time()
+					if remaining <= 0: #Keeps getting FF, give up as sendFragments() would.
+						self.log("aumhAsync, chunk send timed out, abandoning attempt.")
+						self.reader.discard()
+						self.metrics.add("timeouts")
+						self.finish(20)
+						continue
+
+					self.txStats["fragRetransmits"] += 1
+					self.metrics.add("fragRetransmits")
+					self.writeCurrent(txn["chunks"][txn["chunk"]], remaining)
+
+				continue
+
+			out = self.reader.parseResponse()
+			if out is None:
+				return
+
+			status, raw = out
+
+			if txn["manage"]:
+				self.finish(raw)
+			elif raw.startswith(r_ack):
+				self.finish(0)
+			elif r_ack in raw:
+				self.finish(raw)
+			else:
+				self.finish(7)
+
+	def onTimeout(self):
+		self.timer = None
+		if not self.current:
+			return
+
+		self.reader.discard()
+		self.metrics.add("timeouts")
+
+		if self.current["chunks"] and self.current["chunk"] < len(self.current["chunks"]):
+			self.log("aumhAsync, chunk send timed out, abandoning attempt.")
+			self.finish(20)
+		else:
+			self.finish(5 if self.current["manage"] else 4)
+
+	# finish
+	#
+	# @result, value for the current transaction's future
+	def finish(self, result):
+		if self.timer:
+			self.timer.cancel()
+			self.timer = None
+
+		if self.watching is not None:
+			self.loop.remove_reader(self.watching)
+			self.watching = None
+
+		txn, self.current = self.current, None
+		self.metrics.command(txn["view"], time.time() - txn["queued"], result)
+		self.scheduler.release()
+
+		if not txn["future"].done():
+			txn["future"].set_result(result)
@@ -0,0 +1,122 @@
+###############################################################################
+#                                aumhCache.py                                 #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the persistent identity/topology cache, what was last seen on each  #
+#  port (Identity, strips and pins) kept in a JSON file across restarts.      #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import copy
+import json
+import time
+import threading
+
+# Defaults
+cache_path = os.path.expanduser("~/.aumh/topology.json")
+cache_version = 1 #Files with any other version are ignored.
+
+# Entry keys which are written to disk (discover() entries carry more.)
+cacheEntryKeys = ("port", "identity", "type", "strips", "pins")
+
+# aumhTopologyCache
+#
+#  port:entry map backed by a JSON file, entries are the ones probePort()
+# returns:
+#
+#  { "port", "identity", "type", "strips":[ { "id", "pin", "length" } ],
+#    "pins":[ { "pin", "direction", "state", "class" } ], "time" }
+#
+#  Writes go to a temporary file which is renamed over the old one, so a
+# crash never leaves a half written cache behind.  A missing or unreadable
+# file is just an empty cache.
+class aumhTopologyCache(object):
+	def __init__(self, path=cache_path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.entries = {} #port:entry
+
+		self.load()
+
+	# load
+	#
+	# @ret, number of entries read
+	def load(self):
+		try:
+			with open(self.path, "r") as fd:
+				data = json.load(fd)
+		except (IOError, OSError, ValueError):
+			data = None
+
+		if not isinstance(data, dict) or data.get("version") != cache_version:
+			data = { "ports":{} }
+
+		with self.lock:
+			self.entries = dict((str(port), entry) for port, entry in data["ports"].items() if isinstance(entry, dict) and entry.get("identity"))
+			return len(self.entries)
+
+	# save
+	#
+	# Writes the cache out.
+	def save(self):
+		with self.lock:
+			data = json.dumps({ "version":cache_version, "ports":self.entries }, indent=1, sort_keys=True)
+
+			directory = os.path.dirname(self.path)
+			if directory and not os.path.isdir(directory):
+				os.makedirs(directory)
+
+			temp = "%s.tmp" % self.path
+			with open(temp, "w") as fd:
+				fd.write(data)
+
+			os.rename(temp, self.path)
+
+	# get
+	#
+	# @port, serial device path
+	# @ret, copy of the port's entry, or None.
+	def get(self, port):
+		with self.lock:
+			return copy.deepcopy(self.entries.get(port))
+
+	# ports
+	#
+	# @ret, sorted list of cached ports
+	def ports(self):
+		with self.lock:
+			return sorted(self.entries)
+
+	# put
+	#
+	# @entry, probePort() style entry (Anything beyond cacheEntryKeys is dropped.)
+	# @save, write the file straight away
+	def put(self, entry, save=True):
+		stored = dict((key, copy.deepcopy(entry.get(key))) for key in cacheEntryKeys)
+		stored["time"] = time.time()
+
+		with self.lock:
+			self.entries[entry["port"]] = stored
+
+		if save:
+			self.save()
+
+	# invalidate
+	#
+	# @port, serial device path
+	# @save, write the file straight away
+	def invalidate(self, port, save=True):
+		with self.lock:
+			found = self.entries.pop(port, None) is not None
+
+		if found and save:
+			self.save()
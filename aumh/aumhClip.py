@@ -0,0 +1,705 @@
+###############################################################################
+#                                 aumhClip.py                                 #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is clip playback, RGB or palette indexed frame clips streamed from a  #
+#  memory mapped file, stdin or a named pipe to one or more strands at the    #
+#  clip's frame rate, holding only one frame in memory whatever the clip's    #
+#  length.                                                                    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import io
+import os
+import sys
+import mmap
+import stat
+import time
+import array
+import bisect
+import struct
+import argparse
+import threading
+
+try:
+	import numpy as np
+except ImportError:
+	np = None #Frames are taken as r,g,b bytes or lists of [r, g, b].
+
+from aumh import *
+from aumhAnimation import monotonic
+
+# Clip header, little endian:
+#
+#  magic "AUMHCLIP", version, format, header size (Frames start there),
+#  frames per second (float), pixels a frame, frame count (0 when unknown,
+#  a clip being streamed into a pipe for example.)
+#
+#  Format CLIP_RGB frames follow as pixels x r,g,b bytes each.
+#
+#  Format CLIP_PALETTE has a palette after the header (Color count, uint16,
+# and r,g,b for each, up to 256) and frames of one palette index a pixel.
+# Each frame is a record, kind and payload length (clipRecordStruct) and then
+#
+#  FRAME_KEY, the pixels' indices
+#  FRAME_RLE, (count, index) byte pairs, runs covering every pixel
+#  FRAME_DELTA, changes from the frame before, spans of clipSpanStruct
+#   (first pixel, count) each followed by count indices
+#
+#  Key and RLE frames stand on their own, a delta needs the frame before it.
+clipHeaderStruct = struct.Struct("<8sBBHfII")
+clipRecordStruct = struct.Struct("<BI")
+clipSpanStruct = struct.Struct("<II")
+clip_magic = b"AUMHCLIP"
+clip_version = 1
+
+CLIP_RGB = 0
+CLIP_PALETTE = 1
+
+FRAME_KEY = 0
+FRAME_RLE = 1
+FRAME_DELTA = 2
+
+# Defaults
+clip_stop_timeout = 2.0
+clip_key_interval = 300 #Most frames between self contained palette frames, bounds what a seek decodes.
+clip_span_gap = clipSpanStruct.size #Unchanged pixels a delta span rewrites rather than starting a new span.
+
+# readExact
+#
+# @fd, binary file object
+# @buf, bytearray (Or memoryview of one) to fill
+# @ret, True once it's full, False at end of file.
+#
+#  Pipes hand back whatever has arrived, keep reading until it's all here.
+def readExact(fd, buf):
+	view = memoryview(buf)
+	got = 0
+
+	while got < len(buf):
+		count = fd.readinto(view[got:])
+		if not count:
+			return False
+
+		got += count
+
+	return True
+
+# aumhClip
+#
+#  Clip being read.  A regular file is memory mapped and frames can be read
+# in any order, anything else (stdin with "-", a named pipe, a file object)
+# is read front to back into one reused frame buffer.
+#
+#  clip = aumhClip("show.clip")
+#  clip.fps, clip.pixels, clip.frames
+#  clip.read(n) #r,g,b bytes of frame n, None past the end
+class aumhClip(object):
+	def __init__(self, source):
+		self.map = None
+		self.owned = False
+
+		if hasattr(source, "readinto"):
+			self.fd = source
+		elif source == "-":
+			self.fd = io.open(sys.stdin.fileno(), "rb", closefd=False)
+		else:
+			self.fd = io.open(source, "rb")
+			self.owned = True
+
+		header = bytearray(clipHeaderStruct.size)
+		if not readExact(self.fd, header):
+			raise ValueError("clip too short for a header")
+
+		magic, version, self.format, headerSize, self.fps, self.pixels, self.frames = clipHeaderStruct.unpack(bytes(header))
+		if magic != clip_magic or version != clip_version:
+			raise ValueError("not a version %d clip" % clip_version)
+
+		if self.fps <= 0:
+			raise ValueError("clip has no frame rate")
+
+		extra = bytearray(max(0, headerSize - len(header)))
+		if not readExact(self.fd, extra):
+			raise ValueError("clip header cut short")
+
+		self.headerSize = headerSize
+		self.setup(bytes(extra))
+		self.position = 0 #Next frame a stream read returns.
+
+		try:
+			regular = stat.S_ISREG(os.fstat(self.fd.fileno()).st_mode)
+		except (AttributeError, io.UnsupportedOperation, OSError):
+			regular = False
+
+		if regular:
+			self.map = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+		if self.palette is not None:
+			self.scan()
+		elif self.map is not None:
+			available = (len(self.map) - headerSize) // self.frameSize
+			self.frames = min(self.frames, available) if self.frames else available
+		else:
+			self.buf = bytearray(self.frameSize)
+
+	# setup
+	#
+	# @extra, header bytes past clipHeaderStruct
+	#
+	#  Format specific setup once the header is read.
+	def setup(self, extra):
+		if not self.pixels:
+			raise ValueError("clip has no pixels")
+
+		self.palette = None
+		self.frameSize = self.pixels * 3
+
+		if self.format == CLIP_RGB:
+			return
+
+		if self.format != CLIP_PALETTE:
+			raise ValueError("unknown clip format %d" % self.format)
+
+		count = struct.unpack_from("<H", extra, 0)[0] if len(extra) >= 2 else 0
+		colors = bytearray(extra[2:2 + count * 3])
+		if not count or count > 256 or len(colors) != count * 3:
+			raise ValueError("bad clip palette")
+
+		#  Indices past the palette show its last color.  With numpy palette is
+		# a 256 x 3 array, otherwise a list of 256 r,g,b byte strings.
+		colors += colors[-3:] * (256 - count)
+		if np is not None:
+			self.palette = np.frombuffer(bytes(colors), dtype=np.uint8).reshape(256, 3)
+			self.indices = np.zeros(self.pixels, dtype=np.uint8)
+		else:
+			self.palette = [ bytes(colors[i * 3:i * 3 + 3]) for i in range(0, 256) ]
+			self.indices = bytearray(self.pixels)
+
+		self.decoded = -1 #Frame in indices.
+		self.record = bytearray(clipRecordStruct.size)
+		self.payload = bytearray(self.pixels)
+
+	# scan
+	#
+	#  Finds where every record of a memory mapped palette clip starts, and
+	# which frames are self contained, so frames can be read in any order.
+	def scan(self):
+		self.offsets = array.array("L")
+		self.keys = array.array("L")
+
+		if self.map is None:
+			return
+
+		offset = self.headerSize
+		size = len(self.map)
+		while offset + clipRecordStruct.size <= size and (not self.frames or len(self.offsets) < self.frames):
+			kind, length = clipRecordStruct.unpack_from(self.map, offset)
+			if offset + clipRecordStruct.size + length > size:
+				break
+
+			if kind != FRAME_DELTA:
+				self.keys.append(len(self.offsets))
+			elif not self.offsets:
+				raise ValueError("clip starts with a delta frame")
+
+			self.offsets.append(offset)
+			offset += clipRecordStruct.size + length
+
+		self.frames = len(self.offsets)
+
+	@property
+	def seekable(self):
+		return self.map is not None
+
+	# read
+	#
+	# @n, frame index, for streams at least the index of the last frame read
+	#  plus one (Frames in between are read and thrown away.)
+	# @ret, r,g,b bytes of the frame, None past the end of the clip.
+	def read(self, n):
+		if self.palette is not None:
+			indices = self.indicesAt(n)
+			if indices is None:
+				return None
+
+			if np is not None:
+				return self.palette[indices].tobytes()
+
+			return b"".join([ self.palette[i] for i in indices ])
+
+		if self.map is not None:
+			if n < 0 or n >= self.frames:
+				return None
+
+			offset = self.headerSize + n * self.frameSize
+			return self.map[offset:offset + self.frameSize]
+
+		if n < self.position:
+			raise ValueError("stream clips can't go back to frame %d" % n)
+
+		while self.position <= n:
+			if (self.frames and self.position >= self.frames) or not readExact(self.fd, self.buf):
+				return None
+
+			self.position += 1
+
+		return self.buf
+
+	# indicesAt
+	#
+	# @n, frame index (As for read.)
+	# @ret, a palette clip's indices for the frame, uint8 array (bytearray
+	#  without numpy) which the next read overwrites, None past the end.
+	def indicesAt(self, n):
+		if n == self.decoded:
+			return self.indices
+
+		if self.map is not None:
+			if n < 0 or n >= self.frames:
+				return None
+
+			key = self.keys[bisect.bisect_right(self.keys, n) - 1]
+			first = key if (n < self.decoded or self.decoded < key) else self.decoded + 1
+
+			for i in range(first, n + 1):
+				kind, length = clipRecordStruct.unpack_from(self.map, self.offsets[i])
+				start = self.offsets[i] + clipRecordStruct.size
+				self.decode(kind, self.map[start:start + length])
+
+			self.decoded = n
+			return self.indices
+
+		if n < self.decoded:
+			raise ValueError("stream clips can't go back to frame %d" % n)
+
+		while self.decoded < n:
+			if (self.frames and self.decoded + 1 >= self.frames) or not readExact(self.fd, self.record):
+				return None
+
+			kind, length = clipRecordStruct.unpack(bytes(self.record))
+			if length > len(self.payload):
+				self.payload = bytearray(length)
+
+			payload = memoryview(self.payload)[0:length]
+			if not readExact(self.fd, payload):
+				return None
+
+			if kind == FRAME_DELTA and self.decoded < 0:
+				raise ValueError("clip starts with a delta frame")
+
+			self.decode(kind, payload.tobytes())
+			self.decoded += 1
+
+		return self.indices
+
+	# decode
+	#
+	# @kind, FRAME_* record kind
+	# @payload, record payload bytes
+	#
+	#  Applies a record to indices.
+	def decode(self, kind, payload):
+		indices = self.indices
+
+		if kind == FRAME_KEY:
+			if np is not None:
+				indices[:] = np.frombuffer(payload, dtype=np.uint8, count=self.pixels)
+			else:
+				indices[:] = bytearray(payload[0:self.pixels])
+
+		elif kind == FRAME_RLE:
+			if np is not None:
+				runs = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 2)
+				indices[:] = np.repeat(runs[:, 1], runs[:, 0])[0:self.pixels]
+			else:
+				runs = bytearray(payload)
+				out = bytearray()
+				for i in range(0, len(runs) - 1, 2):
+					out.extend(runs[i + 1:i + 2] * runs[i])
+
+				indices[:] = out[0:self.pixels]
+
+		elif kind == FRAME_DELTA:
+			offset = 0
+			while offset + clipSpanStruct.size <= len(payload):
+				first, count = clipSpanStruct.unpack_from(payload, offset)
+				offset += clipSpanStruct.size
+
+				if np is not None:
+					indices[first:first + count] = np.frombuffer(payload, dtype=np.uint8, count=count, offset=offset)
+				else:
+					indices[first:first + count] = bytearray(payload[offset:offset + count])
+
+				offset += count
+
+		else:
+			raise ValueError("unknown clip record %d" % kind)
+
+	def close(self):
+		if self.map is not None:
+			self.map.close()
+			self.map = None
+
+		if self.owned:
+			self.fd.close()
+
+# aumhClipWriter
+#
+#  Writes a CLIP_RGB clip.  When the destination can seek the frame count is
+# filled in by close(), otherwise it stays 0 (Read until the end.)
+class aumhClipWriter(object):
+	def __init__(self, destination, fps, pixels):
+		self.fps = fps
+		self.pixels = pixels
+		self.frames = 0
+
+		if hasattr(destination, "write"):
+			self.fd = destination
+			self.owned = False
+		else:
+			self.fd = io.open(destination, "wb")
+			self.owned = True
+
+		self.fd.write(self.header())
+
+	def header(self):
+		return clipHeaderStruct.pack(clip_magic, clip_version, CLIP_RGB, clipHeaderStruct.size, self.fps, self.pixels, self.frames)
+
+	# write
+	#
+	# @frame, r,g,b bytes, N x 3 array or list of [r, g, b] (Cut or padded
+	#  with black to the clip's pixels.)
+	def write(self, frame):
+		if np is not None and not isinstance(frame, (bytes, bytearray)):
+			frame = np.asarray(frame, dtype=np.uint8).tobytes()
+		elif isinstance(frame, list):
+			frame = bytes(bytearray(int(c) & 0xff for color in frame for c in color))
+
+		size = self.pixels * 3
+		self.fd.write(bytes(frame[0:size]))
+		if len(frame) < size:
+			self.fd.write(b"\x00" * (size - len(frame)))
+
+		self.frames += 1
+
+	def close(self):
+		try:
+			self.fd.seek(0)
+			self.fd.write(self.header())
+			self.fd.seek(0, os.SEEK_END)
+		except (AttributeError, IOError, OSError, io.UnsupportedOperation):
+			pass
+
+		if self.owned:
+			self.fd.close()
+		else:
+			self.fd.flush()
+
+# nearestIndices
+#
+# @frame, N x 3 array or list of [r, g, b]
+# @palette, list of [r, g, b]
+# @ret, uint8 array of the closest palette entry for every pixel (A
+#  bytearray without numpy.)
+def nearestIndices(frame, palette):
+	if np is not None:
+		colors = np.asarray(frame, dtype=np.int32).reshape(-1, 1, 3)
+		distance = ((colors - np.asarray(palette, dtype=np.int32).reshape(1, -1, 3)) ** 2).sum(axis=2)
+		return distance.argmin(axis=1).astype(np.uint8)
+
+	out = bytearray(len(frame))
+	for i, color in enumerate(frame):
+		out[i] = min(range(0, len(palette)), key=lambda p: sum((int(color[c]) - palette[p][c]) ** 2 for c in range(0, 3)))
+
+	return out
+
+# aumhPaletteClipWriter
+#
+#  Writes a CLIP_PALETTE clip, frames are given as palette indices (See
+# nearestIndices.)  With compress each frame is stored as whichever of a key,
+# RLE or delta record is smallest, a self contained one at least every
+# keyInterval frames.  Compression needs numpy, without it every frame is a
+# key frame.
+class aumhPaletteClipWriter(aumhClipWriter):
+	def __init__(self, destination, fps, pixels, palette, compress=True, keyInterval=clip_key_interval):
+		if not palette or len(palette) > 256:
+			raise ValueError("palettes have 1 to 256 colors")
+
+		self.palette = [ [ int(c) & 0xff for c in color ] for color in palette ]
+		self.compress = compress and np is not None
+		self.keyInterval = keyInterval
+		self.previous = None
+		self.sinceKey = 0
+
+		aumhClipWriter.__init__(self, destination, fps, pixels)
+
+	def header(self):
+		colors = bytes(bytearray(c for color in self.palette for c in color))
+		size = clipHeaderStruct.size + 2 + len(colors)
+		return clipHeaderStruct.pack(clip_magic, clip_version, CLIP_PALETTE, size, self.fps, self.pixels, self.frames) + struct.pack("<H", len(self.palette)) + colors
+
+	# write
+	#
+	# @frame, palette indices, bytes or uint8 array (Cut or padded with index
+	#  0 to the clip's pixels.)
+	def write(self, frame):
+		if np is not None:
+			indices = np.zeros(self.pixels, dtype=np.uint8)
+			frame = np.frombuffer(frame, dtype=np.uint8) if isinstance(frame, (bytes, bytearray)) else np.asarray(frame, dtype=np.uint8).ravel()
+			indices[0:min(len(frame), self.pixels)] = frame[0:self.pixels]
+			raw = indices.tobytes()
+		else:
+			raw = bytes(bytearray(frame)[0:self.pixels])
+			raw += b"\x00" * (self.pixels - len(raw))
+			indices = None
+
+		records = [ (FRAME_KEY, raw) ]
+		if self.compress:
+			records.append((FRAME_RLE, self.rle(indices)))
+			if self.previous is not None and self.sinceKey < self.keyInterval:
+				records.append((FRAME_DELTA, self.delta(self.previous, indices)))
+
+		kind, payload = min(records, key=lambda record: len(record[1]))
+		self.fd.write(clipRecordStruct.pack(kind, len(payload)) + payload)
+
+		self.sinceKey = self.sinceKey + 1 if kind == FRAME_DELTA else 1
+		self.previous = indices
+		self.frames += 1
+
+	# rle
+	#
+	# @indices, uint8 array
+	# @ret, FRAME_RLE payload
+	def rle(self, indices):
+		starts = np.concatenate(([ 0 ], np.flatnonzero(np.diff(indices)) + 1))
+		lengths = np.diff(np.concatenate((starts, [ len(indices) ])))
+
+		#Runs over 255 become several.
+		pieces = (lengths + 254) // 255
+		values = np.repeat(indices[starts], pieces)
+		counts = np.full(int(pieces.sum()), 255, dtype=np.int64)
+		ends = np.cumsum(pieces) - 1
+		counts[ends] = lengths - (pieces - 1) * 255
+
+		return np.stack([ counts.astype(np.uint8), values ], axis=1).tobytes()
+
+	# delta
+	#
+	# @previous, uint8 array of the frame before
+	# @indices, uint8 array
+	# @ret, FRAME_DELTA payload
+	#
+	#  Changed pixels closer than clip_span_gap share a span.
+	def delta(self, previous, indices):
+		changed = np.flatnonzero(previous != indices)
+		if not len(changed):
+			return b""
+
+		breaks = np.flatnonzero(np.diff(changed) > clip_span_gap)
+		firsts = np.concatenate(([ changed[0] ], changed[breaks + 1]))
+		lasts = np.concatenate((changed[breaks], [ changed[-1] ]))
+
+		out = []
+		for first, last in zip(firsts.tolist(), lasts.tolist()):
+			out.append(clipSpanStruct.pack(first, last - first + 1))
+			out.append(indices[first:last + 1].tobytes())
+
+		return b"".join(out)
+
+# aumhClipPlayer
+#
+#  Plays clips onto targets, a list of (aumhNeopixel, strand id) pairs which
+# may be on different devices.  The clip's pixels are laid across the
+# strands in order, each taking as many as it was long when the player was
+# made.  Strands are looked up again for every frame, one which has been
+# resized since shows what still fits and one which was deleted fails its
+# commits.
+#
+#  Frames are paced by the clip's frame rate on a monotonic clock and sent
+# through np_commit, so only pixels which changed go out.  A frame which
+# comes due while a target is still busy with the last one is dropped
+# (Frames are never queued), and frames which are already late when they
+# come due are skipped.
+class aumhClipPlayer(object):
+	def __init__(self, targets):
+		self.targets = []
+		offset = 0
+		for neopixel, id in targets:
+			strand = neopixel.strand(id)
+			if strand is None:
+				raise ValueError("unknown strand %s" % str(id))
+
+			self.targets.append((neopixel, id, offset, strand.length))
+			offset += strand.length
+
+		self.pixels = offset
+
+		self.stopEvent = threading.Event()
+		self.thread = None
+		self.resetStats()
+
+	def resetStats(self):
+		self.inFlight = [ None ] * len(self.targets)
+		self.played = 0
+		self.dropped = 0
+		self.skipped = 0
+		self.failed = 0
+		self.started = None
+
+	# busy
+	#
+	# @ret, True while any target's last frame hasn't been acknowledged.
+	def busy(self):
+		return any(future is not None and not future.done() for future in self.inFlight)
+
+	# show
+	#
+	# @frame, r,g,b bytes of a whole clip frame, or its palette indices
+	# @palette, the clip's palette for indices
+	#
+	#  Palette frames are expanded straight into the strand framebuffers.
+	def show(self, frame, palette=None):
+		for idx, (neopixel, id, offset, length) in enumerate(self.targets):
+			self.settled(idx)
+
+			strand = neopixel.strand(id)
+			if strand is not None:
+				count = min(length, strand.length)
+				if palette is not None:
+					strand.putIndices(0, palette, frame[offset:offset + count])
+				else:
+					strand.putBytes(0, frame[offset * 3:(offset + count) * 3])
+
+			self.inFlight[idx] = neopixel.np_commit(id, wait=False)
+
+	# settled
+	#
+	# @idx, target index
+	# @timeout, seconds to wait for the target's last commit
+	#
+	#  Counts the last commit as failed if it did, or if it still hasn't
+	# completed, and forgets it.
+	def settled(self, idx, timeout=0):
+		future, self.inFlight[idx] = self.inFlight[idx], None
+		if future is None:
+			return
+
+		future.result(timeout)
+		if not future.done() or future.value:
+			self.failed += 1
+
+	# play
+	#
+	# @clip, aumhClip
+	# @loop, start over at the end (Memory mapped clips only.)
+	# @ret, 0 at the end of the clip or when stopped, 1 if a frame failed.
+	def play(self, clip, loop=False):
+		self.resetStats()
+		self.stopEvent.clear()
+
+		period = 1.0 / clip.fps
+		start = self.started = monotonic()
+		n = 0
+
+		while not self.stopEvent.is_set():
+			due = start + n * period
+			now = monotonic()
+			if now < due:
+				time.sleep(min(due - now, period))
+				continue
+
+			behind = int((now - due) / period)
+			if behind: #Late, skip to the frame due now.
+				n += behind
+				self.skipped += behind
+
+			idx = n % clip.frames if loop and clip.seekable and clip.frames else n
+			frame = clip.read(idx) if clip.palette is None else clip.indicesAt(idx)
+			if frame is None:
+				break
+
+			if self.busy():
+				self.dropped += 1
+			else:
+				self.show(frame, clip.palette)
+				self.played += 1
+
+			n += 1
+
+		for idx in range(0, len(self.targets)):
+			self.settled(idx, clip_stop_timeout)
+
+		return 1 if self.failed else 0
+
+	# start
+	#
+	# @clip, aumhClip
+	# @loop, see play
+	#
+	#  Plays the clip in a thread, stop() ends it.
+	def start(self, clip, loop=False):
+		self.stop()
+		self.thread = threading.Thread(target=self.play, args=(clip, loop))
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop
+	#
+	# @timeout, seconds to wait for the playing thread (A commit which never
+	#  completes doesn't hang the caller.)
+	def stop(self, timeout=clip_stop_timeout):
+		self.stopEvent.set()
+		if self.thread is not None:
+			self.thread.join(timeout)
+			self.thread = None
+
+	# stats
+	#
+	# @ret, dict of frames played, dropped (Link busy), skipped (Late), target
+	#  commits which failed or never completed and the achieved frame rate.
+	def stats(self):
+		elapsed = (monotonic() - self.started) if self.started else 0.0
+		return {
+			"played":self.played,
+			"dropped":self.dropped,
+			"skipped":self.skipped,
+			"failed":self.failed,
+			"fps":(self.played / elapsed) if elapsed else 0.0,
+		}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Play a clip (A file, - for stdin or a named pipe) to neopixel strands.")
+	parser.add_argument("port", help="Serial device.")
+	parser.add_argument("clip")
+	parser.add_argument("--baud", type=int, default=BAUD)
+	parser.add_argument("--strand", type=int, action="append", dest="strands", help="Strand id, in the order the clip's pixels go; repeat for more strands (Default every strand.)")
+	parser.add_argument("--loop", action="store_true", help="Start over at the end of the clip.")
+
+	args = parser.parse_args()
+
+	from aumhConfig import aumhConfig
+	from aumhNeopixel import aumhNeopixel
+
+	device = aumh(args.port, args.baud)
+	aumhConfig(device)
+	neopixel = aumhNeopixel(device)
+	neopixel.np_manage()
+
+	clip = aumhClip(args.clip)
+	player = aumhClipPlayer([ (neopixel, id) for id in (args.strands or sorted(neopixel.strips)) ])
+
+	try:
+		player.play(clip, args.loop)
+	except KeyboardInterrupt:
+		pass
+
+	print(player.stats())
+	clip.close()
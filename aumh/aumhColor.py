@@ -0,0 +1,205 @@
+###############################################################################
+#                                aumhColor.py                                 #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the color math used for strands, vectorized HSV/RGB conversion and  #
+#  multi-stop gradients as N x 3 arrays, plus the small LRU cache the         #
+#  neopixel code keeps computed frames in.                                    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import colorsys
+import threading
+import collections
+
+try:
+	import numpy as np
+except ImportError:
+	np = None #colorsys, one pixel at a time.
+
+# Entries kept by the gradient caches.
+gradient_cache_size = 64
+
+#  Colors are r,g,b in 0-255 throughout.  HSV values come out the way
+# colorsys gives them for such colors, h and s in 0-1 and v in 0-255.
+
+# rgbToHsv
+#
+# @rgb, N x 3 array of colors
+# @ret, N x 3 float array of h,s,v (colorsys.rgb_to_hsv for every row.)
+def rgbToHsv(rgb):
+	rgb = np.asarray(rgb, dtype=np.float64).reshape(-1, 3)
+	r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+
+	maxc = rgb.max(axis=1)
+	minc = rgb.min(axis=1)
+	delta = maxc - minc
+	grey = delta == 0
+	safe = np.where(grey, 1.0, delta)
+
+	rc = (maxc - r) / safe
+	gc = (maxc - g) / safe
+	bc = (maxc - b) / safe
+
+	h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+	h = np.where(grey, 0.0, (h / 6.0) % 1.0)
+	s = np.where(grey, 0.0, delta / np.where(maxc == 0, 1.0, maxc))
+
+	return np.stack([ h, s, maxc ], axis=1)
+
+# hsvToRgb
+#
+# @hsv, N x 3 array of h,s,v
+# @ret, N x 3 float array of r,g,b (colorsys.hsv_to_rgb for every row.)
+def hsvToRgb(hsv):
+	hsv = np.asarray(hsv, dtype=np.float64).reshape(-1, 3)
+	h, s, v = hsv[:, 0], hsv[:, 1], hsv[:, 2]
+
+	i = (h * 6.0).astype(np.int64) #Truncates like int() does.
+	f = (h * 6.0) - i
+	p = v * (1.0 - s)
+	q = v * (1.0 - s * f)
+	t = v * (1.0 - s * (1.0 - f))
+	i = i % 6
+
+	r = np.choose(i, [ v, q, p, p, t, v ])
+	g = np.choose(i, [ t, v, v, q, p, p ])
+	b = np.choose(i, [ p, p, t, v, v, q ])
+
+	grey = s == 0.0
+	return np.stack([ np.where(grey, v, r), np.where(grey, v, g), np.where(grey, v, b) ], axis=1)
+
+# gradient
+#
+# @length, pixels to produce
+# @colors, list of [r, g, b] stops (At least two.)
+# @positions, where each stop sits from 0 to 1, evenly spaced by default
+# @space, "hsv" to interpolate hue/saturation/value or "rgb" for straight
+#  channel blends
+# @ret, N x 3 uint8 array (A list of [r, g, b] without numpy.)
+#
+#  Pixel n sits at n / length, so the last stop is approached but not reached
+# (As np_gradient always did.)  Channels are truncated and wrapped into
+# 0-255 like the old per pixel colorsys loop.  The math is done in floats,
+# under python 2 colorsys divided the integer colors np_gradient gave it and
+# rounded saturation to 0 or 1.
+def gradient(length, colors, positions=None, space="hsv"):
+	colors = [ [ int(c) for c in color ] for color in colors ]
+	if len(colors) < 2:
+		raise ValueError("gradient needs at least two colors")
+
+	if positions is None:
+		positions = [ float(i) / (len(colors) - 1) for i in range(0, len(colors)) ]
+
+	if len(positions) != len(colors):
+		raise ValueError("gradient needs a position for every color")
+
+	if np is None:
+		return gradientList(length, colors, positions, space)
+
+	if space == "hsv":
+		stops = rgbToHsv(colors)
+	else:
+		stops = np.asarray(colors, dtype=np.float64)
+
+	positions = np.asarray(positions, dtype=np.float64)
+	steps = np.arange(0, length, dtype=np.float64)
+
+	#Segment each pixel falls in, and how far through it.
+	segment = np.clip(np.searchsorted(positions, steps / length, side="right") - 1, 0, len(colors) - 2)
+	first = positions[segment] * length
+	span = (positions[segment + 1] - positions[segment]) * length
+	offset = steps - first
+	span = np.where(span == 0, 1.0, span)
+
+	lower = stops[segment]
+	out = (stops[segment + 1] - lower) * offset[:, None] / span[:, None] + lower
+
+	if space == "hsv":
+		out = hsvToRgb(out)
+
+	return (out.astype(np.int64) % 256).astype(np.uint8)
+
+# gradientList
+#
+#  gradient() without numpy, same arguments and results as lists.
+def gradientList(length, colors, positions, space):
+	if space == "hsv":
+		stops = [ colorsys.rgb_to_hsv(*[ float(c) for c in color ]) for color in colors ]
+	else:
+		stops = [ [ float(c) for c in color ] for color in colors ]
+
+	out = []
+	segment = 0
+	for nrp in range(0, length):
+		where = float(nrp) / length if length else 0.0
+		while segment < len(colors) - 2 and where >= positions[segment + 1]:
+			segment += 1
+
+		first = positions[segment] * length
+		span = (positions[segment + 1] - positions[segment]) * length or 1.0
+		lower = stops[segment]
+		upper = stops[segment + 1]
+
+		value = [ (upper[c] - lower[c]) * (nrp - first) / span + lower[c] for c in range(0, 3) ]
+		if space == "hsv":
+			value = colorsys.hsv_to_rgb(*value)
+
+		out.append([ int(value[0]) % 256, int(value[1]) % 256, int(value[2]) % 256 ])
+
+	return out
+
+# aumhLRU
+#
+#  Least recently used cache on an OrderedDict.  Thread safe, hits and
+# misses are counted for tuning maxsize.
+class aumhLRU(object):
+	def __init__(self, maxsize=gradient_cache_size):
+		self.maxsize = maxsize
+		self.lock = threading.Lock()
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	# get
+	#
+	# @key, hashable key
+	# @ret, the cached value (Now the most recently used), or None.
+	def get(self, key):
+		with self.lock:
+			value = self.entries.pop(key, None)
+			if value is None:
+				self.misses += 1
+				return None
+
+			self.entries[key] = value
+			self.hits += 1
+
+			return value
+
+	# put
+	#
+	# @key, hashable key
+	# @value, anything but None
+	def put(self, key, value):
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = value
+
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def __len__(self):
+		return len(self.entries)
@@ -29,8 +29,14 @@ from aumh import to_bytes
 from aumh import listOverlay
 from aumh import aumh
 
+# Seconds between cfg_manage attempts while __init__ waits for the device.
+config_retry_delay = 10
+
+#  attempts limits the cfg_manage tries __init__ makes (None keeps trying
+# forever, 0 skips the handshake for callers who already know the identity),
+# device.identityS stays unset if none of them succeed.
 class aumhConfig:
-	def __init__(self, UMH_Instance, logmethod=None, logfile=None):
+	def __init__(self, UMH_Instance, logmethod=None, logfile=None, attempts=None, retryDelay=config_retry_delay):
 		self.logmethod = logmethod
 		if logfile:
 			self.logConfigure(logfile)
@@ -38,7 +44,7 @@ class aumhConfig:
 		self.device = UMH_Instance
 
 		self.subcommands = {
-			"manage":b'\xff'
+			"manage":0xff
 		}
 
 		self.id = None
@@ -47,14 +53,15 @@ class aumhConfig:
 			self.device.begin()
 
 		#For right now, we're gonna do it this way....
-		good = False
-		while not good:
-			if not self.cfg_manage():
-				self.log("Got no data from manage.")
-				time.sleep(10)
-				continue
+		attempt = 0
+		while attempts != 0 and not self.cfg_manage():
+			attempt += 1
+			if attempts is not None and attempt >= attempts:
+				self.log("aumhConfig, no manage response after %d attempts." % attempt, "err")
+				break
 
-			break
+			self.log("Got no data from manage.")
+			time.sleep(retryDelay)
 
 	def logConfigure(self, logfile=None):
 		if self.logmethod == "logger":
@@ -102,14 +109,32 @@ class aumhConfig:
 		return buffer
 
 	def lmanage(self, buffer):
-		buffer[headerOffsets["scmd"]] = self.subcommands["manage"]
-		buffer[headerOffsets["out_0"]] = b'\x01' #This should actually call to_bytes and listOverlay.
+		out = self.device.sendManageMessage(self.lmanageFrame(buffer))
+
+		t_000 = time.time()
+		out = self.lmanageDecode(out)
+		self.device.stageDone("decode", t_000)
+
+		return out
+
+	# lmanageFrame
+	#
+	# @buffer, frame from assembleHeader("mhconfig")
+	# @ret, the finished manage request
+	def lmanageFrame(self, buffer):
+		buffer.scmd = self.subcommands["manage"]
+		buffer.outLen = 1
 		buffer = self.device.finishMessage(buffer)
 
-		buffer.append('\x00')
+		buffer.pack(uint8Struct, 0)
 
-		rawMsg = self.device.sendManageMessage(buffer)
+		return buffer
 
+	# lmanageDecode
+	#
+	# @rawMsg, raw manage response
+	# @ret, identity string, or None if the response was bad.
+	def lmanageDecode(self, rawMsg):
 		try:
 			if "NAK" in rawMsg:
 				self.log("Bad response in lmanage.")
@@ -141,4 +166,12 @@ class aumhConfig:
 			"command":"manage"
 		}
 
-		return self.createMessage(data)
\ No newline at end of file
+		return self.createMessage(data)
+
+	# cfg_manage_async
+	#
+	# @ret, future for the cfg_manage output (Device must be an aumhAsync.)
+	def cfg_manage_async(self):
+		buffer = self.lmanageFrame(self.device.assembleHeader("mhconfig"))
+
+		return self.device.asyncThen(self.device.sendManageMessageAsync(buffer), self.lmanageDecode)
@@ -38,6 +38,44 @@ LOW = 0
 C_DIGITAL = 0
 C_ANALOG = 1
 
+#  Message bodies.  The firmware doesn't read pin numbers the same way for
+# every subcommand: get and set take them big endian, cpin, add and del
+# little endian (What the original to_bytes() calls sent, the emulator
+# checks the same layouts.)  Pack pins through these rather than the
+# generic uint16 structs so each message keeps its byte order.
+
+#Pin (big endian); the get message.
+pinGetStruct = struct.Struct(">H")
+
+#Pin, state (big endian); the set message.
+pinSetStruct = struct.Struct(">HH")
+
+#Pin (little endian), direction, class; as used by the add and cpin messages.
+pinModeStruct = struct.Struct("<HBB")
+
+#Pin, pin again (little endian); the del message.
+pinDelStruct = struct.Struct("<HH")
+
+# digitalManageEntries
+#
+# @data, digital manage response
+# @ret, list of { "pin", "direction", "state", "class" } dicts, one per pin.
+def digitalManageEntries(data):
+	out = []
+	count = struct.unpack("<B", data[0])[0] #Get the first byte
+
+	for i in range(0, count):
+		relI = i * 6
+
+		pin = struct.unpack("<h", data[1+relI:3+relI])[0]
+		direction = struct.unpack("<B", data[3+relI])[0]
+		state = struct.unpack("<h", data[4+relI:6+relI])[0]
+		pClass = struct.unpack("<B", data[6+relI])[0]
+
+		out.append({ "pin":pin, "direction":direction, "state":state, "class":pClass })
+
+	return out
+
 #FIXME, the self.pins var should use this rather than dicts
 class PinInfo:
 	def __init__(self, _pin, _mode, _state, _type):
@@ -59,14 +97,14 @@ class aumhDigital:
 		self.pins = {}
 
 		self.subcommands = {
-			"get":b'\x00',
-			"set":b'\x01',
-			"sap":b'\x70', #Set and add pin
-			"gap":b'\x71', #Get and add pin
-			"cpin":b'\x7f',
-			"manage":b'\xfd',
-			"del":b'\xff',
-			"add":b'\xfe'
+			"get":0x00,
+			"set":0x01,
+			"sap":0x70, #Set and add pin
+			"gap":0x71, #Get and add pin
+			"cpin":0x7f,
+			"manage":0xfd,
+			"del":0xff,
+			"add":0xfe
 		}
 
 		self.subcommandKeys = {
@@ -123,6 +161,8 @@ class aumhDigital:
 	# @dataIn, dict of data
 	# @ret, buffer output from 'selected' command.
 	def createMessage(self, dataIn):
+		t_000 = time.time()
+
 		try:
 			if "data" not in dataIn:
 				return 2
@@ -156,6 +196,7 @@ class aumhDigital:
 				return None
 
 			buffer = self.device.finishMessage(buffer)
+			self.device.stageDone("build", t_000, buffer)
 
 			return buffer
 		except:
@@ -169,8 +210,17 @@ class aumhDigital:
 	# @ret, the output buffer from the device sendMessage call.
 	#
 	# Forwards a sendMessage call to the device sendMessage method.
-	def sendMessage(self, buffer):
-		return self.device.sendMessage(buffer)
+	def sendMessage(self, buffer, lane=None):
+		return self.device.sendMessage(buffer, lane)
+
+	# submitMessage
+	#
+	# @buffer, input buffer "string" of bytes
+	# @ret, aumhFuture from the device submitMessage call.
+	#
+	# Forwards a submitMessage call to the device submitMessage method.
+	def submitMessage(self, buffer, lane=None):
+		return self.device.submitMessage(buffer, lane)
 
 	# lget
 	#
@@ -180,16 +230,11 @@ class aumhDigital:
 	#
 	# lget builds up a get request for the pin selected.
 	def lget(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["get"]
-		outLen = to_bytes(1, 2, "little")
-		inLen = to_bytes(1, 2, "little")
-		buffer[headerOffsets['out_0']] = outLen[0]
-		buffer[headerOffsets['out_1']] = outLen[1]
-		buffer[headerOffsets['in_0']] = inLen[0]
-		buffer[headerOffsets['in_1']] = inLen[1]
+		buffer.scmd = self.subcommands["get"]
+		buffer.outLen = 1
+		buffer.inLen = 1
 
-		for pinpart in to_bytes(int(dataIn["data"]["pin"]),2):
-			buffer.append(pinpart)
+		buffer.pack(pinGetStruct, int(dataIn["data"]["pin"])) #Big endian.
 
 		return buffer
 
@@ -201,17 +246,11 @@ class aumhDigital:
 	#
 	# lset builds up a message for setting pin values.
 	def lset(self, buffer, dataIn, state=0):
-		buffer[headerOffsets["scmd"]] = self.subcommands["set"]
+		buffer.scmd = self.subcommands["set"]
 		#Right now, we only support 1 pin at a time... but this will exist for the future.
-		outLen = to_bytes(1, 2, "little")
-		buffer[headerOffsets['out_0']] = outLen[0]
-		buffer[headerOffsets['out_1']] = outLen[1]
+		buffer.outLen = 1
 
-		for pinpart in to_bytes(int(dataIn['data']['pin']), 2):
-			buffer.append(pinpart)
-
-		for setpart in to_bytes(int(dataIn['data']['state']), 2):
-			buffer.append(setpart)
+		buffer.pack(pinSetStruct, int(dataIn['data']['pin']), int(dataIn['data']['state'])) #Big endian.
 
 		return buffer
 
@@ -223,12 +262,10 @@ class aumhDigital:
 	#
 	# lset builds up a message for changing the mode of a pin.
 	def lchange(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["cpin"]		
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		buffer.scmd = self.subcommands["cpin"]
+		buffer.outLen = 1
 
-		buffer.append(to_bytes(dataIn['data']['pin'], 2, 0))
-		buffer.append(to_bytes(dataIn['data']['direction'], 1, 1))
-		buffer.append(to_bytes(dataIn['data']['class'], 1, 1))
+		buffer.pack(pinModeStruct, dataIn['data']['pin'], dataIn['data']['direction'], dataIn['data']['class']) #Little endian.
 
 		return buffer
 
@@ -240,12 +277,10 @@ class aumhDigital:
 	#
 	# Prepare message to add a new pin
 	def ladd(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["add"]		
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		buffer.scmd = self.subcommands["add"]
+		buffer.outLen = 1
 
-		buffer.append(to_bytes(dataIn['data']['pin'], 2, 0))
-		buffer.append(to_bytes(dataIn['data']['direction'], 1, 1))
-		buffer.append(to_bytes(dataIn['data']['class'], 1, 1))
+		buffer.pack(pinModeStruct, dataIn['data']['pin'], dataIn['data']['direction'], dataIn['data']['class']) #Little endian.
 
 		self.pins[dataIn['data']['pin']] = { "state":None, "pin":dataIn['data']['pin'], "direction":dataIn['data']['direction'], "class":dataIn['data']['class'] }
 		return buffer
@@ -258,11 +293,10 @@ class aumhDigital:
 	#
 	# Prepare message to delete a new pin
 	def ldel(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["del"]
-		buffer[headerOffsets["out_0"]] = '\x01'
+		buffer.scmd = self.subcommands["del"]
+		buffer.outLen = 1
 
-		buffer.append(to_bytes(dataIn['data']['pin'], 2, 0))
-		buffer.append(to_bytes(dataIn['data']['pin'], 2, 0))
+		buffer.pack(pinDelStruct, dataIn['data']['pin'], dataIn['data']['pin']) #Little endian.
 
 		if dataIn['data']['pin'] in self.pins:
 			del self.pins[dataIn['data']['pin']]
@@ -276,16 +310,23 @@ class aumhDigital:
 	#
 	# Prepare and then send a management message, and then return the output.
 	def lmanage(self, buffer):
-		buffer[headerOffsets["scmd"]] = self.subcommands["manage"]
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		return self.device.sendManageMessage(self.lmanageFrame(buffer))
+
+	# lmanageFrame
+	#
+	# @buffer, input frame
+	# @ret, the finished manage request
+	def lmanageFrame(self, buffer):
+		buffer.scmd = self.subcommands["manage"]
+		buffer.outLen = 1
 
 
 		buffer = self.device.finishMessage(buffer)
 
 		for i in range(0, 6):
-			buffer.append(self.subcommands["manage"])
+			buffer.pack(uint8Struct, self.subcommands["manage"])
 		
-		return self.device.sendManageMessage(buffer)
+		return buffer
 
 
 
@@ -303,4 +344,50 @@ class aumhDigital:
 			}
 		}
 
-		return self.createMessage(data)
\ No newline at end of file
+		return self.createMessage(data)
+
+	# setMessage
+	#
+	# @pin, pin number
+	# @state, state value
+	# @ret, the set message for digi_set and digi_set_async.
+	def setMessage(self, pin, state):
+		data = {
+			"command":"set",
+			"data":{
+				"pin":pin,
+				"state":state,
+			}
+		}
+
+		return self.createMessage(data)
+
+	# digi_set
+	#
+	# @pin, pin number
+	# @state, state value (HIGH/LOW or an analog value.)
+	# @wait, when False the message is submitted and an aumhFuture returned
+	# @ret, sendMessage output (Or the future.)
+	def digi_set(self, pin, state, wait=True):
+		if not wait:
+			return self.submitMessage(self.setMessage(pin, state))
+
+		ret = self.sendMessage(self.setMessage(pin, state))
+		if ret:
+			self.log("UARTDigital.digi_set(), sendMessage call failure.")
+
+		return ret
+
+	# digi_set_async
+	#
+	# @pin, pin number
+	# @state, state value
+	# @ret, future for the sendMessage output (Device must be an aumhAsync.)
+	def digi_set_async(self, pin, state):
+		return self.device.sendMessageAsync(self.setMessage(pin, state))
+
+	# digi_manage_async
+	#
+	# @ret, future for the digi_manage output (Device must be an aumhAsync.)
+	def digi_manage_async(self):
+		return self.device.sendManageMessageAsync(self.lmanageFrame(self.device.assembleHeader("digital")))
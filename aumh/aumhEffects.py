@@ -0,0 +1,331 @@
+###############################################################################
+#                               aumhEffects.py                                #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the effect library, periodic strand effects (rainbow, chase,       #
+#  breathe, twinkle, wipe) computed as whole frames, and a player which       #
+#  caches each frame's encoded messages so later cycles are only replayed.    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import math
+import random
+import colorsys
+
+try:
+	import numpy as np
+except ImportError:
+	np = None #Frames are lists of [r, g, b].
+
+from aumh import *
+from aumhColor import hsvToRgb
+from aumhColor import aumhLRU
+
+try:
+	gcd = math.gcd
+except AttributeError:
+	from fractions import gcd
+
+# Defaults
+effect_cache_size = 1024 #Encoded frames kept by a player, a few cycles of a few strands.
+
+# freeze
+#
+# @value, parameter value
+# @ret, the value with lists turned into tuples (So it can be part of a key.)
+def freeze(value):
+	if isinstance(value, (list, tuple)):
+		return tuple(freeze(v) for v in value)
+
+	return value
+
+# blend
+#
+# @background, [r, g, b] at level 0
+# @color, [r, g, b] at level 1
+# @levels, per pixel levels from 0 to 1 (Array, list without numpy.)
+# @ret, N x 3 uint8 array (List of [r, g, b] without numpy.)
+def blend(background, color, levels):
+	if np is not None:
+		background = np.asarray(background, dtype=np.float64)
+		color = np.asarray(color, dtype=np.float64)
+		out = background + (color - background) * np.asarray(levels, dtype=np.float64)[:, None]
+		return out.astype(np.uint8)
+
+	return [ [ int(background[c] + (color[c] - background[c]) * level) for c in range(0, 3) ] for level in levels ]
+
+# aumhEffect
+#
+#  Base of the effects.  An effect is a cycle of period() frames for a
+# strand of 'length' pixels, frame(n) computes frame n of it (n wraps.)
+# Parameters are fixed at creation, unknown ones raise ValueError; key
+# identifies the effect, parameters and length for caching.
+#
+#  Most effects are a per pixel level between a background and a color,
+# they only implement levels(n).
+class aumhEffect(object):
+	name = None
+	defaults = {}
+
+	def __init__(self, length, **params):
+		unknown = sorted(set(params) - set(self.defaults))
+		if unknown:
+			raise ValueError("effect %s has no parameter %s" % (self.name, ", ".join(unknown)))
+
+		self.length = length
+		self.params = dict(self.defaults)
+		self.params.update(params)
+		self.key = (self.name, length, tuple(sorted((name, freeze(value)) for name, value in self.params.items())))
+
+		self.setup()
+
+	def setup(self):
+		pass
+
+	# period
+	#
+	# @ret, frames in a cycle
+	def period(self):
+		return 1
+
+	# levels
+	#
+	# @n, frame index within the cycle
+	# @ret, per pixel levels from 0 to 1 (Array, list without numpy.)
+	def levels(self, n):
+		raise NotImplementedError
+
+	# frame
+	#
+	# @n, frame index (Wraps at period().)
+	# @ret, N x 3 uint8 array (List of [r, g, b] without numpy.)
+	def frame(self, n):
+		return blend(self.params["background"], self.params["color"], self.levels(n % self.period()))
+
+# RainbowEffect
+#
+#  Hues spread across the strand 'spread' times, turning once every 'cycle'
+# frames.
+class RainbowEffect(aumhEffect):
+	name = "rainbow"
+	defaults = { "cycle":60, "spread":1.0, "saturation":1.0, "brightness":255 }
+
+	def period(self):
+		return self.params["cycle"]
+
+	def frame(self, n):
+		p = self.params
+		shift = float(n % self.period()) / p["cycle"]
+
+		if np is not None:
+			hsv = np.empty((self.length, 3), dtype=np.float64)
+			hsv[:, 0] = (np.arange(0, self.length) * float(p["spread"]) / self.length + shift) % 1.0
+			hsv[:, 1] = p["saturation"]
+			hsv[:, 2] = p["brightness"]
+			return hsvToRgb(hsv).astype(np.uint8)
+
+		out = []
+		for i in range(0, self.length):
+			rgb = colorsys.hsv_to_rgb((i * float(p["spread"]) / self.length + shift) % 1.0, p["saturation"], p["brightness"])
+			out.append([ int(rgb[0]), int(rgb[1]), int(rgb[2]) ])
+
+		return out
+
+# ChaseEffect
+#
+#  Runs of 'width' pixels every 'spacing' pixels (One run when 0), moving
+# 'step' pixels a frame.
+class ChaseEffect(aumhEffect):
+	name = "chase"
+	defaults = { "color":(255, 0, 0), "background":(0, 0, 0), "width":3, "spacing":0, "step":1 }
+
+	def setup(self):
+		self.spacing = self.params["spacing"] or self.length or 1
+
+	def period(self):
+		return self.spacing // gcd(self.spacing, self.params["step"] % self.spacing or self.spacing)
+
+	def levels(self, n):
+		offset = n * self.params["step"]
+		width = self.params["width"]
+
+		if np is not None:
+			return ((np.arange(0, self.length) - offset) % self.spacing < width).astype(np.float64)
+
+		return [ 1.0 if (i - offset) % self.spacing < width else 0.0 for i in range(0, self.length) ]
+
+# BreatheEffect
+#
+#  The whole strand fading from background to color and back every 'cycle'
+# frames, along a raised cosine.
+class BreatheEffect(aumhEffect):
+	name = "breathe"
+	defaults = { "color":(255, 255, 255), "background":(0, 0, 0), "cycle":90 }
+
+	def period(self):
+		return self.params["cycle"]
+
+	def levels(self, n):
+		level = (1.0 - math.cos(2.0 * math.pi * n / self.params["cycle"])) / 2.0
+
+		if np is not None:
+			return np.full(self.length, level)
+
+		return [ level ] * self.length
+
+# TwinkleEffect
+#
+#  About 'density' of the pixels (Picked with 'seed') fade in and out once
+# every 'cycle' frames, each at its own phase.
+class TwinkleEffect(aumhEffect):
+	name = "twinkle"
+	defaults = { "color":(255, 255, 255), "background":(0, 0, 0), "density":0.1, "cycle":60, "seed":0 }
+
+	def setup(self):
+		rng = random.Random(self.params["seed"])
+		self.lit = [ 1.0 if rng.random() < self.params["density"] else 0.0 for i in range(0, self.length) ]
+		self.phase = [ rng.random() for i in range(0, self.length) ]
+
+		if np is not None:
+			self.lit = np.asarray(self.lit)
+			self.phase = np.asarray(self.phase)
+
+	def period(self):
+		return self.params["cycle"]
+
+	def levels(self, n):
+		t = float(n) / self.params["cycle"]
+
+		if np is not None:
+			return self.lit * np.maximum(np.sin(2.0 * math.pi * (t + self.phase)), 0.0) ** 2
+
+		return [ lit * max(math.sin(2.0 * math.pi * (t + phase)), 0.0) ** 2 for lit, phase in zip(self.lit, self.phase) ]
+
+# WipeEffect
+#
+#  Color filling the strand 'step' pixels a frame, then background wiping
+# it away the same way.
+class WipeEffect(aumhEffect):
+	name = "wipe"
+	defaults = { "color":(255, 255, 255), "background":(0, 0, 0), "step":1 }
+
+	def setup(self):
+		self.half = max(1, (self.length + self.params["step"] - 1) // self.params["step"])
+
+	def period(self):
+		return 2 * self.half
+
+	def levels(self, n):
+		filling = n < self.half
+		edge = min(self.length, ((n % self.half) + 1) * self.params["step"])
+
+		if np is not None:
+			out = (np.arange(0, self.length) < edge).astype(np.float64)
+			return out if filling else 1.0 - out
+
+		return [ float((i < edge) == filling) for i in range(0, self.length) ]
+
+# Effect classes by name.
+effects = dict((cls.name, cls) for cls in (RainbowEffect, ChaseEffect, BreatheEffect, TwinkleEffect, WipeEffect))
+
+# effect
+#
+# @name, key of effects
+# @length, strand length
+# @params, effect parameters
+# @ret, the effect, ValueError for unknown names or parameters.
+def effect(name, length, **params):
+	if name not in effects:
+		raise ValueError("unknown effect %s" % str(name))
+
+	return effects[name](length, **params)
+
+# aumhEffectPlayer
+#
+#  Shows effect frames on the strands of one aumhNeopixel instance.  The
+# first time a frame is shown it's computed and committed (np_commit, so
+# only the pixels which changed since the frame before go out) and the
+# encoded messages are kept, keyed by strand, effect and frame index along
+# with the strand contents they were a change from.  Whenever the strand
+# shows those contents again, which for a periodic effect is every cycle
+# after the first, the kept messages are written as they are and nothing is
+# computed or encoded.
+class aumhEffectPlayer:
+	def __init__(self, neopixel, cacheSize=effect_cache_size):
+		self.neopixel = neopixel
+		self.frames = aumhLRU(cacheSize) #(id, effect key, n):(previous bytes, frame bytes, [ messages ])
+
+	# play
+	#
+	# @id, strand id
+	# @effect, aumhEffect for the strand's length
+	# @n, frame index (Wraps at the effect's period.)
+	# @wait, when False the messages are submitted and an aumhFuture returned
+	# @ret, 0 or the first non-zero sendMessage return (Or the future.)
+	def play(self, id, effect, n, wait=True):
+		strand = self.neopixel.strand(id)
+		if strand is None:
+			self.neopixel.log("aumhEffectPlayer.play(), unknown strand %s." % str(id))
+			return 1 if wait else aumhFuture.resolved(1)
+
+		n %= effect.period()
+		key = (id, effect.key, n)
+
+		entry = self.frames.get(key)
+		if entry is not None and strand.synced and strand.ackBuf == entry[0]:
+			return self.replay(strand, entry, wait)
+
+		previous = bytes(strand.ackBuf) if strand.synced else None
+		record = []
+
+		ret = self.neopixel.np_commit(id, effect.frame(n), wait, record=record)
+
+		if previous is not None: #From unknown contents the messages can't be replayed.
+			self.frames.put(key, (previous, bytes(strand.buf), [ frameView(msg) for msg in record ]))
+
+		return ret
+
+	# replay
+	#
+	# @strand, StrandInfo showing entry's previous contents
+	# @entry, (previous bytes, frame bytes, [ messages ]) from frames
+	# @wait, see play
+	# @ret, see play
+	def replay(self, strand, entry, wait):
+		frameBytes, messages = entry[1], entry[2]
+
+		self.neopixel.device.metrics.add("effectReplays")
+		strand.buf[0:len(frameBytes)] = frameBytes
+		strand.clean()
+
+		def replayed(ret):
+			if ret: #Part of it may have landed.
+				strand.synced = False
+				return
+
+			strand.ackBuf[0:len(frameBytes)] = frameBytes
+
+		if not wait:
+			if not messages:
+				return aumhFuture.resolved(0)
+
+			future = aumhFuture.combine([ self.neopixel.submitMessage(msg) for msg in messages ])
+			future.add_done_callback(lambda done: replayed(done.value))
+			return future
+
+		for msg in messages:
+			ret = self.neopixel.sendMessage(msg)
+			if ret:
+				replayed(ret)
+				return ret
+
+		replayed(0)
+		return 0
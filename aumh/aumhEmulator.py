@@ -0,0 +1,576 @@
+###############################################################################
+#                               aumhEmulator.py                               #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is a stand-in for the firmware.  It sits on the master side of a      #
+#  pseudo-terminal and answers like a board would, so the library can be run #
+#  (And measured) without any hardware attached.                              #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import pty
+import tty
+import time
+import struct
+import random
+import select
+import argparse
+import threading
+
+from aumh import *
+from aumhDigital import pinGetStruct
+from aumhDigital import pinSetStruct
+from aumhDigital import pinModeStruct
+from aumhDigital import pinDelStruct
+from aumhNeopixel import pixelStruct
+from aumhNeopixel import strandAddStruct
+
+# Identity reported by config manage, the low nibble of the first byte is the
+# device type.
+emulator_identity = 0x00c0ffe1
+
+# Seconds the emulated board ignores input after a reset.
+emulator_boot_time = 0.5
+
+#  A partially received frame (Or fragment) is thrown away once nothing has
+# arrived for this long; fragments are answered with FF, frames with NAK.
+emulator_rx_timeout = 0.05
+
+# Fault injection defaults, everything off.
+#
+#  drop, chance of losing each received byte
+#  nak, chance of answering a complete frame with NAK instead of running it
+#  ff, chance of answering a fragment with FF
+#  storm, chance (Per fragment) of starting a run of stormLength FF replies
+#  reset, chance (Per frame) of the board resetting instead of answering
+emulatorFaults = {
+	"drop":0.0,
+	"nak":0.0,
+	"ff":0.0,
+	"storm":0.0,
+	"stormLength":8,
+	"reset":0.0,
+}
+
+# Body sizes (Everything after the header) keyed by (command, subcommand).
+# Neopixel ctrl/ctrli depend on the pixel count and are handled separately.
+emulatorBodies = {
+	(0x0000, 0xff):1,							#config manage
+	(0x0001, 0x00):pinGetStruct.size,			#digital get
+	(0x0001, 0x01):pinSetStruct.size,			#digital set
+	(0x0001, 0x7f):pinModeStruct.size,			#digital cpin
+	(0x0001, 0xfe):pinModeStruct.size,			#digital add
+	(0x0001, 0xff):pinDelStruct.size,			#digital del
+	(0x0001, 0xfd):6,							#digital manage
+	(0x0002, 0x02):1,							#neopixel clear
+	(0x0002, 0x03):1,							#neopixel get
+	(0x0002, 0x04):1,							#neopixel get_all
+	(0x0002, 0xfe):1 + strandAddStruct.size,	#neopixel add
+	(0x0002, 0xff):3,							#neopixel del
+	(0x0002, 0xfd):1 + 6,						#neopixel manage
+}
+
+# Digital manage entries, pin, direction, state, class.
+emulatorPinStruct = struct.Struct("<hBhB")
+
+# Neopixel manage entries, id, pin, length (Big endian.)
+emulatorStrandStruct = struct.Struct(">BBH")
+
+# Digital get response.
+emulatorStateStruct = struct.Struct("<h")
+
+# aumhEmulator
+#
+#  Emulated Arduino_UART_MessageHandler board on a pty.  start() returns the
+# slave's path, which is handed to aumh like any other serial device.
+#
+#  Frames are checked the same way the firmware does (Start/end keys and the
+# header LRC) and fragments are acknowledged one at a time with CT/FF.
+# Strands and pins live in memory so manage and get calls answer with
+# whatever was configured/written earlier.
+#
+#  Optional realism:
+#
+#  throttle, each byte costs 10 bit times at baud in both directions.
+#  fifoSize, bytes which may queue up behind the frame (Or fragment) being
+#   received, anything beyond is lost as with a real UART overrun.
+#  latency, seconds of "processing" before every reply.
+#  faults, overrides for emulatorFaults.
+#  fragResync, seconds the line must be quiet after a FF before input is
+#   taken again (Firmware for aumh's fragWindow.)  With 0 the next bytes are
+#   the rejected fragment, as with the stock firmware.
+class aumhEmulator(object):
+	def __init__(self, identity=emulator_identity, baud=BAUD, fifoSize=arduino_fifo_size, latency=0.0, throttle=False, faults=None, bootTime=emulator_boot_time, seed=None, fragResync=0.0):
+		self.identity = identity
+		self.baud = baud
+		self.fifoSize = fifoSize
+		self.latency = latency
+		self.fragResync = fragResync
+		self.throttle = throttle
+		self.bootTime = bootTime
+
+		self.faults = dict(emulatorFaults)
+		if faults:
+			self.faults.update(faults)
+
+		self.random = random.Random(seed)
+
+		self.master = None
+		self.slave = None
+		self.port = None
+		self.thread = None
+		self.running = False
+
+		self.strands = {}
+		self.pins = {}
+
+		self.stats = {
+			"frames":0,
+			"fragments":0,
+			"bytesIn":0,
+			"bytesOut":0,
+			"acks":0,
+			"naks":0,
+			"ffs":0,
+			"dropped":0,
+			"overruns":0,
+			"badHeaders":0,
+			"timeouts":0,
+			"resets":0,
+			"resynced":0,
+		}
+
+		self.handlers = {
+			(0x0000, 0xff):self.configManage,
+			(0x0001, 0x00):self.digitalGet,
+			(0x0001, 0x01):self.digitalSet,
+			(0x0001, 0x7f):self.digitalAdd,
+			(0x0001, 0xfe):self.digitalAdd,
+			(0x0001, 0xff):self.digitalDel,
+			(0x0001, 0xfd):self.digitalManage,
+			(0x0002, 0x00):self.neopixelCtrl,
+			(0x0002, 0x01):self.neopixelCtrl,
+			(0x0002, 0x02):self.neopixelClear,
+			(0x0002, 0x03):self.neopixelGet,
+			(0x0002, 0x04):self.neopixelGet,
+			(0x0002, 0xfe):self.neopixelAdd,
+			(0x0002, 0xff):self.neopixelDel,
+			(0x0002, 0xfd):self.neopixelManage,
+		}
+
+		self.clearState()
+
+	# start
+	#
+	# @ret, path of the pty slave to open as the serial device.
+	def start(self):
+		self.master, self.slave = pty.openpty()
+		tty.setraw(self.master)
+		tty.setraw(self.slave)
+		self.port = os.ttyname(self.slave)
+
+		self.running = True
+		self.thread = threading.Thread(target=self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+		return self.port
+
+	# stop
+	#
+	# Stops answering and closes both ends of the pty.
+	def stop(self):
+		self.running = False
+		if self.thread:
+			self.thread.join()
+			self.thread = None
+
+		for fd in (self.master, self.slave):
+			try:
+				os.close(fd)
+			except:
+				pass
+
+		self.master = self.slave = None
+
+	# reset
+	#
+	# Emulates a board reset, everything configured is forgotten and input is
+	# ignored for bootTime seconds.
+	def reset(self):
+		self.stats["resets"] += 1
+		self.strands = {}
+		self.pins = {}
+		self.clearState()
+		self.bootUntil = time.time() + self.bootTime
+
+	def clearState(self):
+		self.rx = bytearray()
+		self.frame = None #Frame being received, (header, total size, bytearray.)
+		self.storm = 0
+		self.lastRx = 0
+		self.bootUntil = 0
+		self.resyncing = False
+
+	def serve(self):
+		while self.running:
+			try:
+				readable = select.select([ self.master ], [], [], emulator_rx_timeout / 2)[0]
+				if readable:
+					self.receive(os.read(self.master, 4096))
+			except (OSError, select.error):
+				return
+
+			self.process()
+
+			if self.rx and time.time() - self.lastRx > emulator_rx_timeout:
+				self.rxTimeout()
+
+	# receive
+	#
+	# @data, bytes read from the pty
+	def receive(self, data):
+		if time.time() < self.bootUntil:
+			return
+
+		self.stats["bytesIn"] += len(data)
+
+		if self.resyncing:
+			if time.time() - self.lastRx < self.fragResync:
+				self.stats["resynced"] += len(data)
+				self.lastRx = time.time()
+				return
+
+			self.resyncing = False
+
+		if self.throttle:
+			time.sleep(len(data) * 10.0 / self.baud)
+
+		if self.faults["drop"]:
+			kept = bytearray()
+			for byte in bytearray(data):
+				if self.random.random() < self.faults["drop"]:
+					self.stats["dropped"] += 1
+				else:
+					kept.append(byte)
+			data = kept
+
+		self.rx.extend(data)
+		self.lastRx = time.time()
+
+		#Whatever doesn't fit behind the unit being received is overrun.
+		limit = self.unitSize() + self.fifoSize
+		if len(self.rx) > limit:
+			self.stats["overruns"] += len(self.rx) - limit
+			del self.rx[limit:]
+
+	# unitSize
+	#
+	# @ret, bytes still needed to complete what is currently being received
+	#  (The next fragment, the rest of the frame or a worst case frame.)
+	def unitSize(self):
+		if not self.frame:
+			return arduino_frag_size
+
+		header, size, data = self.frame
+		if header[1]:
+			return min(arduino_frag_size, size - len(data))
+
+		return size - len(data)
+
+	# process
+	#
+	# Consumes every complete frame/fragment in rx.
+	def process(self):
+		while self.rx and self.running:
+			if not self.frame and not self.startFrame():
+				return
+
+			header, size, data = self.frame
+			unit = self.unitSize()
+			if len(self.rx) < unit:
+				return
+
+			chunk = self.rx[:unit]
+			del self.rx[:unit]
+
+			if header[1]:
+				self.stats["fragments"] += 1
+				if self.injectFF():
+					self.rejectFragment()
+					continue
+
+				data.extend(chunk)
+				self.reply(g_uart_frag_ok + "\r\n")
+				if len(data) < size:
+					continue
+			else:
+				data.extend(chunk)
+
+			self.frame = None
+			self.execute(header, memoryview(data)[headerStruct.size:])
+
+	# startFrame
+	#
+	# @ret, True once a valid header is at the front of rx and self.frame is set.
+	def startFrame(self):
+		while self.rx:
+			start = self.rx.find(bytearray([ key_start ]))
+			if start < 0:
+				del self.rx[:]
+				return False
+
+			del self.rx[:start]
+			if len(self.rx) < headerStruct.size:
+				return False
+
+			header = headerStruct.unpack_from(bytes(self.rx[:headerStruct.size]))
+			if header[9] != key_end or header[8] != lrc(self.rx, headerOffsets["sum"]):
+				self.stats["badHeaders"] += 1
+				del self.rx[:1]
+				continue
+
+			cmd = header[2] | (header[3] << 8)
+			body = self.bodySize(cmd, header[4], header[6])
+			if body is None:
+				self.stats["badHeaders"] += 1
+				del self.rx[:headerStruct.size]
+				self.reply(r_nak)
+				continue
+
+			self.frame = (header, headerStruct.size + body, bytearray())
+			return True
+
+		return False
+
+	# bodySize
+	#
+	# @cmd, command value
+	# @scmd, subcommand value
+	# @outLen, header out length
+	# @ret, number of bytes following the header, None for unknown messages.
+	def bodySize(self, cmd, scmd, outLen):
+		if cmd == 0x0002 and scmd in (0x00, 0x01):
+			return 1 + pixelStruct.size * outLen
+
+		return emulatorBodies.get((cmd, scmd))
+
+	# rxTimeout
+	#
+	# Partial input went quiet, drop it the way the firmware would.
+	def rxTimeout(self):
+		self.stats["timeouts"] += 1
+		del self.rx[:]
+
+		if self.frame and self.frame[0][1]:
+			self.rejectFragment()
+			return
+
+		self.frame = None
+		self.reply(r_nak)
+
+	# rejectFragment
+	#
+	# Answers FF for the fragment being received.
+	def rejectFragment(self):
+		self.reply(g_uart_frag_bad + "\r\n")
+		if not self.frame[2]: #First fragment carries the header, look for it again.
+			self.frame = None
+
+		if self.fragResync:
+			self.resyncing = True
+			del self.rx[:]
+
+	def injectFF(self):
+		if self.storm:
+			self.storm -= 1
+			return True
+
+		if self.faults["storm"] and self.random.random() < self.faults["storm"]:
+			self.storm = self.faults["stormLength"] - 1
+			return True
+
+		return self.faults["ff"] and self.random.random() < self.faults["ff"]
+
+	# execute
+	#
+	# @header, unpacked header
+	# @body, memoryview of everything after the header
+	def execute(self, header, body):
+		self.stats["frames"] += 1
+
+		if self.faults["reset"] and self.random.random() < self.faults["reset"]:
+			self.reset()
+			return
+
+		if self.faults["nak"] and self.random.random() < self.faults["nak"]:
+			self.reply(r_nak)
+			return
+
+		cmd = header[2] | (header[3] << 8)
+		try:
+			out = self.handlers[(cmd, header[4])](header, body)
+		except (KeyError, struct.error):
+			out = None
+
+		if out is None:
+			self.reply(r_nak)
+		else:
+			self.reply(bytes(out) + r_ack)
+
+	# reply
+	#
+	# @data, bytes to send back
+	def reply(self, data):
+		if data.endswith(r_nak):
+			self.stats["naks"] += 1
+		elif data.endswith(r_ack):
+			self.stats["acks"] += 1
+		elif data.startswith(g_uart_frag_bad):
+			self.stats["ffs"] += 1
+
+		if self.latency:
+			time.sleep(self.latency)
+
+		if self.throttle:
+			time.sleep(len(data) * 10.0 / self.baud)
+
+		try:
+			os.write(self.master, data)
+		except OSError:
+			return
+
+		self.stats["bytesOut"] += len(data)
+
+	#  Command handlers.  Each gets the header and body and returns the response
+	# payload (Which is followed by ACK) or None for NAK.
+
+	def configManage(self, header, body):
+		return struct.pack("<I", self.identity)
+
+	def digitalGet(self, header, body):
+		pin = pinGetStruct.unpack_from(body, 0)[0]
+		if pin not in self.pins:
+			return None
+
+		return emulatorStateStruct.pack(self.pins[pin]["state"])
+
+	def digitalSet(self, header, body):
+		pin, state = pinSetStruct.unpack_from(body, 0)
+		if pin not in self.pins:
+			self.pins[pin] = { "direction":1, "state":0, "class":0 }
+
+		self.pins[pin]["state"] = state
+		return b""
+
+	def digitalAdd(self, header, body):
+		pin, direction, pinClass = pinModeStruct.unpack_from(body, 0)
+		state = self.pins[pin]["state"] if pin in self.pins else 0
+		self.pins[pin] = { "direction":direction, "state":state, "class":pinClass }
+		return b""
+
+	def digitalDel(self, header, body):
+		pin = pinDelStruct.unpack_from(body, 0)[0]
+		if pin not in self.pins:
+			return None
+
+		del self.pins[pin]
+		return b""
+
+	def digitalManage(self, header, body):
+		out = bytearray([ len(self.pins) ])
+		for pin in sorted(self.pins):
+			entry = self.pins[pin]
+			out.extend(emulatorPinStruct.pack(pin, entry["direction"], entry["state"], entry["class"]))
+
+		return out
+
+	def neopixelCtrl(self, header, body):
+		strand = self.strands.get(uint8Struct.unpack_from(body, 0)[0])
+		if strand is None:
+			return None
+
+		pixels = strand["pixels"]
+		for offset in xrange(1, 1 + pixelStruct.size * header[6], pixelStruct.size):
+			idx, r, g, b = pixelStruct.unpack_from(body, offset)
+			if idx < strand["length"]:
+				pixels[idx * 3:idx * 3 + 3] = bytearray((r, g, b))
+
+		return b""
+
+	def neopixelClear(self, header, body):
+		strand = self.strands.get(uint8Struct.unpack_from(body, 0)[0])
+		if strand is None:
+			return None
+
+		strand["pixels"][:] = bytearray(len(strand["pixels"]))
+		return b""
+
+	def neopixelGet(self, header, body):
+		strand = self.strands.get(uint8Struct.unpack_from(body, 0)[0])
+		if strand is None:
+			return None
+
+		pixels = strand["pixels"]
+		out = bytearray(strand["length"] * 4)
+		for i in xrange(0, strand["length"]):
+			out[i * 4 + 1:i * 4 + 4] = pixels[i * 3:i * 3 + 3]
+
+		return out
+
+	def neopixelAdd(self, header, body):
+		strandId = uint8Struct.unpack_from(body, 0)[0]
+		pin, length = strandAddStruct.unpack_from(body, 1)
+		self.strands[strandId] = { "pin":pin, "length":length, "pixels":bytearray(length * 3) }
+		return b""
+
+	def neopixelDel(self, header, body):
+		strandId = uint8Struct.unpack_from(body, 0)[0]
+		if strandId not in self.strands:
+			return None
+
+		del self.strands[strandId]
+		return b""
+
+	def neopixelManage(self, header, body):
+		out = bytearray([ len(self.strands) ])
+		for strandId in sorted(self.strands):
+			strand = self.strands[strandId]
+			out.extend(emulatorStrandStruct.pack(strandId, strand["pin"], strand["length"]))
+
+		return out
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Emulated Arduino_UART_MessageHandler board on a pty.")
+	parser.add_argument("--baud", type=int, default=BAUD)
+	parser.add_argument("--throttle", action="store_true", help="Pace traffic at the baud rate.")
+	parser.add_argument("--fifo", type=int, default=arduino_fifo_size)
+	parser.add_argument("--latency", type=float, default=0.0)
+	parser.add_argument("--seed", type=int, default=None)
+	parser.add_argument("--resync", type=float, default=0.0, help="Quiet seconds needed after a FF.")
+	for fault in sorted(emulatorFaults):
+		parser.add_argument("--%s" % fault, type=type(emulatorFaults[fault]), default=emulatorFaults[fault])
+
+	args = parser.parse_args()
+
+	emulator = aumhEmulator(baud=args.baud, fifoSize=args.fifo, latency=args.latency, throttle=args.throttle, seed=args.seed, fragResync=args.resync,
+		faults=dict((fault, getattr(args, fault)) for fault in emulatorFaults))
+
+	print(emulator.start())
+	sys.stdout.flush()
+
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		emulator.stop()
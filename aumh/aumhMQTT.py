@@ -20,7 +20,9 @@ import struct
 import time
 import socket
 import copy
+import json
 import multiprocessing
+import threading
 import logging
 
 import paho.mqtt.client as mqtt
@@ -29,6 +31,8 @@ from aumh import *
 from aumhConfig import *
 from aumhDigital import *
 from aumhNeopixel import *
+from aumhEffects import *
+from aumhAnimation import *
 
 MSG_HOST_OFFSET = 1
 MSG_SERVICE_OFFSET = 2
@@ -104,6 +108,7 @@ class aumhMQTT:
 		self.messageHandlers = {}
 
 		self.neopixelBuffer = {}
+		self.animators = {} #device id:aumhAnimator
 		self.timeElapsed = 0
 		self.timeMax = 200 #(ms)
 
@@ -192,6 +197,7 @@ class aumhMQTT:
 		# %hostname%/neopixel/%strandid%/
 		# %hostname%/neopixel/%strandid%/set/
 		# %hostname%/neopixel/%strandid%/set/%led% = (r,g,b)
+		# %hostname%/neopixel/%strandid%/effect = { "name":"rainbow", ... } or off
 		# %hostname%/neopixel/%strandid%/config = [ o, old data| f, fresh data | u, unknown ] #This is a published path
 		# %hostname%/neopixel/%strandid%/config/pin = value
 		# %hostname%/neopixel/%strandid%/config/length = value
@@ -204,13 +210,24 @@ class aumhMQTT:
 		# %hostname%/digital/%pin%/value/%val% #This is published to
 		# %hostname%/control
 
-#RENAME MULTISET TO THIS.
-	#This is the worker thread to be which waits for timeMax or a send command to be reached
-	def neopixel_set_t(self):
-		#Get current time
-		#if (current time) == (lastTime + timeMax):
-		#	send data
-		pass
+	# neopixel_set_t
+	#
+	# @ident, device id
+	# @ret, the device's aumhAnimator (Started on first use), or None if the
+	#  device has no neopixel instance.
+	#
+	#  The timed sender, strands added to it are rendered and committed on the
+	# gateway at animation_fps instead of through per pixel messages.
+	def neopixel_set_t(self, ident):
+		if not self.has_instance("neopixel", ident):
+			return None
+
+		if ident not in self.animators:
+			self.animators[ident] = aumhAnimator(self.devices[ident]["neopixel"], logmethod=self.logmethod)
+			self.animators[ident].logger = logging.getLogger("aumh") #Same logger ours writes to.
+			self.animators[ident].start()
+
+		return self.animators[ident]
 
 	#Note: This can be simplified in the future by actually applying the common method names for each class type.
 	def on_message(self, client, userdata, msg):
@@ -285,9 +302,9 @@ class aumhMQTT:
 
 					ltopic = "/%s/%s/%s" % ( str(self.hostname), str(SERVICEID), str(msgIdent) )
 
-					for pixel in out["pixels"]:
-						for color in out["pixels"][pixel]:
-							self.client.publish("%s/neopixel/%s/config/%s/%s" % ( str(ltopic), str(umhmsg["id"]), str(pixel), str(color) ), struct.unpack("<B", out["pixels"][pixel][color])[0] )
+					for pixel in range(0, out.length):
+						for color, value in zip(("red", "green", "blue"), out.color(pixel)):
+							self.client.publish("%s/neopixel/%s/config/%s/%s" % ( str(ltopic), str(umhmsg["id"]), str(pixel), str(color) ), value )
 
 				if msgL[MSG_COMMAND_OFFSET] == "set" or msgL[MSG_COMMAND_OFFSET] == "seti": #Set commands handler
 					rgbS = msg.payload.split(",")
@@ -328,7 +345,10 @@ class aumhMQTT:
 
 							self.busyThreadBuffer.pop(int(msgL[MSG_STRAND_OFFSET]), None)
 
-						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])] = multiprocessing.Process(target=self.multiSet, args=(umhmsg, self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])], copy.copy(msgIdent), MQTTPROCESSTIMEOUT, MQTTPROCESSTIMELIMIT,))
+						#  multiSet runs as a thread so that it shares the device scheduler
+						# (And its priority lanes) with everything else in this process.
+						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])] = threading.Thread(target=self.multiSet, args=(umhmsg, self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])], copy.copy(msgIdent), MQTTPROCESSTIMEOUT, MQTTPROCESSTIMELIMIT,))
+						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])].daemon = True
 						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])].start()
 						
 						return None #Break out completely, we don't want to do anything else.
@@ -353,12 +373,12 @@ class aumhMQTT:
 					else: #it's dying.
 						#Cleanup
 						self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])] = None
-						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])].terminate()
 						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])] = None
 
 						#Create new instance
 						self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])] = multiprocessing.Pipe()
-						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])] = multiprocessing.Process(target=self.multiSet, args=(umhmsg, self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])], msgIdent, MQTTPROCESSTIMEOUT, MQTTPROCESSTIMELIMIT,))
+						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])] = threading.Thread(target=self.multiSet, args=(umhmsg, self.threadInstancePipes[int(msgL[MSG_STRAND_OFFSET])], msgIdent, MQTTPROCESSTIMEOUT, MQTTPROCESSTIMELIMIT,))
+						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])].daemon = True
 						self.threadInstances[int(msgL[MSG_STRAND_OFFSET])].start()
 
 				elif msgL[MSG_COMMAND_OFFSET] == "del": #deletion command
@@ -396,6 +416,25 @@ class aumhMQTT:
 					if self.devices[msgIdent]["neopixel"].sendMessage(self.devices[msgIdent]["neopixel"].createMessage(umhmsg)):
 						self.log("neopixel mqtt issue sending clear message.")
 
+				elif msgL[MSG_COMMAND_OFFSET] == "effect": #Payload { "name":..., parameters } or off.
+					animator = self.neopixel_set_t(msgIdent)
+
+					if msg.payload in ("", "off"):
+						animator.remove(umhmsg["id"])
+						return None
+
+					try:
+						params = json.loads(msg.payload)
+						name = params.pop("name")
+						strand = self.devices[msgIdent]["neopixel"].strand(umhmsg["id"])
+						fx = effect(str(name), strand.length if strand else 0, **dict((str(k), v) for k, v in params.items()))
+					except (ValueError, KeyError, TypeError, AttributeError) as e:
+						self.log("neopixel mqtt bad effect message. [%s]" % str(e))
+						return None
+
+					if animator.addEffect(umhmsg["id"], fx) is None:
+						self.log("neopixel mqtt effect for unknown strand %s." % str(umhmsg["id"]))
+
 		elif "digital" in msg.topic and "digital" in self.devices[msgIdent]:
 			if len(msgL) < 5:
 				self.log("Bogus digital message received.")
@@ -574,16 +613,7 @@ class aumhMQTT:
 
 				try:
 					if not data.startswith("NAK"):
-						datal = list(data)
-
-						count = struct.unpack("<B", datal.pop(0))[0]
-
-						for i in range(0, count):
-							relI = i * 4
-							pID = struct.unpack(">B", data[1+relI])[0]
-							pin = struct.unpack(">B", data[2+relI])[0]
-							length = struct.unpack(">H", data[3+relI:5+relI])[0]
-							cfgData[device]["neopixel"].append({ "id":pID, "pin":pin, "length":length })
+						cfgData[device]["neopixel"].extend(neopixelManageEntries(data))
 
 				except:
 					self.log("MQTTHandler.publisher(), issue handling neopixel instance.")
@@ -595,19 +625,7 @@ class aumhMQTT:
 
 				try:
 					if not data.startswith("NAK"):
-						datal = list(data)
-
-						count = struct.unpack("<B", datal.pop(0))[0] #Get the first byte
-
-						for i in range(0, count):
-							relI = i * 6
-
-							pin = struct.unpack("<h", data[1+relI:3+relI])[0]
-							direction = struct.unpack("<B", data[3+relI])[0]
-							state = struct.unpack("<h", data[4+relI:6+relI])[0]
-							pClass = struct.unpack("<B", data[6+relI])[0]
-
-							lPin = { "pin":pin, "direction":direction, "state":state, "class":pClass }
+						for lPin in digitalManageEntries(data):
 							self.devices[device]["digital"].addPin(copy.copy(lPin))
 							cfgData[device]["digital"].append( lPin )
 				except:
@@ -0,0 +1,688 @@
+###############################################################################
+#                               aumhManager.py                                #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the multi-port device manager.  Every serial port gets its own     #
+#  worker (Thread or process) and commands are routed to the right one by    #
+#  device identity.                                                           #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import time
+import logging
+import itertools
+import threading
+import multiprocessing
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+from aumh import *
+from aumh import aumh
+from aumhConfig import aumhConfig
+from aumhDigital import aumhDigital
+from aumhDigital import digitalManageEntries
+from aumhNeopixel import aumhNeopixel
+from aumhNeopixel import neopixelManageEntries
+from aumhCache import aumhTopologyCache
+
+# Seconds aumhManager.wait() gives workers to come up by default.
+manager_ready_timeout = 30
+
+# Seconds aumhManager.call() waits for a worker's reply by default.
+manager_reply_timeout = 30
+
+# Serial devices discover() probes when it isn't given a port list.
+discovery_patterns = [ "/dev/ttyUSB*", "/dev/ttyACM*" ]
+discovery_attempts = 2		#cfg_manage attempts per port...
+discovery_retry_delay = 0.5	#...and the wait between them.
+
+# Worker modes
+MANAGER_THREAD = "thread"
+MANAGER_PROCESS = "process"
+
+# aumhPortWorker
+#
+#  Owns one serial port.  Its instances (The aumh device and the config,
+# neopixel and digital handlers, keyed like aumhMQTT's devices) are only
+# touched from the worker's own thread/process, requests are queued as
+# (key, kind, method, args, kwargs) and answered as (key, result).
+#
+#  Requests are answered in order, so a slow command only holds up its own
+# port.  Results are None if the call raised (It's logged.)
+#
+#  With a cached entry (aumhTopologyCache) the worker skips the boot wait and
+# the handshake, comes up under the cached identity and topology and then
+# re-reads both (verifyTopology) as its first job, reporting them as
+# ("verified", entry) to onVerified.  The same is done after a normal build
+# when verify is set.
+class aumhPortWorker(object):
+	def __init__(self, port, baud=None, logmethod=None, logfile=None, instances=None, cached=None, verify=False):
+		self.port = port
+		self.instances = instances #Already built (By discover()), build() hands these out.
+		self.cached = cached
+		self.verify = verify or bool(cached)
+		self.onVerified = None #Called with (worker, entry or None.)
+		self.baud = baud
+		self.logmethod = logmethod
+		self.logfile = logfile
+
+		self.identity = None
+		self.ready = threading.Event()
+		self.keys = itertools.count()
+		self.pending = {}
+		self.pendingLock = threading.Lock()
+
+		self.logConfigure(logfile)
+
+	# build
+	#
+	# @ret, dict of kind:instance for the port.  Runs inside the worker.
+	def build(self):
+		if self.instances:
+			instances, self.instances = self.instances, None
+			return instances
+
+		device = aumh(self.port, self.baud, self.logmethod, self.logfile, 0 if self.cached else reset_boot_timeout)
+
+		try:
+			instances = {
+				"device":device,
+				"mhconfig":aumhConfig(device, self.logmethod, self.logfile, 0 if self.cached else None),
+				"neopixel":aumhNeopixel(device, self.logmethod, self.logfile),
+				"digital":aumhDigital(device, self.logmethod, self.logfile),
+			}
+
+			if self.cached:
+				applyTopology(instances, self.cached)
+		except:
+			closeInstances({ "device":device })
+			raise
+
+		return instances
+
+	# serve
+	#
+	# @requests, queue to take requests from (None stops the worker.)
+	# @reply, callable taking each (key, result) answer
+	def serve(self, requests, reply):
+		instances = {}
+
+		try:
+			instances = self.build()
+			identity = instances["device"].identityS
+		except:
+			self.log("aumhPortWorker.serve(), unable to set up port %s." % str(self.port), "err")
+			closeInstances(instances)
+			instances = {}
+			identity = None
+
+		reply(("ready", identity))
+
+		if self.verify and instances:
+			reply(("verified", self.verifyTopology(instances)))
+
+		while True:
+			item = requests.get()
+			if item is None:
+				break
+
+			key, kind, method, args, kwargs = item
+
+			try:
+				if method.startswith("_"):
+					raise AttributeError(method)
+
+				result = getattr(instances[kind], method)(*args, **kwargs)
+			except:
+				self.log("aumhPortWorker.serve(), %s.%s on port %s failed: %s" % (str(kind), str(method), str(self.port), str(sys.exc_info()[1])), "err")
+				result = None
+
+			reply((key, result))
+
+	# verifyTopology
+	#
+	# @instances, kind:instance dict for the port
+	# @ret, registry entry the device reported, None if it didn't answer.
+	#
+	#  For a cached entry build() skipped the boot wait, the handshake here is
+	# the first contact and the wait is only paid when it goes unanswered.
+	# When another identity answers the cached strips and pins are dropped
+	# before the topology is read again, otherwise only strips the device
+	# didn't report are.
+	def verifyTopology(self, instances):
+		device = instances["device"]
+
+		try:
+			identified = instances["mhconfig"].cfg_manage()
+			if not identified and self.cached: #Still booting.
+				device.waitForBoot(reset_boot_timeout)
+				identified = instances["mhconfig"].cfg_manage()
+
+			entry = None
+			if identified:
+				if self.cached and self.cached["identity"] != device.identityS:
+					dropTopology(instances)
+
+				entry = readTopology(self.port, instances)
+
+				strips = instances["neopixel"].strips
+				reported = set(strip["id"] for strip in entry["strips"])
+				if reported: #Nothing is also what a failed manage gives.
+					for id in set(strips) - reported: #Cached strips the device no longer has.
+						del strips[id]
+		except:
+			entry = None
+
+		device.bootTimeout = reset_boot_timeout #Later reconnects wait as usual.
+
+		return entry
+
+	# resolve
+	#
+	# @message, (key, result) from serve()
+	def resolve(self, message):
+		key, result = message
+
+		if key == "ready":
+			self.identity = result
+			self.ready.set()
+			return
+
+		if key == "verified":
+			if result and result["identity"]:
+				self.identity = result["identity"]
+
+			if self.onVerified:
+				self.onVerified(self, result)
+
+			return
+
+		with self.pendingLock:
+			future = self.pending.pop(key, None)
+
+		if future:
+			future.set_result(result)
+
+	# submit
+	#
+	# @kind, "device", "mhconfig", "neopixel" or "digital"
+	# @method, method name on that instance
+	# @ret, aumhFuture for the method's return value
+	def submit(self, kind, method, args=(), kwargs=None):
+		future = aumhFuture()
+		key = next(self.keys)
+
+		with self.pendingLock:
+			self.pending[key] = future
+
+		self.put((key, kind, method, tuple(args), kwargs or {}))
+
+		return future
+
+	def logConfigure(self, logfile=None):
+		if self.logmethod == "logger":
+			if not logfile:
+				print("aumhPortWorker.logConfigure() called as logger type without filename for log.")
+				sys.exit(1)
+
+			self.logger = logging.getLogger("aumhManager")
+			self.logger.setLevel(logging.INFO)
+			if [ handler for handler in self.logger.handlers if getattr(handler, "baseFilename", None) == os.path.abspath(logfile) ]:
+				return #The manager and its workers share the logger, one handler per file.
+
+			self.logformatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+			self.loghandler = logging.FileHandler(logfile)
+			self.loghandler.setFormatter(self.logformatter)
+			self.logger.addHandler(self.loghandler)
+
+	def log(self, data, mode=None):
+		if not self.logmethod or self.logmethod == "print":
+			print(data)
+		elif self.logmethod == "logger":
+			if mode == "err":
+				self.logger.error(data)
+			elif mode == "warn":
+				self.logger.warning(data)
+			elif mode == "crit":
+				self.logger.critical(data)
+			else: #Mode is info or something else.
+				self.logger.info(data)
+
+# aumhThreadWorker
+#
+#  Worker thread per port.  Serial I/O releases the GIL, so ports wait on
+# their devices in parallel; encoding still shares one interpreter.
+class aumhThreadWorker(aumhPortWorker):
+	def start(self):
+		self.requests = queue.Queue()
+		self.thread = threading.Thread(target=self.serve, args=(self.requests, self.resolve))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def put(self, item):
+		self.requests.put(item)
+
+	def stop(self, timeout=None):
+		self.requests.put(None)
+		self.thread.join(timeout)
+
+# aumhProcessWorker
+#
+#  Worker process per port, nothing is shared with the caller's interpreter.
+# Arguments and results cross a process boundary so they have to pickle
+# (Use the blocking calls, not the wait=False/async ones.)  A collector
+# thread in the parent resolves the futures.
+class aumhProcessWorker(aumhPortWorker):
+	def start(self):
+		self.requests = multiprocessing.Queue()
+		self.replies = multiprocessing.Queue()
+
+		self.process = multiprocessing.Process(target=self.serve, args=(self.requests, self.replies.put))
+		self.process.daemon = True
+		self.process.start()
+
+		self.collector = threading.Thread(target=self.collect)
+		self.collector.daemon = True
+		self.collector.start()
+
+	def collect(self):
+		while True:
+			message = self.replies.get()
+			if message is None:
+				break
+
+			self.resolve(message)
+
+	def put(self, item):
+		self.requests.put(item)
+
+	def stop(self, timeout=None):
+		self.requests.put(None)
+		self.process.join(timeout)
+		if self.process.is_alive():
+			self.process.terminate()
+
+		self.replies.put(None)
+		self.collector.join(timeout)
+
+managerWorkers = {
+	MANAGER_THREAD:aumhThreadWorker,
+	MANAGER_PROCESS:aumhProcessWorker,
+}
+
+# aumhManager
+#
+#  Owns any number of serial ports, one worker each.  Once a worker has
+# done the config handshake its device is addressed by identityS:
+#
+#  manager = aumhManager([ "/dev/ttyUSB0", "/dev/ttyUSB1" ], mode=MANAGER_PROCESS)
+#  manager.wait()
+#  manager.call("00c0ffe1", "neopixel", "np_set_bulk", 0, leds)
+#  futures = manager.broadcast("digital", "digi_manage")
+class aumhManager(object):
+	def __init__(self, ports=None, mode=MANAGER_THREAD, baud=None, logmethod=None, logfile=None, cache=None):
+		self.logmethod = logmethod
+		self.logfile = logfile
+		self.logConfigure(logfile)
+
+		if mode not in managerWorkers:
+			self.log("aumhManager, unknown worker mode '%s'." % str(mode), "crit")
+			sys.exit(1)
+
+		self.mode = mode
+		self.baud = baud
+		self.cache = cache #aumhTopologyCache, or None.
+
+		self.workers = {} #port:worker
+
+		for port in ports or []:
+			self.addPort(port)
+
+	def logConfigure(self, logfile=None):
+		if self.logmethod == "logger":
+			if not logfile:
+				print("aumhManager.logConfigure() called as logger type without filename for log.")
+				sys.exit(1)
+
+			self.logger = logging.getLogger("aumhManager")
+			self.logger.setLevel(logging.INFO)
+			if [ handler for handler in self.logger.handlers if getattr(handler, "baseFilename", None) == os.path.abspath(logfile) ]:
+				return #The manager and its workers share the logger, one handler per file.
+
+			self.logformatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+			self.loghandler = logging.FileHandler(logfile)
+			self.loghandler.setFormatter(self.logformatter)
+			self.logger.addHandler(self.loghandler)
+
+	def log(self, data, mode=None):
+		if not self.logmethod or self.logmethod == "print":
+			print(data)
+		elif self.logmethod == "logger":
+			if mode == "err":
+				self.logger.error(data)
+			elif mode == "warn":
+				self.logger.warning(data)
+			elif mode == "crit":
+				self.logger.critical(data)
+			else: #Mode is info or something else.
+				self.logger.info(data)
+
+	# addPort
+	#
+	# @port, serial device path
+	# @instances, kind:instance dict for the port from discover(keep=True)
+	# @ret, the port's worker (Already started.)
+	def addPort(self, port, instances=None):
+		if port in self.workers:
+			return self.workers[port]
+
+		cached = None
+		if self.cache and not instances:
+			cached = self.cache.get(port)
+
+		worker = managerWorkers[self.mode](port, self.baud, self.logmethod, self.logfile, instances, cached, self.cache is not None and not instances)
+		worker.onVerified = self.verified
+		worker.start()
+		self.workers[port] = worker
+
+		return worker
+
+	# discover
+	#
+	# Runs discover() (Same arguments) and adds every port that answered.  In
+	# thread mode the probed ports are handed straight to the workers, so the
+	# boards aren't reset and handshaken a second time.
+	#
+	# @ret, the discover() registry
+	def discover(self, patterns=None, ports=None, attempts=discovery_attempts, retryDelay=discovery_retry_delay):
+		keep = self.mode == MANAGER_THREAD
+		registry = discover(patterns, ports, self.baud, attempts, retryDelay, keep, self.logmethod, self.logfile, self.log)
+
+		workers = []
+		for identity, entry in registry.items():
+			workers.append(self.addPort(entry["port"], entry.pop("instances", None)))
+
+			if self.cache:
+				self.cache.put(entry, False)
+
+		if self.cache and registry:
+			self.cache.save()
+
+		for worker in workers: #Routing needs their identities.
+			worker.ready.wait(manager_ready_timeout)
+
+		return registry
+
+	# verified
+	#
+	# @worker, the worker which checked its device
+	# @entry, what the device reported (None if it didn't answer.)
+	#
+	#  Keeps the cache in line with the devices.  An entry is only thrown away
+	# when a different identity answers on its port, the fresh one replaces it.
+	def verified(self, worker, entry):
+		if not self.cache:
+			return
+
+		if not entry or not entry["identity"]:
+			self.log("aumhManager, unable to verify the device on %s, keeping its cache entry." % str(worker.port), "warn")
+			return
+
+		cached = self.cache.get(worker.port)
+		if cached and cached["identity"] != entry["identity"]:
+			self.log("aumhManager, %s was cached as %s but is %s." % (str(worker.port), cached["identity"], entry["identity"]), "warn")
+			self.cache.invalidate(worker.port, False)
+
+		self.cache.put(entry)
+
+	# removePort
+	#
+	# @port, serial device path
+	def removePort(self, port, timeout=None):
+		worker = self.workers.pop(port, None)
+		if worker:
+			worker.stop(timeout)
+
+	# wait
+	#
+	# @timeout, seconds to wait for every worker to finish its handshake
+	# @ret, identities() once every worker is up (Or the timeout passed.)
+	def wait(self, timeout=manager_ready_timeout):
+		deadline = time.time() + timeout
+		for worker in list(self.workers.values()):
+			worker.ready.wait(max(0, deadline - time.time()))
+
+		return self.identities()
+
+	# identities
+	#
+	# @ret, dict of identityS:port for every worker which has one.
+	def identities(self):
+		return dict((worker.identity, port) for port, worker in self.workers.items() if worker.identity)
+
+	# worker
+	#
+	# @identity, identityS
+	# @ret, the worker driving that device, or None (Also until it's ready.)
+	def worker(self, identity):
+		for worker in self.workers.values():
+			if worker.identity == identity:
+				return worker
+
+		return None
+
+	# submit
+	#
+	# @identity, identityS of the target device
+	# @kind, "device", "mhconfig", "neopixel" or "digital"
+	# @method, method to call on that instance
+	# @ret, aumhFuture for the result, resolved with None for unknown devices.
+	def submit(self, identity, kind, method, *args, **kwargs):
+		worker = self.worker(identity)
+		if not worker:
+			future = aumhFuture()
+			future.set_result(None)
+			return future
+
+		return worker.submit(kind, method, args, kwargs)
+
+	# call
+	#
+	# Blocking submit(), same arguments, returns the method's result.
+	#
+	# @timeout, keyword only, seconds to wait for the worker's reply
+	#  (manager_reply_timeout.)  None is returned and the failure logged when
+	#  it passes, the call itself may still be made later.
+	def call(self, identity, kind, method, *args, **kwargs):
+		timeout = kwargs.pop("timeout", manager_reply_timeout)
+
+		future = self.submit(identity, kind, method, *args, **kwargs)
+		result = future.result(timeout)
+		if not future.done():
+			self.log("aumhManager.call(), %s.%s on %s got no reply within %s seconds." % (str(kind), str(method), str(identity), str(timeout)), "err")
+
+		return result
+
+	# broadcast
+	#
+	# @ret, dict of identityS:aumhFuture, the call is made on every device.
+	def broadcast(self, kind, method, *args, **kwargs):
+		return dict((identity, self.submit(identity, kind, method, *args, **kwargs)) for identity in self.identities())
+
+	# stop
+	#
+	# Stops every worker.
+	def stop(self, timeout=None):
+		for port in list(self.workers):
+			self.removePort(port, timeout)
+
+# manageEntries
+#
+# @decode, neopixelManageEntries or digitalManageEntries
+# @raw, the manage call's output
+# @ret, decoded entries, [] for anything but a proper response.
+def manageEntries(decode, raw):
+	if not isinstance(raw, str) or raw.startswith("NAK"):
+		return []
+
+	try:
+		return decode(raw)
+	except:
+		return []
+
+# closeInstances
+#
+# @instances, kind:instance dict for a port (Possibly empty.)
+#
+#  Closes the port's serial device, if there is one.
+def closeInstances(instances):
+	try:
+		instances["device"].ser.close()
+	except:
+		pass
+
+# readTopology
+#
+# @port, serial device path
+# @instances, kind:instance dict for the port
+# @handshake, redo the cfg_manage handshake first
+# @ret, registry entry for the port (identity is None if the handshake failed.)
+def readTopology(port, instances, handshake=False):
+	device = instances["device"]
+
+	if handshake and not instances["mhconfig"].cfg_manage():
+		return { "port":port, "identity":None }
+
+	return {
+		"port":port,
+		"identity":device.identityS,
+		"type":device.type,
+		"strips":manageEntries(neopixelManageEntries, instances["neopixel"].np_manage()),
+		"pins":manageEntries(digitalManageEntries, instances["digital"].digi_manage()),
+	}
+
+# applyTopology
+#
+# @instances, kind:instance dict for the port
+# @entry, registry/cache entry
+#
+#  Sets the device up as the entry describes without talking to it.
+def applyTopology(instances, entry):
+	device = instances["device"]
+	device.identityS = str(entry["identity"]) #JSON hands back unicode on Python 2.
+	device.identity = int(device.identityS, 16)
+	device.type = entry.get("type")
+
+	for strip in entry.get("strips") or []:
+		instances["neopixel"].setStrand(strip["id"], strip["pin"], strip["length"])
+
+	for pin in entry.get("pins") or []:
+		instances["digital"].pins[pin["pin"]] = dict(pin)
+
+# dropTopology
+#
+# @instances, kind:instance dict for the port
+#
+#  Forgets the strips and pins applyTopology() set up.
+def dropTopology(instances):
+	instances["neopixel"].strips.clear()
+	instances["digital"].pins.clear()
+
+# probePort
+#
+# @port, serial device path
+# @keep, leave the port open and add its instances to the entry
+# @ret, registry entry, or None if no firmware answered.
+#
+#  Opens the port (aumh waits for the board to boot), does the cfg_manage
+# handshake and reads the strip and pin layout.
+def probePort(port, baud=None, attempts=discovery_attempts, retryDelay=discovery_retry_delay, keep=False, logmethod=None, logfile=None):
+	device = aumh(port, baud, logmethod, logfile)
+
+	if device.resetStats["failures"]:
+		return None
+
+	instances = {
+		"device":device,
+		"mhconfig":aumhConfig(device, logmethod, logfile, attempts, retryDelay),
+		"neopixel":aumhNeopixel(device, logmethod, logfile),
+		"digital":aumhDigital(device, logmethod, logfile),
+	}
+
+	entry = None
+
+	if getattr(device, "identityS", None):
+		entry = readTopology(port, instances)
+
+		if keep:
+			entry["instances"] = instances
+			return entry
+
+	try:
+		device.ser.close()
+	except:
+		pass
+
+	return entry
+
+# discover
+#
+# @patterns, glob patterns for candidate ports (discovery_patterns)
+# @ports, explicit port list, used instead of the patterns
+# @log, callable(data, mode) for failed probes and duplicate identities
+#  (Default print, aumhManager.discover passes its log.)
+# @ret, registry dict of identityS:entry, see probePort()
+#
+#  Every candidate is probed at the same time on its own thread, so a cold
+# start costs about as much as the slowest port rather than all of them.
+# Ports which don't answer are left out.
+def discover(patterns=None, ports=None, baud=None, attempts=discovery_attempts, retryDelay=discovery_retry_delay, keep=False, logmethod=None, logfile=None, log=None):
+	if log is None:
+		log = lambda data, mode=None: print(data)
+
+	if ports is None:
+		ports = sorted(set(sum([ glob.glob(pattern) for pattern in (patterns or discovery_patterns) ], [])))
+
+	found = {}
+
+	def probe(port):
+		try:
+			found[port] = probePort(port, baud, attempts, retryDelay, keep, logmethod, logfile)
+		except:
+			log("discover(), probing %s failed: %s" % (str(port), str(sys.exc_info()[1])), "err")
+
+	threads = [ threading.Thread(target=probe, args=(port,)) for port in ports ]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	registry = {}
+	for port in ports:
+		entry = found.get(port)
+		if not entry:
+			continue
+
+		if entry["identity"] in registry:
+			log("discover(), identity %s answered on both %s and %s." % (entry["identity"], registry[entry["identity"]]["port"], port), "warn")
+			continue
+
+		registry[entry["identity"]] = entry
+
+	return registry
@@ -0,0 +1,246 @@
+###############################################################################
+#                               aumhMapping.py                                #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the 2D mapping layer, LED matrices built from serpentine and       #
+#  rotated strand segments, possibly on several devices.  Index tables are    #
+#  worked out once so every frame is split onto the strands with a single     #
+#  gather.                                                                    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+try:
+	import numpy as np
+except ImportError:
+	np = None #Images are lists of rows of [r, g, b].
+
+from aumh import *
+
+# segmentPositions
+#
+# @width, segment width in the image
+# @height, segment height in the image
+# @order, "rows" when the strand runs along rows first, "columns" for
+#  columns first (Before rotation.)
+# @serpentine, every other row (Or column) runs back the other way
+# @rotate, 0, 90, 180 or 270, clockwise
+# @flip, mirror left to right (After rotation.)
+# @ret, list of (x, y) inside the segment, one per strand pixel in order.
+#
+#  The strand is wired over a grid which, turned by rotate, covers width x
+# height; for 90 and 270 that grid is height wide and width high.
+def segmentPositions(width, height, order="rows", serpentine=True, rotate=0, flip=False):
+	if rotate not in (0, 90, 180, 270):
+		raise ValueError("rotate must be 0, 90, 180 or 270")
+
+	if order not in ("rows", "columns"):
+		raise ValueError("order must be rows or columns")
+
+	gridW, gridH = (height, width) if rotate in (90, 270) else (width, height)
+
+	out = []
+	for k in range(0, width * height):
+		if order == "rows":
+			row, col = divmod(k, gridW)
+			if serpentine and row & 1:
+				col = gridW - 1 - col
+		else:
+			col, row = divmod(k, gridH)
+			if serpentine and col & 1:
+				row = gridH - 1 - row
+
+		if rotate == 0:
+			x, y = col, row
+		elif rotate == 90:
+			x, y = gridH - 1 - row, col
+		elif rotate == 180:
+			x, y = gridW - 1 - col, gridH - 1 - row
+		else:
+			x, y = row, gridW - 1 - col
+
+		if flip:
+			x = width - 1 - x
+
+		out.append((x, y))
+
+	return out
+
+# aumhMapping
+#
+#  A width x height image laid over strand segments.  Each segment is a
+# rectangle of the image wired as one run of a strand, from a pixel offset
+# on it, and strands may be on different devices (Any aumhNeopixel.)
+#
+#  build() turns the segments into gather, the image pixel for every strand
+# pixel of every segment back to back, and spans, where each segment's part
+# of that goes on its strand.  show() then takes the image's pixels in one
+# indexing operation, copies the spans into the strand framebuffers and
+# commits every strand; capture() scatters the framebuffers back into an
+# image the same way.
+#
+#  mapping = aumhMapping(32, 16)
+#  mapping.addSegment(neopixelA, 0, x=0, width=16, height=16, rotate=90)
+#  mapping.addSegment(neopixelB, 0, x=16, width=16, height=16, rotate=90)
+#  mapping.show(image) #16 x 32 x 3
+class aumhMapping(object):
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.segments = []
+		self.gather = None
+
+	# addSegment
+	#
+	# @neopixel, aumhNeopixel the strand is on
+	# @id, strand id
+	# @x, @y, the segment's top left corner in the image
+	# @width, @height, segment size (Default the rest of the image.)
+	# @offset, strand pixel the segment starts at
+	# @order, @serpentine, @rotate, @flip, see segmentPositions
+	def addSegment(self, neopixel, id, x=0, y=0, width=None, height=None, offset=0, order="rows", serpentine=True, rotate=0, flip=False):
+		width = self.width - x if width is None else width
+		height = self.height - y if height is None else height
+
+		if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > self.width or y + height > self.height:
+			raise ValueError("segment %dx%d at %d,%d is outside the %dx%d image" % (width, height, x, y, self.width, self.height))
+
+		strand = neopixel.strand(id)
+		if strand is None:
+			raise ValueError("unknown strand %s" % str(id))
+
+		if offset < 0 or offset + width * height > strand.length:
+			raise ValueError("segment needs pixels %d-%d of strand %s, it has %d" % (offset, offset + width * height - 1, str(id), strand.length))
+
+		positions = [ (y + py) * self.width + x + px for px, py in segmentPositions(width, height, order, serpentine, rotate, flip) ]
+		self.segments.append((neopixel, id, offset, positions))
+		self.gather = None
+
+	# build
+	#
+	#  Works out gather, spans (Each segment's strand, offset and (first, last)
+	# in gather) and the distinct strands to commit.  Strands are looked up
+	# again on every frame, so one which is resized keeps its segments and one
+	# which is deleted fails its commit.
+	def build(self):
+		gather = []
+		self.spans = []
+		self.strands = []
+
+		for neopixel, id, offset, positions in self.segments:
+			self.spans.append((neopixel, id, offset, len(gather), len(gather) + len(positions)))
+			gather.extend(positions)
+
+			if (neopixel, id) not in self.strands:
+				self.strands.append((neopixel, id))
+
+		if np is not None:
+			self.gather = np.asarray(gather, dtype=np.intp)
+			self.staging = np.empty((len(gather), 3), dtype=np.uint8)
+		else:
+			self.gather = gather
+
+	# flatten
+	#
+	# @image, height x width x 3 array or list of rows of [r, g, b]
+	# @ret, (height * width) x 3 array (List of [r, g, b] without numpy.)
+	def flatten(self, image):
+		if np is not None:
+			image = np.asarray(image, dtype=np.uint8)
+			if image.shape != (self.height, self.width, 3):
+				raise ValueError("image is %s, the mapping is %dx%d" % (str(image.shape), self.width, self.height))
+
+			return image.reshape(-1, 3)
+
+		if len(image) != self.height or [ row for row in image if len(row) != self.width ]:
+			raise ValueError("image isn't %dx%d" % (self.width, self.height))
+
+		return [ pixel for row in image for pixel in row ]
+
+	# show
+	#
+	# @image, height x width x 3 array or list of rows of [r, g, b]
+	# @wait, when False the commits are submitted and an aumhFuture returned
+	# @ret, 0 or the first non-zero np_commit return (Or the future, already
+	#  completed when there are no segments.)
+	def show(self, image, wait=True):
+		if self.gather is None:
+			self.build()
+
+		flat = self.flatten(image)
+
+		if np is not None:
+			values = np.take(flat, self.gather, axis=0, out=self.staging)
+		else:
+			values = [ flat[i] for i in self.gather ]
+
+		for neopixel, id, offset, first, last in self.spans:
+			strand = neopixel.strand(id)
+			if strand is not None:
+				strand.put(offset, values[first:last])
+
+		if not wait:
+			return aumhFuture.combine([ neopixel.np_commit(id, wait=False) for neopixel, id in self.strands ])
+
+		ret = 0
+		for neopixel, id in self.strands:
+			ret = neopixel.np_commit(id) or ret
+
+		return ret
+
+	# capture
+	#
+	# @ret, height x width x 3 uint8 array of what the strand framebuffers
+	#  hold (List of rows without numpy), unmapped pixels black.
+	def capture(self):
+		if self.gather is None:
+			self.build()
+
+		if np is not None:
+			flat = np.zeros((self.height * self.width, 3), dtype=np.uint8)
+		else:
+			flat = [ [ 0, 0, 0 ] for i in range(0, self.height * self.width) ]
+
+		for neopixel, id, offset, first, last in self.spans:
+			strand = neopixel.strand(id)
+			if strand is None:
+				continue
+
+			count = max(0, min(last - first, strand.length - offset)) #It may have shrunk since.
+			if np is not None:
+				flat[self.gather[first:first + count]] = strand.pixels[offset:offset + count]
+				continue
+
+			for k in range(0, count):
+				flat[self.gather[first + k]] = strand.color(offset + k)
+
+		if np is not None:
+			return flat.reshape(self.height, self.width, 3)
+
+		return [ flat[row * self.width:(row + 1) * self.width] for row in range(0, self.height) ]
+
+# mappingFromDescription
+#
+# @description, dict { "width", "height", "segments":[ { "device", "strand",
+#  and addSegment's keyword arguments } ] } (As read from a JSON file.)
+# @neopixels, dict of device:aumhNeopixel, the devices segments name
+# @ret, the aumhMapping, ValueError for unknown devices or bad segments.
+def mappingFromDescription(description, neopixels):
+	mapping = aumhMapping(int(description["width"]), int(description["height"]))
+
+	for segment in description["segments"]:
+		segment = dict((str(key), value) for key, value in segment.items())
+		device = segment.pop("device", None)
+		if device not in neopixels:
+			raise ValueError("segment on unknown device %s" % str(device))
+
+		mapping.addSegment(neopixels[device], segment.pop("strand"), **segment)
+
+	return mapping
@@ -0,0 +1,306 @@
+###############################################################################
+#                               aumhMetrics.py                                #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the per-device metrics registry, counters and latency histograms   #
+#  cheap enough to leave on all the time.                                     #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import bisect
+import itertools
+import threading
+import collections
+
+# Histogram bucket upper bounds in seconds, 100us doubling up to ~13s.  The
+# last bucket catches everything above.
+histogram_bounds = [ 0.0001 * (2 ** i) for i in range(0, 18) ]
+
+# Send pipeline stages reported to stage hooks (aumh.addStageHook), in order.
+#
+#  build, createMessage
+#  lock, scheduler/semaphore wait
+#  write, writing the frame (Fragment replies included)
+#  firstByte, from the last byte written until the first response byte
+#  drain, the rest of the response
+#  decode, turning the response into a return value
+stageNames = ("build", "lock", "write", "firstByte", "drain", "decode")
+
+# aumhCells
+#
+#  Lock-free accumulator.  Every thread adds into its own cell (A list only
+# it writes to) so updates need no lock and can't race.  The lock is only
+# taken the first time a thread touches the instance and when reading, at
+# which point cells of threads which have exited are folded into retired.
+class aumhCells(object):
+	def __init__(self, width):
+		self.width = width
+		self.local = threading.local()
+		self.lock = threading.Lock()
+		self.cells = [] #(thread, cell)
+		self.retired = [ 0 ] * width
+
+	# cell
+	#
+	# @ret, the calling thread's cell
+	def cell(self):
+		try:
+			return self.local.cell
+		except AttributeError:
+			cell = [ 0 ] * self.width
+			self.local.cell = cell
+			with self.lock:
+				self.cells.append((threading.current_thread(), cell))
+
+			return cell
+
+	# totals
+	#
+	# @ret, list with the sum of every cell.
+	def totals(self):
+		with self.lock:
+			out = list(self.retired)
+			live = []
+
+			for thread, cell in self.cells:
+				values = list(cell)
+				for i in range(0, self.width):
+					out[i] += values[i]
+
+				if thread.is_alive():
+					live.append((thread, cell))
+				else: #Nothing will write to it again.
+					for i in range(0, self.width):
+						self.retired[i] += values[i]
+
+			self.cells = live
+
+		return out
+
+# aumhCounter
+class aumhCounter(aumhCells):
+	def __init__(self):
+		aumhCells.__init__(self, 1)
+
+	def add(self, count=1):
+		self.cell()[0] += count
+
+	def value(self):
+		return self.totals()[0]
+
+# aumhHistogram
+#
+#  Fixed bucket histogram (histogram_bounds), the last cell holds the sum of
+# every observed value.
+class aumhHistogram(aumhCells):
+	def __init__(self, bounds=histogram_bounds):
+		self.bounds = bounds
+		aumhCells.__init__(self, len(bounds) + 2)
+
+	# observe
+	#
+	# @value, seconds
+	def observe(self, value):
+		cell = self.cell()
+		cell[bisect.bisect_left(self.bounds, value)] += 1
+		cell[-1] += value
+
+	# snapshot
+	#
+	# @ret, dict of count, sum, mean, bucket estimated p50/p95/p99 and the
+	#  non-empty buckets keyed by upper bound ("inf" for the overflow.)
+	def snapshot(self):
+		totals = self.totals()
+		buckets = totals[:-1]
+		count = sum(buckets)
+
+		out = {
+			"count":count,
+			"sum":totals[-1],
+			"mean":(totals[-1] / count) if count else None,
+			"buckets":dict((self.boundName(i), buckets[i]) for i in range(0, len(buckets)) if buckets[i]),
+		}
+
+		for pct in (50, 95, 99):
+			out["p%d" % pct] = self.quantile(buckets, count, pct / 100.0)
+
+		return out
+
+	def boundName(self, idx):
+		if idx < len(self.bounds):
+			return "%g" % self.bounds[idx]
+
+		return "inf"
+
+	# quantile
+	#
+	# @ret, upper bound of the bucket holding the quantile (None if empty.)
+	def quantile(self, buckets, count, q):
+		if not count:
+			return None
+
+		rank = q * count
+		seen = 0
+		for i in range(0, len(buckets)):
+			seen += buckets[i]
+			if seen >= rank:
+				return self.bounds[i] if i < len(self.bounds) else float("inf")
+
+		return float("inf")
+
+# aumhMetrics
+#
+#  Named counters and histograms for one device.  Counters and histograms
+# are created on first use.  Command latencies are kept per (command,
+# subcommand) and named with commandNames where possible.
+#
+#  Counters aumh maintains:
+#
+#  framesSent, bytesSent, bytesReceived, responses, fragmentsSent,
+#  fragRetransmits, naks, timeouts, errors, resets, reconnects, resetFailures
+#
+#  and aumhNeopixel.np_commit(): commits, commit_sparse, commit_clear,
+#  commit_full, commitPixels, np_gradient(): gradientsSkipped and
+#  aumhEffectPlayer: effectReplays
+#
+#  Histograms: lockWait (Scheduler/semaphore wait) and one per command.
+class aumhMetrics(object):
+	def __init__(self, commandNames=None):
+		self.lock = threading.Lock()
+		self.counters = {}
+		self.histograms = {}
+		self.commands = {}
+		self.commandNames = dict(commandNames or {})
+
+	# counter
+	#
+	# @name, counter name
+	# @ret, aumhCounter, created if needed
+	def counter(self, name):
+		counter = self.counters.get(name)
+		if counter is None:
+			with self.lock:
+				counter = self.counters.setdefault(name, aumhCounter())
+
+		return counter
+
+	# histogram
+	#
+	# @name, histogram name
+	# @ret, aumhHistogram, created if needed
+	def histogram(self, name):
+		histogram = self.histograms.get(name)
+		if histogram is None:
+			with self.lock:
+				histogram = self.histograms.setdefault(name, aumhHistogram())
+
+		return histogram
+
+	def add(self, name, count=1):
+		self.counter(name).add(count)
+
+	def observe(self, name, value):
+		self.histogram(name).observe(value)
+
+	# command
+	#
+	# @view, frame view (The header is all that's read.)
+	# @elapsed, seconds the command took
+	# @result, what the send returned, non-zero ints count as errors.
+	def command(self, view, elapsed, result=0):
+		key = frameCommand(view)
+
+		histogram = self.commands.get(key)
+		if histogram is None:
+			with self.lock:
+				histogram = self.commands.setdefault(key, aumhHistogram())
+
+		histogram.observe(elapsed)
+
+		if isinstance(result, int) and result:
+			self.add("errors")
+
+	# commandName
+	#
+	# @key, (cmd, scmd)
+	# @ret, "<command>.0x<scmd>"
+	def commandName(self, key):
+		return "%s.0x%02x" % (self.commandNames.get(key[0], "0x%04x" % key[0]), key[1])
+
+	# snapshot
+	#
+	# @ret, dict with every counter value and histogram summary.
+	def snapshot(self):
+		with self.lock:
+			counters = list(self.counters.items())
+			histograms = list(self.histograms.items())
+			commands = list(self.commands.items())
+
+		return {
+			"counters":dict((name, counter.value()) for name, counter in counters),
+			"histograms":dict((name, histogram.snapshot()) for name, histogram in histograms),
+			"commands":dict((self.commandName(key), histogram.snapshot()) for key, histogram in commands),
+		}
+
+# aumhStageRecorder
+#
+#  Sampling stage hook.  Every 'every'th event of a stage goes into that
+# stage's histogram and the 'recent' most recent samples are kept as
+# (time, stage, seconds, command) for looking at individual stutters.
+#
+#  recorder = aumhStageRecorder(every=10)
+#  device.addStageHook(recorder)
+#  ...
+#  device.removeStageHook(recorder)
+class aumhStageRecorder(object):
+	def __init__(self, every=1, recent=256):
+		self.every = max(1, every)
+		self.histograms = dict((stage, aumhHistogram()) for stage in stageNames)
+		self.events = dict((stage, itertools.count()) for stage in stageNames) #next() on a count is atomic.
+		self.recent = collections.deque(maxlen=recent)
+
+	def __call__(self, stage, seconds, frame):
+		histogram = self.histograms.get(stage)
+		if histogram is None:
+			return
+
+		if self.every > 1 and next(self.events[stage]) % self.every:
+			return
+
+		histogram.observe(seconds)
+		self.recent.append((time.time(), stage, seconds, frameCommand(frame)))
+
+	# snapshot
+	#
+	# @ret, dict with a histogram snapshot per stage and the recent samples.
+	def snapshot(self):
+		return {
+			"stages":dict((stage, self.histograms[stage].snapshot()) for stage in stageNames),
+			"recent":list(self.recent),
+		}
+
+# frameCommand
+#
+# @frame, aumhFrame, frame view or None
+# @ret, (cmd, scmd) or None
+def frameCommand(frame):
+	if frame is None:
+		return None
+
+	if hasattr(frame, "cmd"):
+		return (frame.cmd, frame.scmd)
+
+	key = (frame[2], frame[3], frame[4])
+	if isinstance(key[0], str): #Python 2 memoryviews index to str.
+		key = tuple([ ord(x) for x in key ])
+
+	return (key[0] | (key[1] << 8), key[2])
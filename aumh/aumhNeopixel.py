@@ -21,24 +21,280 @@ import sys
 import struct
 import time
 import socket
-import colorsys
 import logging
 
+try:
+	import numpy as np
+except ImportError:
+	np = None #Strand framebuffers are still kept, just without the array views.
+
 from aumh import *
 from aumh import isInt
 from aumh import to_bytes
 from aumh import listOverlay
 from aumh import aumh
+from aumhColor import gradient
+from aumhColor import aumhLRU
 
 DEBUG=0
 
-#FIXME, the self.strips var should use this rather than the multilevel dictionary for cleanliness.
+#Pixel index (little endian), red, green, blue; one per led in a ctrl message.
+pixelStruct = struct.Struct("<HBBB")
+
+#Pin, length (little endian); the add message body.
+strandAddStruct = struct.Struct("<BH")
+
+#Most leds a single ctrl/ctrli message can carry (header, strand id, pixels.)
+maxFramePixels = (arduino_max_frags * arduino_frag_size - headerStruct.size - 1) // pixelStruct.size
+
+#Most leds a ctrl message can carry while exactly filling its last fragment.
+alignedFramePixels = max([ n for n in range(1, maxFramePixels + 1) if (headerStruct.size + 1 + n * pixelStruct.size) % arduino_frag_size == 0 ] or [ maxFramePixels ])
+
+#Computed gradients (N x 3 arrays) by parameters, shared by every instance.
+gradientCache = aumhLRU()
+
+# neopixelManageEntries
+#
+# @data, neopixel manage response
+# @ret, list of { "id", "pin", "length" } dicts, one per strand.
+def neopixelManageEntries(data):
+	out = []
+	count = struct.unpack("<B", data[0])[0]
+
+	for i in range(0, count):
+		relI = i * 4
+		pID = struct.unpack(">B", data[1+relI])[0]
+		pin = struct.unpack(">B", data[2+relI])[0]
+		length = struct.unpack(">H", data[3+relI:5+relI])[0]
+		out.append({ "id":pID, "pin":pin, "length":length })
+
+	return out
+
+# commitBytes
+#
+# @count, pixels to send
+# @ret, bytes the ctrl messages for them take (np_commit's cost estimate.)
+def commitBytes(count):
+	messages = (count + alignedFramePixels - 1) // alignedFramePixels
+	return count * pixelStruct.size + messages * (headerStruct.size + 1)
+
+# StrandInfo
+#
+#  Host side copy of a strand, what we believe its pixels are.  buf holds r,g,b
+# for every pixel back to back and dirtyBuf a byte per pixel, set for pixels
+# written here which haven't been sent since.  With numpy, pixels (N x 3
+# uint8) and dirty (N bool) are array views over that same memory so pixel
+# math can be done on whole strands; without it they're None.
+#
+#  ackBuf (acked with numpy) is the last frame the strand acknowledged, it's
+# what np_commit() diffs against.  synced is False while we don't know what
+# the strand shows (Learned through manage or a cache), the first commit then
+# rewrites every pixel.
 class StrandInfo:
-	def __init__(self, id, pin, length):
+	def __init__(self, id, pin, length, synced=True):
 		self.id = id
 		self.pin = pin
-		self.length = length
-		self.pixels = {}
+		self.length = length or 0
+		self.synced = synced
+
+		self.buf = bytearray(self.length * 3)
+		self.dirtyBuf = bytearray(self.length)
+		self.ackBuf = bytearray(self.length * 3)
+
+		self.pixels = None
+		self.dirty = None
+		self.acked = None
+		if np is not None:
+			self.pixels = np.frombuffer(self.buf, dtype=np.uint8).reshape(self.length, 3)
+			self.dirty = np.frombuffer(self.dirtyBuf, dtype=np.bool_)
+			self.acked = np.frombuffer(self.ackBuf, dtype=np.uint8).reshape(self.length, 3)
+
+	# resized
+	#
+	# @length, new strand length
+	# @ret, StrandInfo of that length holding as much of this one as fits.
+	def resized(self, length):
+		out = StrandInfo(self.id, self.pin, length, self.synced)
+		count = min(self.length, out.length)
+		out.buf[0:count * 3] = self.buf[0:count * 3]
+		out.dirtyBuf[0:count] = self.dirtyBuf[0:count]
+		out.ackBuf[0:count * 3] = self.ackBuf[0:count * 3]
+
+		return out
+
+	# color
+	#
+	# @index, pixel
+	# @ret, [r, g, b]
+	def color(self, index):
+		return list(self.buf[index * 3:index * 3 + 3])
+
+	# put
+	#
+	# @start, first pixel
+	# @colors, N x 3 array or list of [r, g, b], written from start on
+	def put(self, start, colors):
+		if self.pixels is not None:
+			colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)[:max(0, self.length - start)]
+			self.pixels[start:start + len(colors)] = colors
+			self.dirty[start:start + len(colors)] = True
+			return
+
+		for color in colors:
+			if start >= self.length:
+				break
+
+			self.buf[start * 3:start * 3 + 3] = bytearray([ int(color[0]) & 0xff, int(color[1]) & 0xff, int(color[2]) & 0xff ])
+			self.dirtyBuf[start] = 1
+			start += 1
+
+	# putBytes
+	#
+	# @start, first pixel
+	# @raw, r,g,b bytes back to back, written from start on (Pixels past the
+	#  end are ignored.)
+	def putBytes(self, start, raw):
+		count = max(0, min(len(raw) // 3, self.length - start))
+		self.buf[start * 3:(start + count) * 3] = raw[0:count * 3]
+		self.dirtyBuf[start:start + count] = b"\x01" * count
+
+	# putIndices
+	#
+	# @start, first pixel
+	# @palette, 256 x 3 uint8 array (List of 256 r,g,b byte strings without
+	#  numpy, see aumhClip.)
+	# @indices, palette index per pixel, uint8 array or bytearray
+	def putIndices(self, start, palette, indices):
+		count = max(0, min(len(indices), self.length - start))
+
+		if self.pixels is not None:
+			np.take(palette, indices[0:count], axis=0, out=self.pixels[start:start + count], mode="clip")
+			self.dirty[start:start + count] = True
+			return
+
+		self.putBytes(start, b"".join([ palette[i] for i in indices[0:count] ]))
+
+	# putLeds
+	#
+	# @leds, dict of pixel:[r,g,b] as taken by np_set (Pixels past the end are ignored.)
+	def putLeds(self, leds):
+		buf = self.buf
+		dirty = self.dirtyBuf
+		length = self.length
+
+		for idx in leds:
+			pixel = int(idx)
+			if pixel < 0 or pixel >= length:
+				continue
+
+			color = leds[idx]
+			offset = pixel * 3
+			buf[offset] = int(color[0]) & 0xff
+			buf[offset + 1] = int(color[1]) & 0xff
+			buf[offset + 2] = int(color[2]) & 0xff
+			dirty[pixel] = 1
+
+	# leds
+	#
+	# @ret, dict of pixel:[r,g,b] for every dirty pixel.
+	def leds(self):
+		if self.pixels is not None:
+			return self.ledsAt(np.flatnonzero(self.dirty))
+
+		return self.ledsAt([ i for i in range(0, self.length) if self.dirtyBuf[i] ])
+
+	# ledsAt
+	#
+	# @indices, pixels (List or index array)
+	# @ret, dict of pixel:[r,g,b] for those pixels.
+	def ledsAt(self, indices):
+		if self.pixels is not None:
+			indices = np.asarray(indices, dtype=np.intp)
+			return dict(zip(indices.tolist(), self.pixels[indices].tolist()))
+
+		return dict((i, self.color(i)) for i in indices)
+
+	# changed
+	#
+	# @ret, pixels whose framebuffer color differs from the acknowledged one
+	#  (Every pixel when the strand isn't synced.)
+	def changed(self):
+		if not self.synced:
+			return list(range(0, self.length))
+
+		if self.pixels is not None:
+			return np.flatnonzero((self.pixels != self.acked).any(axis=1)).tolist()
+
+		buf = self.buf
+		ack = self.ackBuf
+		return [ i for i in range(0, self.length) if buf[i * 3:i * 3 + 3] != ack[i * 3:i * 3 + 3] ]
+
+	# lit
+	#
+	# @ret, pixels which aren't black in the framebuffer.
+	def lit(self):
+		if self.pixels is not None:
+			return np.flatnonzero(self.pixels.any(axis=1)).tolist()
+
+		buf = self.buf
+		return [ i for i in range(0, self.length) if buf[i * 3] or buf[i * 3 + 1] or buf[i * 3 + 2] ]
+
+	# ack
+	#
+	# @leds, dict of pixel:[r,g,b] the strand acknowledged
+	def ack(self, leds):
+		ack = self.ackBuf
+		length = self.length
+
+		for idx in leds:
+			pixel = int(idx)
+			if 0 <= pixel < length:
+				color = leds[idx]
+				ack[pixel * 3:pixel * 3 + 3] = bytearray([ int(color[0]) & 0xff, int(color[1]) & 0xff, int(color[2]) & 0xff ])
+
+	# clean
+	#
+	# @indices, pixels which have been sent (None for all of them.)
+	def clean(self, indices=None):
+		if indices is None:
+			self.dirtyBuf[0:self.length] = bytearray(self.length)
+			return
+
+		for idx in indices:
+			pixel = int(idx)
+			if 0 <= pixel < self.length:
+				self.dirtyBuf[pixel] = 0
+
+	# blank
+	#
+	# Every pixel off and clean, as after a clear.
+	def blank(self):
+		self.buf[0:self.length * 3] = bytearray(self.length * 3)
+		self.dirtyBuf[0:self.length] = bytearray(self.length)
+		self.ackBuf[0:self.length * 3] = bytearray(self.length * 3)
+		self.synced = True
+
+	# load
+	#
+	# @raw, get response body (4 bytes a pixel, pad then r,g,b)
+	# @count, pixels in it
+	#
+	#  Replaces the first count pixels with what the strand reported, they're
+	# no longer dirty.
+	def load(self, raw, count):
+		count = min(count, self.length)
+
+		if self.pixels is not None:
+			self.pixels[0:count] = np.frombuffer(raw, dtype=np.uint8, count=count * 4).reshape(count, 4)[:, 1:4]
+		else:
+			raw = bytearray(raw[0:count * 4])
+			for i in range(0, count):
+				self.buf[i * 3:i * 3 + 3] = raw[i * 4 + 1:i * 4 + 4]
+
+		self.dirtyBuf[0:count] = bytearray(count)
+		self.ackBuf[0:count * 3] = self.buf[0:count * 3]
+		if count == self.length:
+			self.synced = True
 
 class aumhNeopixel:
 	def __init__(self, UMH_Instance, logmethod=None, logfile=None):
@@ -55,14 +311,14 @@ class aumhNeopixel:
 		}
 
 		self.subcommands = {
-			"ctrl":b'\x00',
-			"ctrli":b'\x01',
-			"clear":b'\x02',
-			"get":b'\x03',
-			"get_all":b'\x04',
-			"manage":b'\xfd',
-			"add":b'\xfe',
-			"del":b'\xff'
+			"ctrl":0x00,
+			"ctrli":0x01,
+			"clear":0x02,
+			"get":0x03,
+			"get_all":0x04,
+			"manage":0xfd,
+			"add":0xfe,
+			"del":0xff
 		}
 
 		self.subcommandKeys = {
@@ -73,7 +329,8 @@ class aumhNeopixel:
 			"del":[ "id" ]
 		}
 
-		self.strips = {}
+		self.strips = {} #id:StrandInfo
+		self.gradientFrames = aumhLRU() #(id, start, gradient parameters):[ encoded ctrl messages ]
 
 	def logConfigure(self, logfile=None):
 		if self.logmethod == "logger":
@@ -118,20 +375,52 @@ class aumhNeopixel:
 	# assembleHeader
 	#
 	# Forwards assembleHeader call to device assembleHeader
-	def assembleHeader(self, messageType):
-		return self.device.assembleHeader(messageType)
+	def assembleHeader(self, messageType, reserve=0):
+		return self.device.assembleHeader(messageType, reserve)
 
 	# sendMessage
 	#
 	# Forwards sendMessage call to device sendMessage
-	def sendMessage(self, buf):
-		return self.device.sendMessage(buf)
+	def sendMessage(self, buf, lane=None):
+		return self.device.sendMessage(buf, lane)
+
+	# submitMessage
+	#
+	# Forwards submitMessage call to device submitMessage
+	def submitMessage(self, buf, lane=None):
+		return self.device.submitMessage(buf, lane)
 
 	# sendManageMessage
 	#
 	# Forwards sendManageMessage call to device sendManageMessage
-	def sendManageMessage(self, buf):
-		return self.device.sendManageMessage(buf)
+	def sendManageMessage(self, buf, lane=LANE_BACKGROUND):
+		return self.device.sendManageMessage(buf, lane)
+
+	# strand
+	#
+	# @id, strand id
+	# @ret, the strand's StrandInfo, or None if it isn't known.
+	def strand(self, id):
+		return self.strips.get(id)
+
+	# setStrand
+	#
+	# @id, strand id
+	# @pin, strand pin
+	# @length, strand length
+	# @synced, whether a new strand is known to be blank (Just added.)
+	# @ret, the strand's StrandInfo (Its framebuffer is kept where it still fits.)
+	def setStrand(self, id, pin, length, synced=False):
+		strand = self.strips.get(id)
+		if strand is None:
+			strand = StrandInfo(id, pin, length, synced)
+		elif strand.length != (length or 0):
+			strand = strand.resized(length or 0)
+
+		strand.pin = pin
+		self.strips[id] = strand
+
+		return strand
 
 
 
@@ -140,6 +429,8 @@ class aumhNeopixel:
 	# @dataIn, dict of data
 	# @ret, buffer output from 'selected' command.
 	def createMessage(self, dataIn):
+		t_000 = time.time()
+
 		try:
 			if "type" not in dataIn: #This probably should be removed.
 				return 1
@@ -152,7 +443,7 @@ class aumhNeopixel:
 
 			buffer = self.assembleHeader(dataIn["type"])
 
-			buffer.append(to_bytes(dataIn["id"], 1, 1))
+			buffer.pack(uint8Struct, dataIn["id"])
 
 			if dataIn["command"] == "ctrl":
 				buffer = self.lset(buffer, dataIn)
@@ -184,6 +475,7 @@ class aumhNeopixel:
 				return None
 
 			buffer = self.finishMessage(buffer)
+			self.device.stageDone("build", t_000, buffer)
 
 			return buffer
 		except:
@@ -202,15 +494,15 @@ class aumhNeopixel:
 	#
 	# lget builds up a get request for the currently active strips
 	def lget(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["get"]
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		buffer.scmd = self.subcommands["get"]
+		buffer.outLen = 1
 		buffer = self.finishMessage(buffer)
 
 		return buffer
 
 	def lgetall(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["get_all"]
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		buffer.scmd = self.subcommands["get_all"]
+		buffer.outLen = 1
 		buffer = self.finishMessage(buffer)
 
 		return buffer
@@ -225,13 +517,20 @@ class aumhNeopixel:
 	#  method inside UART_MessageHandler to dump all data associated with
 	#  this class.  It then returns the output as a dictionary.
 	def lmanage(self, buffer):
-		buffer[headerOffsets["scmd"]] = self.subcommands["manage"]
-		buffer[headerOffsets["out_0"]] = b'\x01'
+		return self.sendManageMessage(self.lmanageFrame(buffer))
+
+	# lmanageFrame
+	#
+	# @buffer, input frame (With the strand id already appended.)
+	# @ret, the finished manage request
+	def lmanageFrame(self, buffer):
+		buffer.scmd = self.subcommands["manage"]
+		buffer.outLen = 1
 		buffer = self.finishMessage(buffer)
 		for i in range(0, 6):
-			buffer.append(self.subcommands["manage"]) #We want 6 consecutive values of the same command
+			buffer.pack(uint8Struct, self.subcommands["manage"]) #We want 6 consecutive values of the same command
 
-		return self.sendManageMessage(buffer)
+		return buffer
 
 	# lset
 	#
@@ -242,21 +541,23 @@ class aumhNeopixel:
 	# lset builds up a message for setting pixels to values.
 	def lset(self, buffer, dataIn, state=0):
 		if state:
-			buffer[headerOffsets["scmd"]] = self.subcommands["ctrli"]
+			buffer.scmd = self.subcommands["ctrli"]
 
 		else:
-			buffer[headerOffsets["scmd"]] = self.subcommands["ctrl"]
+			buffer.scmd = self.subcommands["ctrl"]
 
-		outLen = to_bytes(len(dataIn['data']['leds']), 2, "little")
-		buffer[headerOffsets['out_0']] = outLen[0]
-		buffer[headerOffsets['out_1']] = outLen[1]
+		leds = dataIn['data']['leds']
+		buffer.outLen = len(leds)
 
-		for idx in dataIn['data']['leds']:
-			for pixelp in to_bytes(int(idx), 2, 1):
-				buffer.append(pixelp)
+		#Grow the frame once and pack every pixel in place.
+		offset = buffer.extend(len(leds) * pixelStruct.size)
+		pack_into = pixelStruct.pack_into
+		raw = buffer.buf
 
-			for color in dataIn['data']['leds'][idx]:
-				buffer.append(to_bytes(color, 1, 1))
+		for idx in leds:
+			color = leds[idx]
+			pack_into(raw, offset, int(idx), color[0], color[1], color[2])
+			offset += pixelStruct.size
 
 		return buffer
 
@@ -268,8 +569,8 @@ class aumhNeopixel:
 	#
 	# Builds the output for clearing a stripid
 	def lclear(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["clear"]
-		buffer[headerOffsets["out_0"]] = '\x01' #default, and tbh, the only valid, is 1.
+		buffer.scmd = self.subcommands["clear"]
+		buffer.outLen = 1 #default, and tbh, the only valid, is 1.
 
 		return buffer
 
@@ -281,18 +582,11 @@ class aumhNeopixel:
 	#
 	# Prepares a message to add a new strip.
 	def ladd(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["add"]
-		buffer[headerOffsets["out_0"]] = '\x01'
-		buffer.append(to_bytes(dataIn['data']['pin'], 1, 1))
-
-		for b in to_bytes(dataIn['data']['length'], 2, 1):
-			buffer.append(b)
+		buffer.scmd = self.subcommands["add"]
+		buffer.outLen = 1
+		buffer.pack(strandAddStruct, dataIn['data']['pin'], dataIn['data']['length'])
 
-		if dataIn["id"] not in self.strips or not isinstance(self.strips[dataIn["id"]], dict):
-			self.strips[dataIn["id"]] = {}
-			
-		self.strips[dataIn["id"]]["pin"] = dataIn['data']['pin']
-		self.strips[dataIn["id"]]["length"] = dataIn['data']['length']
+		self.setStrand(dataIn["id"], dataIn['data']['pin'], dataIn['data']['length'], True)
 
 		return buffer
 
@@ -304,14 +598,14 @@ class aumhNeopixel:
 	#
 	# This method builds up the message for neopixel strip deletion.
 	def ldelete(self, buffer, dataIn):
-		buffer[headerOffsets["scmd"]] = self.subcommands["del"]
-		buffer[headerOffsets["out_0"]] = '\x01'
+		buffer.scmd = self.subcommands["del"]
+		buffer.outLen = 1
 
-		buffer.append(buffer[self.xheaderOffsets["id"]])
-		buffer.append(buffer[self.xheaderOffsets["id"]])
+		stripId = buffer.buf[self.xheaderOffsets["id"]]
+		buffer.pack(uint8Struct, stripId)
+		buffer.pack(uint8Struct, stripId)
 
-		if dataIn["id"] in self.strips:
-			self.strips[dataIn["id"]] = None
+		self.strips.pop(dataIn["id"], None)
 
 		return buffer
 
@@ -319,6 +613,79 @@ class aumhNeopixel:
 
 
 
+	# sendLeds
+	#
+	# @id, strand id
+	# @command, "ctrl" or "ctrli"
+	# @leds, dict of pixel:[r,g,b]
+	# @wait, when False the messages are submitted and an aumhFuture returned
+	# @ret, 0 or the first non-zero sendMessage return
+	#
+	#  Sends the leds as a single message when they fit in arduino_max_frags
+	# fragments, otherwise as consecutive messages of maxFramePixels leds.
+	# Known strands get the leds written into their framebuffer, they stay
+	# dirty until the send succeeds.
+	def sendLeds(self, id, command, leds, wait=True):
+		strand = self.strips.get(id)
+		if strand is not None:
+			strand.putLeds(leds)
+
+		futures = []
+		for msg in self.ledMessages(id, command, leds):
+			if not wait:
+				futures.append(self.submitMessage(msg))
+				continue
+
+			ret = self.sendMessage(msg)
+			if ret:
+				return ret
+
+		if not wait:
+			future = aumhFuture.combine(futures)
+			if strand is not None:
+				future.add_done_callback(lambda done: done.value or self.acknowledged(strand, leds))
+
+			return future
+
+		if strand is not None:
+			self.acknowledged(strand, leds)
+
+		return 0
+
+	# acknowledged
+	#
+	# @strand, StrandInfo
+	# @leds, dict of pixel:[r,g,b] the strand took
+	def acknowledged(self, strand, leds):
+		strand.clean(leds)
+		strand.ack(leds)
+
+	# ledMessages
+	#
+	# @id, strand id
+	# @command, "ctrl" or "ctrli"
+	# @leds, dict of pixel:[r,g,b]
+	# @limit, most leds per message
+	# @ret, generator of messages, split every limit leds.
+	def ledMessages(self, id, command, leds, limit=maxFramePixels):
+		if len(leds) <= limit:
+			groups = [ leds ]
+		else:
+			keys = list(leds)
+			groups = [ dict((k, leds[k]) for k in keys[i:i+limit]) for i in xrange(0, len(keys), limit) ]
+
+		for group in groups:
+			data = {
+				"id":id,
+				"command":command,
+				"type":"neopixel",
+				"data": {
+					"leds":group
+				}
+			}
+
+			yield self.createMessage(data)
+
 	def np_get(self, id, dataIn):
 		data = {
 			"id":id,
@@ -329,6 +696,18 @@ class aumhNeopixel:
 
 		out = self.sendMessage(self.createMessage(data))
 
+		t_000 = time.time()
+		out = self.np_get_decode(id, out)
+		self.device.stageDone("decode", t_000)
+
+		return out
+
+	# np_get_decode
+	#
+	# @id, strand id
+	# @out, raw get response
+	# @ret, the strand's StrandInfo with the reported pixels loaded, or None.
+	def np_get_decode(self, id, out):
 		try:
 			if "NAK" in out:
 				self.log("UARTNeopixel.np_get(), error, command failed (NAK)")
@@ -342,22 +721,15 @@ class aumhNeopixel:
 			self.log(errString)
 			return None
 
-		out = out[:-5] #Remove the ACK
+		count = (len(out) - len(r_ack)) // 4 #Pixels, the ACK trails them.
 
+		strand = self.strips.get(id)
+		if strand is None or not strand.length:
+			strand = self.setStrand(id, strand.pin if strand else None, count)
 
-		#Configure the strips data...
-		if id not in self.strips:
-			self.strips[id] = { "pin":None, "length":None }
+		strand.load(out, count)
 
-		self.strips[id]["pixels"] = {}
-
-		#Perform a clean format of the strips data.
-		counter = 0
-		for colGroup in [ out[i:i+4] for i in range(0, len(out), 4) ]:
-			self.strips[id]["pixels"][counter] = { "red":colGroup[1], "green":colGroup[2], "blue":colGroup[3] }
-			counter+=1
-
-		return self.strips[id]
+		return strand
 
 	def np_get_all(self, id, dataIn):
 		data = {
@@ -370,37 +742,143 @@ class aumhNeopixel:
 		#FIXME, this method is currently in a 'debugging' state.  It does not actually do anything useful.
 		pprint.pprint(self.sendMessage(self.createMessage(data)))
 
-	def np_set(self, id, dataIn):
-		data = {
-			"id":id,
-			"command":"ctrli",
-			"type":"neopixel",
-			"data": {
-				"leds":dataIn
-			}
-		}
+	def np_set(self, id, dataIn, wait=True):
+		if not wait:
+			return self.sendLeds(id, "ctrli", dataIn, False)
 
+		if self.sendLeds(id, "ctrli", dataIn):
+			self.log("UARTNeopixel.np_set(), sendMessage call failure.")
 
-		msgCtd = self.createMessage(data)
+	def np_set_bulk(self, id, dataIn, wait=True):
+		if not wait:
+			return self.sendLeds(id, "ctrl", dataIn, False)
 
-		if self.sendMessage(msgCtd):
-			self.log("UARTNeopixel.np_set(), sendMessage call failure.")
+		if self.sendLeds(id, "ctrl", dataIn):
+			self.log("UARTNeopixel.np_set_bulk(), sendMessage call failure.")
 
-	def np_set_bulk(self, id, dataIn):
-		data = {
-			"id":id,
-			"command":"ctrl",
-			"type":"neopixel",
-			"data": {
-				"leds":dataIn
-			}
-		}
+	# np_flush
+	#
+	# @id, strand id
+	# @wait, when False the messages are submitted and an aumhFuture returned
+	# @ret, sendLeds output (0 when nothing was dirty.)
+	#
+	#  Sends the pixels written into the strand's framebuffer (strand(id).put()
+	# or straight into strand(id).pixels with dirty set) since they were last
+	# sent.
+	def np_flush(self, id, wait=True):
+		strand = self.strips.get(id)
+		if strand is None:
+			self.log("UARTNeopixel.np_flush(), unknown strand %s." % str(id))
+			return 1 if wait else aumhFuture.resolved(1)
 
+		leds = strand.leds()
+		if not leds:
+			if not wait:
+				return aumhFuture.resolved(0)
 
-		msgCtd = self.createMessage(data)
+			return 0
 
-		if self.sendMessage(msgCtd):
-			self.log("UARTNeopixel.np_set(), sendMessage call failure.")
+		return self.sendLeds(id, "ctrl", leds, wait)
+
+	# np_commit
+	#
+	# @id, strand id
+	# @frame, N x 3 array or list of [r, g, b] for the whole strand, None
+	#  commits whatever is in the strand's framebuffer.
+	# @wait, when False the messages are submitted and an aumhFuture returned
+	# @clear, allow clearing the strand and sending only its lit pixels
+	# @record, list the encoded messages are appended to (To replay them.)
+	# @ret, 0 or the first non-zero sendMessage return (Or the future.)
+	#
+	#  Sends the frame as the cheapest set of messages relative to the last
+	# frame the strand acknowledged:
+	#
+	#  sparse, ctrl messages for just the changed pixels
+	#  clear, a clear and then ctrl messages for the lit pixels, when that's
+	#   fewer bytes (A mostly dark frame after a busy one)
+	#  full, every pixel, used while the strand's contents are unknown
+	#
+	#  ctrl carries an index with every pixel, so rewriting unchanged pixels
+	# never saves bytes.  Large updates are cut into messages that exactly fill
+	# their last fragment (alignedFramePixels.)  Pixels which fail to send are
+	# left dirty and are retried by the next commit.
+	def np_commit(self, id, frame=None, wait=True, clear=True, record=None):
+		strand = self.strips.get(id)
+		if strand is None:
+			self.log("UARTNeopixel.np_commit(), unknown strand %s." % str(id))
+			return 1 if wait else aumhFuture.resolved(1)
+
+		if frame is not None:
+			strand.put(0, frame)
+
+		changed = strand.changed()
+		strand.clean()
+
+		form = "sparse" if strand.synced else "full"
+		pixels = changed
+		messages = []
+
+		if clear and changed and strand.synced:
+			lit = strand.lit()
+			if commitBytes(len(lit)) + headerStruct.size + 1 < commitBytes(len(changed)):
+				form = "clear"
+				pixels = lit
+				messages.append(self.createMessage({ "id":id, "command":"clear", "type":"neopixel", "data":{ "id":id } }))
+
+		self.device.metrics.add("commits")
+		if not changed:
+			if not wait:
+				return aumhFuture.resolved(0)
+
+			return 0
+
+		self.device.metrics.add("commit_%s" % form)
+		self.device.metrics.add("commitPixels", len(pixels))
+
+		leds = strand.ledsAt(pixels)
+		frameBytes = bytes(strand.buf) #What the strand shows once every message lands.
+		messages.extend(self.ledMessages(id, "ctrl", leds, alignedFramePixels))
+		if record is not None:
+			record.extend(messages)
+
+		def committed(ret):
+			if ret: #Send them again next time.
+				for pixel in changed:
+					strand.dirtyBuf[pixel] = 1
+
+				if form == "clear": #Cleared, but with who knows what on it since.
+					strand.synced = False
+
+				return
+
+			strand.ackBuf[0:len(frameBytes)] = frameBytes
+			strand.synced = True
+
+		if not wait:
+			future = aumhFuture.combine([ self.submitMessage(msg) for msg in messages ])
+			future.add_done_callback(lambda done: committed(done.value))
+			return future
+
+		for msg in messages:
+			ret = self.sendMessage(msg)
+			if ret:
+				committed(ret)
+				return ret
+
+		committed(0)
+		return 0
+
+	# np_color
+	#
+	# @id, strand id
+	# @index, pixel
+	# @ret, [r, g, b] from the strand's framebuffer (No serial round trip), or None.
+	def np_color(self, id, index):
+		strand = self.strips.get(id)
+		if strand is None or index < 0 or index >= strand.length:
+			return None
+
+		return strand.color(index)
 
 	def np_add(self, id, pin, length):
 		data = {
@@ -416,7 +894,7 @@ class aumhNeopixel:
 		if self.sendMessage(self.createMessage(data)):
 			self.log("UARTNeopixel.np_add(), sendMessage call failure.")
 
-	def np_clear(self, id):
+	def np_clear(self, id, wait=True):
 		data = {
 			"id":id,
 			"command":"clear",
@@ -426,8 +904,19 @@ class aumhNeopixel:
 			}
 		}
 
+		strand = self.strips.get(id)
+
+		if not wait:
+			future = self.submitMessage(self.createMessage(data))
+			if strand is not None:
+				future.add_done_callback(lambda done: done.value or strand.blank())
+
+			return future
+
 		if self.sendMessage(self.createMessage(data)):
 			self.log("UARTNeopixel.np_clear(), sendMessage call failure.")
+		elif strand is not None:
+			strand.blank()
 
 	def np_del(self, id):
 		data = {
@@ -454,6 +943,17 @@ class aumhNeopixel:
 
 		out = self.createMessage(data)
 
+		t_000 = time.time()
+		out = self.np_manage_decode(out)
+		self.device.stageDone("decode", t_000)
+
+		return out
+
+	# np_manage_decode
+	#
+	# @out, raw manage response
+	# @ret, out, or None if it couldn't be handled.
+	def np_manage_decode(self, out):
 		try:
 			if not out.startswith("NAK"):
 				datal = list(out)
@@ -466,12 +966,7 @@ class aumhNeopixel:
 					pin = struct.unpack(">B", out[2+relI])[0]
 					length = struct.unpack(">H", out[3+relI:5+relI])[0]
 
-					#The following could be... broken...
-					if pID not in self.strips or not isinstance(self.strips[pID], dict):
-						self.strips[pID] = { }
-
-					self.strips[pID]["pin"] = pin
-					self.strips[pID]["length"] = length 
+					self.setStrand(pID, pin, length)
 
 		except:
 			self.log("UARTNeopixel.np_manage(), issue handling strand instance data.")
@@ -479,13 +974,25 @@ class aumhNeopixel:
 
 		return out #FIXME, make this baby return self.strips.
 
-	def np_gradient(self, id, dataIn):
-		#We expect dataIn to have:
-		# 'start', the first pixel to use on the strand id
-		# 'end', the last pixel to use on the strand id
-		# 'startColor', the first color to use, as an RGB list []
-		# 'endColor', the last color to use, as an RGB list []
-
+	# np_gradient
+	#
+	# @id, strand id
+	# @dataIn, dict with
+	#  'start', the first pixel to use on the strand id
+	#  'end', the pixel after the last one to use
+	#  'startColor' and 'endColor', RGB lists [], or 'colors', a list of two
+	#   or more RGB lists for a multi-stop gradient
+	#  'positions', optional, where each of 'colors' sits from 0 to 1
+	#  'space', optional, "hsv" (Default) or "rgb" interpolation
+	# @wait, when False the messages are submitted and an aumhFuture returned
+	# @ret, 0 or the first non-zero sendMessage return (1 if it couldn't be
+	#  encoded), None on bad dataIn.
+	#
+	#  The pixels come from gradientCache and the encoded ctrl messages from
+	# gradientFrames, both keyed by the parameters, so a repeated gradient is
+	# neither computed nor encoded again.  On a known strand nothing is sent
+	# when the strand already shows it.
+	def np_gradient(self, id, dataIn, wait=True):
 		if "start" not in dataIn:
 			self.log("UARTNeopixel.np_gradient(), no start in dataIn.")
 			return None
@@ -494,37 +1001,128 @@ class aumhNeopixel:
 			self.log("UARTNeopixel.np_gradient(), no end in dataIn.")
 			return None
 
-		if "startColor" not in dataIn or len(dataIn["startColor"]) != 3:
-			self.log("UARTNeopixel.np_gradient(), no startColor in dataIn.")
-			return None
+		if "colors" in dataIn:
+			colors = dataIn["colors"]
+			if len(colors) < 2 or [ color for color in colors if len(color) != 3 ]:
+				self.log("UARTNeopixel.np_gradient(), colors needs two or more RGB lists.")
+				return None
+
+		else:
+			if "startColor" not in dataIn or len(dataIn["startColor"]) != 3:
+				self.log("UARTNeopixel.np_gradient(), no startColor in dataIn.")
+				return None
+
+			if "endColor" not in dataIn or len(dataIn["endColor"]) != 3:
+				self.log("UARTNeopixel.np_gradient(), no endColor in dataIn.")
+				return None
 
-		if "endColor" not in dataIn or len(dataIn["endColor"]) != 3:
-			self.log("UARTNeopixel.np_gradient(), no endColor in dataIn.")
+			colors = [ dataIn["startColor"], dataIn["endColor"] ]
+
+		positions = dataIn.get("positions")
+		if positions is not None:
+			if len(positions) != len(colors):
+				self.log("UARTNeopixel.np_gradient(), positions and colors differ in length.")
+				return None
+
+			positions = tuple(float(p) for p in positions)
+
+		space = dataIn.get("space", "hsv")
+		if space not in ("hsv", "rgb"):
+			self.log("UARTNeopixel.np_gradient(), unknown space %s." % str(space))
 			return None
 
-		#Convert startColor and endColor to HSV values
-		startColorHSV = colorsys.rgb_to_hsv(int(dataIn['startColor'][0]),int(dataIn['startColor'][1]),int(dataIn['startColor'][2]))
-		endColorHSV = colorsys.rgb_to_hsv(int(dataIn['endColor'][0]),int(dataIn['endColor'][1]),int(dataIn['endColor'][2]))
-		mapSize = int(dataIn["end"]) - int(dataIn["start"])
+		start = int(dataIn["start"])
+		mapSize = int(dataIn["end"]) - start
+		if mapSize <= 0:
+			return 0 if wait else aumhFuture.resolved(0)
+
+		key = (mapSize, tuple(tuple(int(c) for c in color) for color in colors), positions, space)
+
+		span = gradientCache.get(key)
+		if span is None:
+			span = gradient(mapSize, key[1], positions, space)
+			gradientCache.put(key, span)
+
+		strand = self.strips.get(id)
+		if strand is not None and (start < 0 or start + mapSize > strand.length):
+			strand = None #Only partly on the strand, just send it.
+
+		if strand is not None:
+			strand.put(start, span)
+			pixels = range(start, start + mapSize)
+			if strand.synced and strand.buf[start * 3:(start + mapSize) * 3] == strand.ackBuf[start * 3:(start + mapSize) * 3]:
+				strand.clean(pixels)
+				self.device.metrics.add("gradientsSkipped")
+				return 0 if wait else aumhFuture.resolved(0)
+
+		frameKey = (id, start) + key
+		messages = self.gradientFrames.get(frameKey)
+		if messages is None:
+			if np is not None:
+				leds = dict(zip(range(start, start + mapSize), span.tolist()))
+			else:
+				leds = dict(zip(range(start, start + mapSize), span))
+
+			messages = list(self.ledMessages(id, "ctrl", leds))
+			if [ msg for msg in messages if msg is None or isinstance(msg, int) ]:
+				self.log("UARTNeopixel.np_gradient(), unable to encode the gradient.")
+				return 1 if wait else aumhFuture.resolved(1)
+
+			messages = [ frameView(msg) for msg in messages ]
+			self.gradientFrames.put(frameKey, messages)
+
+		def sent(ret):
+			if ret:
+				self.log("UARTNeopixel.np_gradient(), sendMessage call failure.")
+				return
 
-		#Prepare the data structure
+			if strand is not None:
+				strand.clean(pixels)
+				strand.ackBuf[start * 3:(start + mapSize) * 3] = strand.buf[start * 3:(start + mapSize) * 3]
+
+		if not wait:
+			future = aumhFuture.combine([ self.submitMessage(msg) for msg in messages ])
+			future.add_done_callback(lambda done: sent(done.value))
+			return future
+
+		for msg in messages:
+			ret = self.sendMessage(msg)
+			if ret:
+				sent(ret)
+				return ret
+
+		sent(0)
+		return 0
+
+	#Asyncio counterparts, these need the device to be an aumhAsync instance.
+
+	# np_set_async
+	#
+	# @id, strand id
+	# @dataIn, dict of pixel:[r,g,b]
+	# @ret, future, first non-zero sendMessage output or 0.
+	def np_set_async(self, id, dataIn):
+		return self.device.asyncCombine([ self.device.sendMessageAsync(msg) for msg in self.ledMessages(id, "ctrli", dataIn) ])
+
+	# np_get_async
+	#
+	# @id, strand id
+	# @ret, future for the np_get output.
+	def np_get_async(self, id, dataIn=None):
 		data = {
 			"id":id,
-			"command":"ctrl",
+			"command":"get",
 			"type":"neopixel",
-			"data":{
-				"leds":{} #pixel:[r,g,b] sets.
-			}
+			"data":[],
 		}
 
-		for nrp in range(0, mapSize):
-			lH = (endColorHSV[0] - startColorHSV[0]) * nrp / mapSize + startColorHSV[0]
-			lV = (endColorHSV[2] - startColorHSV[2]) * nrp / mapSize + startColorHSV[2]
-			lS = (endColorHSV[1] - startColorHSV[1]) * nrp / mapSize + startColorHSV[1]
+		return self.device.asyncThen(self.device.sendMessageAsync(self.createMessage(data)), lambda out: self.np_get_decode(id, out))
 
-			lRGB = colorsys.hsv_to_rgb(lH, lS, lV)
-
-			data["data"]["leds"][nrp+int(dataIn["start"])] = [ int(lRGB[0]) % 256, int(lRGB[1]) % 256, int(lRGB[2]) % 256 ]
+	# np_manage_async
+	#
+	# @ret, future for the np_manage output.
+	def np_manage_async(self):
+		buffer = self.assembleHeader("neopixel")
+		buffer.pack(uint8Struct, 0)
 
-		if self.sendMessage(self.createMessage(data)):
-			self.log("UARTNeopixel.np_gradient(), sendMessage call failure.")
\ No newline at end of file
+		return self.device.asyncThen(self.device.sendManageMessageAsync(self.lmanageFrame(buffer)), self.np_manage_decode)
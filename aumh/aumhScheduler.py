@@ -0,0 +1,230 @@
+###############################################################################
+#                              aumhScheduler.py                               #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# This is the per-device command scheduler.  It decides which caller gets the #
+#  serial interface next when several are waiting on it.                      #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import threading
+import collections
+
+# Priority lanes, lowest value is served first.
+LANE_INTERACTIVE = 0	#Digital sets/gets, anything a person is waiting on.
+LANE_FRAME = 1			#Neopixel frames.
+LANE_BACKGROUND = 2		#Manage/get polling.
+
+laneNames = {
+	LANE_INTERACTIVE:"interactive",
+	LANE_FRAME:"frame",
+	LANE_BACKGROUND:"background",
+}
+
+#  Seconds a waiter may sit in its lane before it is served ahead of higher
+# priority lanes.
+laneDeadlines = {
+	LANE_INTERACTIVE:0.1,
+	LANE_FRAME:1.0,
+	LANE_BACKGROUND:10.0,
+}
+
+#  After this many consecutive grants to higher lanes while a lower lane is
+# waiting, the lower lane gets one turn.
+lane_burst = 8
+
+# aumhScheduler
+#
+#  A priority lock around a device's serial interface.  Waiters queue in
+# their lane (FIFO within a lane).  On release the next owner is, in order:
+#
+#  the waiter furthest past its lane deadline,
+#  a lower lane waiter if higher lanes have used up lane_burst grants,
+#  the head of the highest priority non-empty lane.
+#
+#  The optional sema (A multiprocessing semaphore) is held along with the
+# lock so other processes sharing the port are still kept out.  With metrics
+# (aumhMetrics) every wait, semaphore included, goes into lockWait.
+#
+#  Callers which can't block (An event loop) queue with acquireAsync()
+# instead; their tickets carry a callback which is run on grant, and they
+# hand the device on with release() like everyone else.  Those grants don't
+# take sema, a loop can't wait for another process.
+class aumhScheduler(object):
+	def __init__(self, sema=None, deadlines=None, burst=lane_burst, metrics=None):
+		self.sema = sema
+		self.metrics = metrics
+		self.deadlines = dict(laneDeadlines)
+		if deadlines:
+			self.deadlines.update(deadlines)
+
+		self.burst = burst
+
+		self.cond = threading.Condition(threading.Lock())
+		self.lanes = dict((lane, collections.deque()) for lane in laneNames)
+		self.busy = False
+		self.semaHeld = False #Whether the current owner took sema.
+		self.streak = 0 #Consecutive grants while a lower lane was waiting.
+
+		self.stats = dict((lane, { "grants":0, "waitTotal":0.0, "waitMax":0.0, "overdue":0 }) for lane in laneNames)
+
+	# acquire
+	#
+	# @lane, LANE_* value
+	# @timeout, seconds to wait, None waits forever
+	# @ret, True once the caller owns the device, False on timeout
+	def acquire(self, lane=LANE_FRAME, timeout=None):
+		tStart = time.time()
+		ticket = [ lane, tStart, False ] #lane, enqueue time, granted
+
+		with self.cond:
+			if not self.busy and not self.waiting():
+				self.busy = True
+				ticket[2] = True
+			else:
+				self.lanes[lane].append(ticket)
+
+				while not ticket[2]:
+					if timeout is None:
+						self.cond.wait()
+						continue
+
+					remaining = tStart + timeout - time.time()
+					if remaining <= 0:
+						self.lanes[lane].remove(ticket)
+						return False
+
+					self.cond.wait(remaining)
+
+			self.account(lane, time.time() - tStart)
+
+		if self.sema:
+			self.sema.acquire()
+			self.semaHeld = True
+
+		if self.metrics:
+			self.metrics.observe("lockWait", time.time() - tStart)
+
+		return True
+
+	# acquireAsync
+	#
+	# @lane, LANE_* value
+	# @granted, called without arguments once the caller owns the device, on
+	#  whichever thread handed it over (This one if it was free.)
+	#
+	#  Non-blocking acquire, the owner calls release() when it's done.
+	def acquireAsync(self, lane, granted):
+		ticket = [ lane, time.time(), False, granted ] #lane, enqueue time, granted, callback
+
+		with self.cond:
+			if self.busy or self.waiting():
+				self.lanes[lane].append(ticket)
+				return
+
+			self.busy = True
+			ticket[2] = True
+
+		self.granted(ticket)
+
+	# release
+	#
+	# Hands the device to the next waiter (If any.)
+	def release(self):
+		if self.semaHeld:
+			self.semaHeld = False
+			self.sema.release()
+
+		with self.cond:
+			ticket = self.pick()
+			if not ticket:
+				self.busy = False
+				return
+
+			ticket[2] = True
+			if len(ticket) < 4:
+				self.cond.notify_all()
+				return
+
+		self.granted(ticket)
+
+	# granted
+	#
+	# @ticket, acquireAsync ticket which now owns the device
+	def granted(self, ticket):
+		waited = time.time() - ticket[1]
+
+		with self.cond:
+			self.account(ticket[0], waited)
+
+		if self.metrics:
+			self.metrics.observe("lockWait", waited)
+
+		ticket[3]()
+
+	# waiting
+	#
+	# @ret, number of queued waiters across all lanes.
+	def waiting(self):
+		return sum(len(self.lanes[lane]) for lane in self.lanes)
+
+	# pick
+	#
+	# @ret, the ticket to grant next, removed from its lane, or None.
+	def pick(self):
+		now = time.time()
+		heads = [ (lane, self.lanes[lane][0]) for lane in sorted(self.lanes) if self.lanes[lane] ]
+		if not heads:
+			return None
+
+		#Deadlines first, the most overdue waiter wins.
+		overdue = [ (now - ticket[1] - self.deadlines[lane], lane) for lane, ticket in heads if (now - ticket[1]) > self.deadlines[lane] ]
+		if overdue:
+			lane = max(overdue)[1]
+			self.stats[lane]["overdue"] += 1
+		elif len(heads) > 1 and self.streak >= self.burst:
+			lane = heads[1][0]
+		else:
+			lane = heads[0][0]
+
+		#Only grants that jump over a waiting lower lane count towards the burst.
+		if any(other > lane for other, ticket in heads):
+			self.streak += 1
+		else:
+			self.streak = 0
+
+		if lane != heads[0][0]:
+			self.streak = 0
+
+		return self.lanes[lane].popleft()
+
+	# account
+	#
+	# @lane, lane which was granted
+	# @waited, seconds spent waiting
+	def account(self, lane, waited):
+		stat = self.stats[lane]
+		stat["grants"] += 1
+		stat["waitTotal"] += waited
+		if waited > stat["waitMax"]:
+			stat["waitMax"] = waited
+
+	# snapshot
+	#
+	# @ret, dict of per lane stats keyed by lane name, plus current queue depths.
+	def snapshot(self):
+		with self.cond:
+			out = {}
+			for lane in self.stats:
+				out[laneNames[lane]] = dict(self.stats[lane], queued=len(self.lanes[lane]))
+
+		return out
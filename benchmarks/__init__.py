@@ -0,0 +1,86 @@
+###############################################################################
+#                             benchmarks/__init__.py                          #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Benchmarks for the library.  Run them with 'python -m benchmarks', results  #
+#  are written out as JSON so runs can be compared between releases.          #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import platform
+import subprocess
+
+# percentile
+#
+# @samples, sorted list of values
+# @pct, percentile (0-100)
+# @ret, nearest rank percentile or None for an empty list.
+def percentile(samples, pct):
+	if not samples:
+		return None
+
+	rank = int(round(pct / 100.0 * (len(samples) - 1)))
+	return samples[rank]
+
+# summarize
+#
+# @samples, list of values
+# @ret, dict of count/min/mean/p50/p95/p99/max
+def summarize(samples):
+	samples = sorted(samples)
+	if not samples:
+		return { "count":0 }
+
+	return {
+		"count":len(samples),
+		"min":samples[0],
+		"mean":sum(samples) / float(len(samples)),
+		"p50":percentile(samples, 50),
+		"p95":percentile(samples, 95),
+		"p99":percentile(samples, 99),
+		"max":samples[-1],
+	}
+
+# cpuTime
+#
+# @ret, cpu seconds used by this process so far.
+def cpuTime():
+	if hasattr(time, "process_time"):
+		return time.process_time()
+
+	return time.clock() #Processor time on unix, with far better resolution than os.times().
+
+# environment
+#
+# @ret, dict describing where the numbers came from.
+def environment():
+	return {
+		"time":time.time(),
+		"python":platform.python_version(),
+		"implementation":platform.python_implementation(),
+		"platform":platform.platform(),
+		"revision":revision(),
+	}
+
+# revision
+#
+# @ret, git describe output for the tree the benchmarks ran from, or None.
+def revision():
+	try:
+		with open(os.devnull, "w") as devnull:
+			out = subprocess.check_output([ "git", "describe", "--always", "--dirty" ], stderr=devnull, cwd=os.path.dirname(os.path.abspath(__file__)))
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+	return out.decode("ascii", "replace").strip()
@@ -0,0 +1,65 @@
+###############################################################################
+#                             benchmarks/__main__.py                          #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Benchmark entry point.                                                      #
+#                                                                             #
+#  python -m benchmarks [suite ...] [--output results.json] [options]         #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import sys
+import json
+import argparse
+import collections
+
+from benchmarks import environment
+from benchmarks import endtoend
+from benchmarks import codec
+from benchmarks import imports
+
+# Suites by name, each provides options(parser) and run(args).
+suites = collections.OrderedDict([
+	("endtoend", endtoend),
+	("codec", codec),
+	("imports", imports),
+])
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog="python -m benchmarks", description="py_aumh benchmarks.")
+	parser.add_argument("suites", nargs="*", default=list(suites), help="Suites to run (%s.)" % ", ".join(suites))
+	parser.add_argument("--output", default=None, help="Write the JSON results here instead of stdout.")
+
+	for suite in suites.values():
+		suite.options(parser)
+
+	args = parser.parse_args(argv)
+
+	unknown = [ name for name in args.suites if name not in suites ]
+	if unknown:
+		parser.error("unknown suite(s) %s" % ", ".join(unknown))
+
+	results = { "environment":environment() }
+	for name in args.suites:
+		print("Running %s..." % name, file=sys.stderr)
+		results[name] = suites[name].run(args)
+
+	out = json.dumps(results, indent=2, sort_keys=True)
+	if args.output:
+		with open(args.output, "w") as fh:
+			fh.write(out + "\n")
+	else:
+		print(out)
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,269 @@
+###############################################################################
+#                              benchmarks/codec.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Codec microbenchmarks, the message builders and response parsers timed on   #
+#  their own without any serial I/O.                                          #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import gc
+import sys
+import struct
+import timeit
+import fnmatch
+import collections
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+from aumh import *
+
+from benchmarks import summarize
+
+# Defaults
+codec_repeat = 7		#Timed runs per case, the spread between them is reported.
+codec_min_time = 0.05	#Seconds each timed run should take at least.
+
+# codecDevice
+#
+#  aumh without a serial port.  sendMessage only takes the frame's view, so
+# builders which send (np_gradient) can be timed without any I/O.
+class codecDevice(aumh):
+	def __init__(self):
+		aumh.__init__(self, "null")
+
+	def serialReset(self):
+		return 0
+
+	def sendMessage(self, buf, lane=None):
+		frameView(buf)
+		return 0
+
+# options
+#
+# @parser, argparse parser to add our options to
+def options(parser):
+	group = parser.add_argument_group("codec")
+	group.add_argument("--cases", default="*", help="Comma separated case name patterns, 'lset_*' for example.")
+	group.add_argument("--repeat", type=int, default=codec_repeat, help="Timed runs per case.")
+	group.add_argument("--min-time", type=float, default=codec_min_time, dest="minTime", help="Minimum seconds per timed run.")
+
+# neopixelManageResponse
+#
+# @count, number of strands
+# @ret, neopixel manage response as the firmware sends it
+def neopixelManageResponse(count):
+	return struct.pack("B", count) + b"".join([ struct.pack(">BBH", i, i + 2, 60 * (i + 1)) for i in range(0, count) ]) + r_ack
+
+# digitalManageResponse
+#
+# @count, number of pins
+# @ret, digital manage response as the firmware sends it
+def digitalManageResponse(count):
+	return struct.pack("B", count) + b"".join([ struct.pack("<hBhB", i + 2, i & 1, 0, 0) for i in range(0, count) ]) + r_ack
+
+# neopixelGetResponse
+#
+# @length, strip length
+# @ret, neopixel get response as the firmware sends it
+def neopixelGetResponse(length):
+	return b"".join([ struct.pack("BBBB", 0, i & 0xff, 0x40, 0) for i in range(0, length) ]) + r_ack
+
+# cases
+#
+# @ret, OrderedDict of case name to a no argument callable
+def cases():
+	device = codecDevice()
+	neopixel = aumhNeopixel(device)
+	digital = aumhDigital(device)
+
+	out = collections.OrderedDict()
+
+	out["to_bytes_struct"] = lambda: to_bytes(0x1234, 2)
+	out["to_bytes_generic"] = lambda: to_bytes(0x123456, 3)
+
+	headerBytes = [ chr(x) for x in (key_start, 0, 2, 0, 0, 0, 60, 0, 0, 0) ]
+	out["lrcsum"] = lambda: lrcsum(headerBytes)
+
+	def header():
+		frame = device.assembleHeader("digital")
+		frame.scmd = 0x01
+		frame.outLen = 1
+		return device.finishMessage(frame)
+
+	out["assembleHeader_finishMessage"] = header
+
+	digitalSet = { "command":"set", "data":{ "pin":13, "state":1 } }
+	out["digital_createMessage_set"] = lambda: digital.createMessage(digitalSet)
+
+	for length in (60, 300, 1000):
+		leds = { "data":{ "leds":dict((i, [ i & 0xff, 0x40, 0x00 ]) for i in range(0, length)) } }
+
+		def lset(leds=leds):
+			frame = neopixel.assembleHeader("neopixel", 1 + len(leds["data"]["leds"]) * pixelStruct.size)
+			frame.pack(uint8Struct, 0)
+			return neopixel.lset(frame, leds)
+
+		out["lset_%d" % length] = lset
+
+	for length in (60, 300):
+		gradient = { "start":0, "end":length, "startColor":[ 255, 100, 0 ], "endColor":[ 0, 100, 100 ] }
+		out["np_gradient_%d" % length] = lambda gradient=gradient: neopixel.np_gradient(0, gradient)
+
+		def uncached(gradient=gradient):
+			gradientCache.clear()
+			neopixel.gradientFrames.clear()
+			return neopixel.np_gradient(0, gradient)
+
+		out["np_gradient_uncached_%d" % length] = uncached
+
+	neopixel.setStrand(1, 6, 300, True)
+	chase = [ [ [ 255, 0, 0 ] if abs(i - pos) < 3 else [ 0, 0, 10 ] for i in range(0, 300) ] for pos in range(0, 2) ]
+	commits = [ 0 ]
+
+	def commit():
+		commits[0] += 1
+		return neopixel.np_commit(1, chase[commits[0] % 2])
+
+	out["np_commit_chase_300"] = commit
+
+	rainbow = effect("rainbow", 300, cycle=30)
+	out["effect_frame_rainbow_300"] = lambda: rainbow.frame(7)
+
+	neopixel.setStrand(2, 7, 300, True)
+	player = aumhEffectPlayer(neopixel)
+	played = [ 0 ]
+
+	def play():
+		played[0] += 1
+		return player.play(2, rainbow, played[0])
+
+	out["effect_play_rainbow_300"] = play
+
+	neopixel.setStrand(3, 8, 512, True)
+	neopixel.setStrand(4, 9, 512, True)
+	mapping = aumhMapping(32, 32)
+	mapping.addSegment(neopixel, 3, width=16, rotate=90)
+	mapping.addSegment(neopixel, 4, x=16, rotate=270)
+	images = [ [ [ [ 255, 0, 0 ] if abs(x - pos) < 2 else [ 0, y * 8, 10 ] for x in range(0, 32) ] for y in range(0, 32) ] for pos in range(0, 2) ]
+	shown = [ 0 ]
+
+	def show():
+		shown[0] += 1
+		return mapping.show(images[shown[0] % 2])
+
+	out["mapping_show_32x32"] = show
+
+	npManage = neopixelManageResponse(8)
+	out["np_manage_decode_8"] = lambda: neopixel.np_manage_decode(npManage)
+
+	npGet = neopixelGetResponse(300)
+	out["np_get_decode_300"] = lambda: neopixel.np_get_decode(0, npGet)
+
+	out["publisher_neopixel_manage_8"] = lambda: neopixelManageEntries(npManage)
+
+	digiManage = digitalManageResponse(16)
+	out["publisher_digital_manage_16"] = lambda: digitalManageEntries(digiManage)
+
+	return out
+
+# timeCase
+#
+# @fn, callable to time
+# @repeat, timed runs
+# @minTime, minimum seconds per run
+# @ret, dict with loops per run and a summary of the per call times
+#
+#  Loops are calibrated so a run takes at least minTime, gc is off while
+# timing (As timeit does.)  The best run is the usual figure to compare,
+# rsd (Relative standard deviation of the runs) says how far to trust it.
+def timeCase(fn, repeat, minTime):
+	timer = timeit.Timer(fn)
+
+	loops = 1
+	while timer.timeit(loops) < minTime:
+		loops *= 2
+
+	runs = [ elapsed / loops for elapsed in timer.repeat(repeat, loops) ]
+	out = summarize(runs)
+	mean = out["mean"]
+	out["stdev"] = (sum([ (run - mean) ** 2 for run in runs ]) / len(runs)) ** 0.5
+	out["rsd"] = out["stdev"] / mean if mean else None
+	out["best"] = out["min"]
+	out["loops"] = loops
+
+	return out
+
+# allocationCase
+#
+# @fn, callable to measure
+# @loops, calls to average over
+# @ret, dict of allocation figures per call
+#
+#  retainedObjects is the net number of gc tracked objects each call leaves
+# behind (Counted with collection disabled.)  Where tracemalloc exists the
+# peak bytes allocated during one call and the memory blocks retained per
+# call are added, otherwise they're None.
+def allocationCase(fn, loops):
+	out = { "retainedObjects":None, "peakBytes":None, "retainedBlocks":None }
+
+	fn() #Anything cached on first use shouldn't be counted.
+
+	gc.collect()
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		before = gc.get_count()[0]
+		for i in range(0, loops):
+			fn()
+		out["retainedObjects"] = (gc.get_count()[0] - before) / float(loops)
+	finally:
+		if enabled:
+			gc.enable()
+
+	if tracemalloc:
+		tracemalloc.start()
+		try:
+			current = tracemalloc.get_traced_memory()[0]
+			fn()
+			out["peakBytes"] = tracemalloc.get_traced_memory()[1] - current
+
+			before = tracemalloc.take_snapshot()
+			for i in range(0, loops):
+				fn()
+			after = tracemalloc.take_snapshot()
+			out["retainedBlocks"] = sum([ stat.count_diff for stat in after.compare_to(before, "lineno") ]) / float(loops)
+		finally:
+			tracemalloc.stop()
+
+	return out
+
+# run
+#
+# @args, parsed options
+# @ret, results dict keyed by case name
+def run(args):
+	patterns = [ pattern for pattern in args.cases.split(",") if pattern ]
+	selected = [ (name, fn) for name, fn in cases().items() if any(fnmatch.fnmatch(name, pattern) for pattern in patterns) ]
+
+	out = collections.OrderedDict()
+	for name, fn in selected:
+		print("  %s" % name, file=sys.stderr)
+		timing = timeCase(fn, args.repeat, args.minTime)
+		out[name] = {
+			"time":timing,
+			"allocations":allocationCase(fn, min(timing["loops"], 1000)),
+		}
+
+	return out
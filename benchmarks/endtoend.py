@@ -0,0 +1,232 @@
+###############################################################################
+#                            benchmarks/endtoend.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# End to end benchmarks, full strip frame throughput and digital command      #
+#  latency through aumh against the emulator (Or a real board.)               #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import subprocess
+
+from aumh import *
+
+from benchmarks import summarize
+from benchmarks import cpuTime
+
+# Defaults
+strip_lengths = [ 10, 60, 150, 300, 600 ] #10 leds is the largest unfragmented frame.
+strip_pin = 6
+digital_pin = 13
+
+# options
+#
+# @parser, argparse parser to add our options to
+def options(parser):
+	group = parser.add_argument_group("endtoend")
+	group.add_argument("--port", default=None, help="Serial device to use instead of starting the emulator.")
+	group.add_argument("--lengths", default=",".join([ str(length) for length in strip_lengths ]), help="Comma separated strip lengths.")
+	group.add_argument("--frames", type=int, default=100, help="np_set_bulk frames per strip length.")
+	group.add_argument("--samples", type=int, default=500, help="Digital set/get calls to time.")
+	group.add_argument("--throttle", action="store_true", help="Have the emulator pace traffic at the baud rate.")
+	group.add_argument("--latency", type=float, default=0.0, help="Emulator processing latency per reply.")
+
+# startEmulator
+#
+# @args, parsed options
+# @ret, (process, pty path)
+#
+#  The emulator runs in its own process so that its cpu time doesn't end up
+# in ours.
+def startEmulator(args):
+	script = os.path.splitext(sys.modules[aumhEmulator.__module__].__file__)[0] + ".py"
+	command = [ sys.executable, script, "--latency", str(args.latency) ]
+	if args.throttle:
+		command.append("--throttle")
+
+	proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+	port = proc.stdout.readline().decode("ascii").strip()
+	if not port:
+		proc.wait()
+		raise RuntimeError("emulator failed to start")
+
+	return proc, port
+
+# txDelta
+#
+# @before, txStats copy
+# @after, txStats copy
+# @ret, per key difference
+def txDelta(before, after):
+	return dict((key, after[key] - before[key]) for key in after if isinstance(after[key], (int, float)))
+
+# stripFrames
+#
+# @length, strip length
+# @ret, two full strip np_set_bulk inputs which differ in every pixel
+def stripFrames(length):
+	return [
+		dict((idx, [ idx & 0xff, 0x40, 0x00 ]) for idx in range(0, length)),
+		dict((idx, [ 0x00, 0x40, idx & 0xff ]) for idx in range(0, length)),
+	]
+
+# benchStrip
+#
+# @device, aumh instance
+# @neopixel, aumhNeopixel instance
+# @strandId, strand to use
+# @length, strip length
+# @frames, frames to send
+# @ret, result dict
+def benchStrip(device, neopixel, strandId, length, frames):
+	neopixel.np_add(strandId, strip_pin, length)
+	inputs = stripFrames(length)
+
+	for warm in range(0, 3):
+		neopixel.np_set_bulk(strandId, inputs[warm % 2])
+
+	before = dict(device.txStats)
+	samples = []
+	failures = 0
+
+	cpuStart = cpuTime()
+	tStart = time.time()
+
+	for i in range(0, frames):
+		t = time.time()
+		if neopixel.np_set_bulk(strandId, inputs[i % 2]):
+			failures += 1
+		samples.append(time.time() - t)
+
+	elapsed = time.time() - tStart
+	cpu = cpuTime() - cpuStart
+	delta = txDelta(before, device.txStats)
+
+	neopixel.np_del(strandId)
+
+	return {
+		"length":length,
+		"frames":frames,
+		"failures":failures,
+		"framesPerSec":frames / elapsed if elapsed else None,
+		"frameTime":summarize(samples),
+		"cpuPerFrame":cpu / frames,
+		"payloadBytesPerFrame":length * pixelStruct.size,
+		"wireBytesPerFrame":delta["bytes"] / float(frames),
+		"messagesPerFrame":delta["frames"] / float(frames),
+		"fragmentsPerFrame":delta["fragments"] / float(frames),
+		"fragRetransmits":delta["fragRetransmits"],
+		"writesPerFrame":delta["writes"] / float(frames),
+	}
+
+# fragmentOverhead
+#
+# @strips, benchStrip results
+#
+#  Adds secPerByte to every result and, relative to the largest strip that
+# needed no fragments, fragmentOverhead (Extra time per wire byte, 0.5 is 50%
+# slower per byte.)
+def fragmentOverhead(strips):
+	for strip in strips:
+		strip["secPerByte"] = strip["frameTime"]["mean"] / strip["wireBytesPerFrame"]
+
+	single = [ strip for strip in strips if strip["fragmentsPerFrame"] == 0 ]
+	if not single:
+		return
+
+	base = max(single, key=lambda strip: strip["length"])["secPerByte"]
+	for strip in strips:
+		strip["fragmentOverhead"] = strip["secPerByte"] / base - 1
+
+# benchDigital
+#
+# @device, aumh instance
+# @digital, aumhDigital instance
+# @samples, calls to time for each command
+# @ret, result dict
+def benchDigital(device, digital, samples):
+	out = {}
+
+	setTimes = []
+	failures = 0
+	cpuStart = cpuTime()
+	for i in range(0, samples):
+		t = time.time()
+		if digital.digi_set(digital_pin, i & 1):
+			failures += 1
+		setTimes.append(time.time() - t)
+
+	out["set"] = summarize(setTimes)
+	out["set"]["failures"] = failures
+	out["set"]["cpuPerCall"] = (cpuTime() - cpuStart) / samples
+
+	getTimes = []
+	failures = 0
+	request = { "command":"get", "data":{ "pin":digital_pin } }
+	cpuStart = cpuTime()
+	for i in range(0, samples):
+		t = time.time()
+		if isinstance(device.sendMessage(digital.createMessage(request)), int):
+			failures += 1
+		getTimes.append(time.time() - t)
+
+	out["get"] = summarize(getTimes)
+	out["get"]["failures"] = failures
+	out["get"]["cpuPerCall"] = (cpuTime() - cpuStart) / samples
+
+	return out
+
+# run
+#
+# @args, parsed options
+# @ret, results dict
+def run(args):
+	proc = None
+	port = args.port
+	if not port:
+		proc, port = startEmulator(args)
+
+	try:
+		device = aumh(port)
+		config = aumhConfig(device)
+		neopixel = aumhNeopixel(device)
+		digital = aumhDigital(device)
+
+		identity = config.cfg_manage()
+
+		strips = []
+		for strandId, length in enumerate([ int(length) for length in args.lengths.split(",") if length ]):
+			strips.append(benchStrip(device, neopixel, strandId, length, args.frames))
+
+		fragmentOverhead(strips)
+
+		return {
+			"device":{
+				"port":port,
+				"emulated":proc is not None,
+				"identity":identity,
+				"baud":device.serialBaud,
+				"throttle":args.throttle,
+				"latency":args.latency,
+			},
+			"neopixel":strips,
+			"digital":benchDigital(device, digital, args.samples),
+			"resetStats":dict(device.resetStats),
+			"metrics":device.metrics.snapshot(),
+		}
+
+	finally:
+		if proc:
+			proc.terminate()
+			proc.wait()
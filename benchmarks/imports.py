@@ -0,0 +1,103 @@
+###############################################################################
+#                             benchmarks/imports.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Import time benchmarks, what 'import aumh' and the usual first lookups cost #
+#  in a fresh interpreter and which heavy modules they drag in.               #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import subprocess
+import collections
+
+from benchmarks import summarize
+
+# Statements timed, each in its own interpreter.  'baseline' is what the
+# interpreter costs on its own and is subtracted from the others.
+import_cases = collections.OrderedDict([
+	("baseline", "pass"),
+	("import", "import aumh"),
+	("digital", "import aumh; aumh.aumhDigital"),
+	("neopixel", "import aumh; aumh.aumhNeopixel"),
+	("animation", "import aumh; aumh.aumhAnimation"),
+	("manager", "import aumh; aumh.aumhManager"),
+	("mqtt", "import aumh; aumh.aumhMQTT"),
+	("star", "from aumh import *"),
+])
+
+# Modules reported as loaded (Or not) after each statement.
+watched_modules = [ "serial", "multiprocessing", "paho.mqtt.client", "numpy", "json", "argparse", "aumh.aumhMQTT", "aumh.aumhEmulator" ]
+
+# Run in the child, prints the elapsed time and what got loaded as JSON.
+childScript = """
+import sys, time
+tStart = time.time()
+%s
+elapsed = time.time() - tStart
+count = len(sys.modules)
+loaded = [ name for name in %r if sys.modules.get(name) is not None ]
+import json
+print(json.dumps({ "seconds":elapsed, "modules":count, "loaded":loaded }))
+"""
+
+# options
+#
+# @parser, argparse parser to add our options to
+def options(parser):
+	group = parser.add_argument_group("imports")
+	group.add_argument("--import-runs", type=int, default=20, dest="importRuns", help="Fresh interpreters per import case.")
+
+# importCase
+#
+# @statement, python statement to time
+# @runs, interpreters to start
+# @ret, dict of the time summary, module count and watched modules loaded
+#  (None if the statement failed, paho not being installed for example.)
+def importCase(statement, runs):
+	root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	samples = []
+	last = None
+
+	for i in range(0, runs):
+		proc = subprocess.Popen([ sys.executable, "-c", childScript % (statement, watched_modules) ], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out = proc.communicate()[0]
+		if proc.returncode:
+			return None
+
+		last = json.loads(out.decode("ascii"))
+		samples.append(last["seconds"])
+
+	out = summarize(samples)
+	out["modules"] = last["modules"]
+	out["loaded"] = last["loaded"]
+
+	return out
+
+# run
+#
+# @args, parsed options
+# @ret, results dict keyed by case name
+def run(args):
+	out = collections.OrderedDict()
+	for name, statement in import_cases.items():
+		print("  %s" % name, file=sys.stderr)
+		out[name] = importCase(statement, args.importRuns)
+
+	baseline = out["baseline"]
+	for name, result in out.items():
+		if result and name != "baseline":
+			result["overhead"] = result["min"] - baseline["min"]
+			result["extraModules"] = result["modules"] - baseline["modules"]
+
+	return out
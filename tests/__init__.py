@@ -0,0 +1,15 @@
+###############################################################################
+#                               tests/__init__.py                             #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Tests for the library, run them from the top of the tree with               #
+#  'python -m unittest discover tests'.  Device tests talk to the pty         #
+#  firmware emulator (aumh/aumhEmulator.py), no board is needed.              #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
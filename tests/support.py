@@ -0,0 +1,102 @@
+###############################################################################
+#                               tests/support.py                              #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Shared test fixtures.                                                       #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+import importlib
+
+from aumh import *
+
+# The aumh module itself, for patching its tuning values.
+aumhModule = importlib.import_module("aumh.aumh")
+
+# closeDevice
+#
+# @device, aumh instance whose port may or may not have opened
+def closeDevice(device):
+	try:
+		device.ser.close()
+	except:
+		pass
+
+# EmulatorPorts
+#
+#  Emulators and devices talking to them, started on demand and stopped (Or
+# closed) when the test finishes.
+class EmulatorPorts(unittest.TestCase):
+	# emulated
+	#
+	# @seed, emulator seed
+	# @options, further aumhEmulator arguments
+	# @ret, the running aumhEmulator, its pty is emulator.port.
+	def emulated(self, seed=2, **options):
+		emulator = aumhEmulator(seed=seed, **options)
+		emulator.start()
+		self.addCleanup(emulator.stop)
+		return emulator
+
+	# connect
+	#
+	# @emulator, running aumhEmulator
+	# @options, further aumh arguments
+	# @ret, aumh device on the emulator's pty, handshaken and closed again
+	#  when the test finishes.
+	def connect(self, emulator, **options):
+		device = aumh(emulator.port, **options)
+		self.addCleanup(closeDevice, device)
+		aumhConfig(device, attempts=2, retryDelay=0.1)
+		return device
+
+	# patch
+	#
+	# @module, module to change
+	# @name, module level value
+	# @value, value for the rest of the test
+	def patch(self, module, name, value):
+		self.addCleanup(setattr, module, name, getattr(module, name))
+		setattr(module, name, value)
+
+# EmulatorCase
+#
+#  A fresh aumhEmulator per test with a device, config and neopixel instance
+# talking to it.  Subclasses set faults (emulatorFaults overrides), further
+# emulator arguments and aumh arguments as needed.
+class EmulatorCase(EmulatorPorts):
+	faults = None
+	emulatorOptions = {}
+	deviceOptions = {}
+
+	def setUp(self):
+		self.emulator = self.emulated(seed=1, faults=self.faults, **self.emulatorOptions)
+		self.device = self.connect(self.emulator, **self.deviceOptions)
+		self.neopixel = aumhNeopixel(self.device)
+
+	# addStrand
+	#
+	# @id, strand id
+	# @length, pixels
+	# @ret, the StrandInfo, once the emulator has the strand.
+	def addStrand(self, id, length, pin=6):
+		self.neopixel.np_add(id, pin, length)
+		self.assertIn(id, self.emulator.strands)
+		return self.neopixel.strand(id)
+
+	# shown
+	#
+	# @id, strand id
+	# @ret, r,g,b bytes the emulated strand shows.
+	def shown(self, id):
+		strand = self.emulator.strands[id]
+		return bytes(strand["pixels"][:strand["length"] * 3])
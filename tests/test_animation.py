@@ -0,0 +1,77 @@
+###############################################################################
+#                            tests/test_animation.py                          #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhAnimator ticks and the futures its commits hand back.                   #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class AnimationTest(EmulatorCase):
+	length = 10
+
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.addStrand(0, self.length)
+		self.animator = aumhAnimator(self.neopixel, fps=50)
+		self.addCleanup(self.animator.stop, 1)
+
+	def settle(self, id=0):
+		state = self.animator.strands[id]
+		if state.inFlight is not None:
+			state.inFlight.result(2)
+
+	def testRenderedFramesLand(self):
+		self.animator.add(0, lambda seconds, frame: [ [ int(seconds * 10) % 256, 1, 2 ] ] * self.length)
+
+		now = monotonic()
+		for tick in range(0, 5):
+			self.animator.tick(now + tick)
+			self.settle()
+
+		stats = self.animator.stats(0)
+		self.assertEqual(stats["sent"], 5)
+		self.assertEqual(stats["acked"], 5)
+		self.assertEqual(self.shown(0)[0:3], bytes(bytearray([ 40, 1, 2 ])))
+
+	def testSubmittedFrame(self):
+		self.animator.add(0, None)
+		self.assertEqual(self.animator.submit(0, [ [ 7, 8, 9 ] ] * self.length), 0)
+		self.assertEqual(self.animator.submit(1, [ [ 7, 8, 9 ] ] * self.length), 1)
+
+		self.animator.tick()
+		self.settle()
+		self.assertEqual(self.shown(0), bytes(bytearray([ 7, 8, 9 ] * self.length)))
+
+	def testCommitFuturesForUnknownStrands(self):
+		for future in (self.neopixel.np_commit(9, wait=False), self.neopixel.np_flush(9, wait=False)):
+			self.assertIsInstance(future, aumhFuture)
+			self.assertTrue(future.done())
+			self.assertEqual(future.result(0), 1)
+
+	def testDeletedStrandKeepsRunning(self):
+		self.animator.add(0, lambda seconds, frame: [ [ int(seconds * 100) % 256, 0, 0 ] ] * self.length)
+		self.animator.start()
+		time.sleep(0.1)
+
+		del self.neopixel.strips[0]
+		time.sleep(0.1)
+
+		self.assertTrue(self.animator.thread.is_alive())
+		self.assertTrue(self.animator.stats(0)["failed"])
+
+if __name__ == "__main__":
+	unittest.main()
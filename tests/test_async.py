@@ -0,0 +1,135 @@
+###############################################################################
+#                              tests/test_async.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# The asyncio transport on the emulator, fragments under FF storms and its    #
+#  transactions going through the device's scheduler.                         #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import threading
+import importlib
+import unittest
+
+from aumh import *
+from tests.support import EmulatorPorts, closeDevice
+
+aumhAsyncModule = importlib.import_module("aumh.aumhAsync")
+asyncio = aumhAsyncModule.asyncio
+
+@unittest.skipIf(asyncio is None, "needs asyncio (Or trollius on python 2.)")
+class AsyncTest(EmulatorPorts):
+	faults = { "ff":0.2 }
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		self.addCleanup(self.loop.close)
+
+		self.emulator = self.emulated(seed=4, faults=self.faults)
+		self.device = aumhAsync(self.emulator.port, loop=self.loop)
+		self.addCleanup(closeDevice, self.device)
+		self.assertEqual(self.complete(self.device.bootAsync()), 0)
+
+		self.neopixel = aumhNeopixel(self.device)
+		add = self.neopixel.createMessage({ "id":0, "command":"add", "type":"neopixel", "data":{ "pin":6, "length":100 } })
+		self.assertEqual(self.complete(self.device.sendMessageAsync(add)), 0)
+
+	def complete(self, future):
+		return self.loop.run_until_complete(future)
+
+	# ctrl
+	#
+	# @seed, varies the colors
+	# @ret, (r,g,b bytes of the frame, sendMessageAsync futures for it.)
+	def ctrl(self, seed):
+		leds = dict((i, [ (i + seed) % 256, 1, 2 ]) for i in range(0, 100))
+		futures = [ self.device.sendMessageAsync(msg) for msg in self.neopixel.ledMessages(0, "ctrl", leds) ]
+		return bytes(bytearray(c for i in range(0, 100) for c in leds[i])), futures
+
+	def testFragmentsResent(self):
+		for seed in range(0, 3):
+			frame, futures = self.ctrl(seed)
+			self.assertEqual(self.complete(self.device.asyncCombine(futures)), 0)
+			self.assertEqual(bytes(self.emulator.strands[0]["pixels"][0:300]), frame)
+
+		self.assertTrue(self.emulator.stats["ffs"])
+
+	def testEndlessRejectsGiveUp(self):
+		self.addCleanup(setattr, aumhAsyncModule, "arduino_frag_wait_sec", aumhAsyncModule.arduino_frag_wait_sec)
+		aumhAsyncModule.arduino_frag_wait_sec = 0.2
+		self.emulator.faults["ff"] = 1.0
+
+		tStart = time.time()
+		frame, futures = self.ctrl(0)
+		self.assertEqual(self.complete(self.device.asyncCombine(futures)), 20)
+		self.assertLess(time.time() - tStart, 2)
+
+	def testScheduled(self):
+		before = self.device.scheduler.snapshot()
+
+		get = self.neopixel.createMessage({ "id":0, "command":"get", "type":"neopixel", "data":[] })
+		futures = [ self.device.sendManageMessageAsync(get) for i in range(0, 3) ]
+		frame, sent = self.ctrl(0)
+		self.complete(asyncio.gather(*(futures + sent)))
+
+		after = self.device.scheduler.snapshot()
+		self.assertEqual(after["background"]["grants"] - before["background"]["grants"], 3)
+		self.assertEqual(after["frame"]["grants"] - before["frame"]["grants"], len(sent))
+		self.assertEqual(after["background"]["queued"] + after["frame"]["queued"], 0)
+
+	# blocking
+	#
+	# @fn, blocking call
+	# @ret, future for fn's return value, which is run on a thread of its own.
+	def blocking(self, fn):
+		future = self.device.newFuture()
+
+		def run():
+			ret = fn()
+			self.loop.call_soon_threadsafe(future.set_result, ret)
+
+		thread = threading.Thread(target=run)
+		thread.daemon = True
+		thread.start()
+		return future
+
+	def testMixedWithBlocking(self):
+		frame, sent = self.ctrl(1)
+		leds = dict((i, [ 9, 8, 7 ]) for i in range(90, 100))
+		blocking = self.blocking(lambda: self.neopixel.sendLeds(0, "ctrl", leds))
+		submitted = self.blocking(lambda: self.device.submitMessage(self.neopixel.createMessage({ "id":0, "command":"get", "type":"neopixel", "data":[] })).result(5))
+
+		results = self.complete(asyncio.wait_for(asyncio.gather(*(sent + [ blocking, submitted ]), loop=self.loop), 10, loop=self.loop))
+		self.assertEqual(results[:-1], [ 0 ] * (len(sent) + 1))
+		self.assertNotIn(results[-1], (None, 4, 5))
+
+		frame = bytearray(frame)
+		frame[270:300] = bytearray([ 9, 8, 7 ] * 10)
+		self.assertEqual(bytes(self.emulator.strands[0]["pixels"][0:300]), bytes(frame))
+		self.assertFalse(self.device.scheduler.busy)
+
+	def testGrantedByBlockingOwner(self):
+		self.assertTrue(self.device.scheduler.acquire(LANE_INTERACTIVE))
+		timer = threading.Timer(0.1, self.device.scheduler.release)
+		timer.start()
+
+		frame, sent = self.ctrl(2)
+		self.assertEqual(self.complete(asyncio.wait_for(self.device.asyncCombine(sent), 5, loop=self.loop)), 0)
+		self.assertEqual(bytes(self.emulator.strands[0]["pixels"][0:300]), frame)
+
+	def testDigitalSet(self):
+		digital = aumhDigital(self.device)
+		self.assertEqual(self.complete(digital.digi_set_async(0x012c, 3)), 0)
+		self.assertEqual(self.emulator.pins[0x012c]["state"], 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,141 @@
+###############################################################################
+#                              tests/test_cache.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhTopologyCache on disk, and aumhManager starting from it: cached         #
+#  devices come up without a handshake and are verified afterwards.           #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from aumh import *
+from tests.support import EmulatorPorts, closeDevice
+
+class CacheFileCase(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		self.path = os.path.join(self.directory, "aumh", "topology.json")
+
+	def entry(self, port, identity="00c0ffe1", strips=None):
+		return { "port":port, "identity":identity, "type":None, "strips":strips or [], "pins":[] }
+
+class CacheFileTest(CacheFileCase):
+	def testRoundTrip(self):
+		cache = aumhTopologyCache(self.path)
+		self.assertEqual(cache.ports(), [])
+
+		cache.put(dict(self.entry("/dev/ttyUSB0", strips=[ { "id":0, "pin":6, "length":10 } ]), instances={}))
+		self.assertEqual(os.listdir(os.path.dirname(self.path)), [ "topology.json" ]) #No temporary left behind.
+
+		entry = aumhTopologyCache(self.path).get("/dev/ttyUSB0")
+		self.assertEqual(entry["strips"], [ { "id":0, "pin":6, "length":10 } ])
+		self.assertNotIn("instances", entry)
+		self.assertIn("time", entry)
+
+		cache.invalidate("/dev/ttyUSB0")
+		self.assertIsNone(aumhTopologyCache(self.path).get("/dev/ttyUSB0"))
+
+	def testAtomicWrite(self):
+		cache = aumhTopologyCache(self.path)
+		cache.put(self.entry("/dev/ttyUSB0"))
+
+		os.mkdir(self.path + ".tmp") #The next write can't be made.
+		cache.put(self.entry("/dev/ttyUSB1"), False)
+		self.assertRaises((IOError, OSError), cache.save)
+
+		self.assertEqual(aumhTopologyCache(self.path).ports(), [ "/dev/ttyUSB0" ])
+
+	def testUnusableFiles(self):
+		os.makedirs(os.path.dirname(self.path))
+		for content in ("{ not json", json.dumps({ "version":99, "ports":{ "/dev/ttyUSB0":self.entry("/dev/ttyUSB0") } })):
+			with open(self.path, "w") as fd:
+				fd.write(content)
+
+			self.assertEqual(aumhTopologyCache(self.path).ports(), [])
+
+	def testCopies(self):
+		cache = aumhTopologyCache(self.path)
+		cache.put(self.entry("/dev/ttyUSB0", strips=[ { "id":0, "pin":6, "length":10 } ]), False)
+		cache.get("/dev/ttyUSB0")["strips"].append(None)
+		self.assertEqual(len(cache.get("/dev/ttyUSB0")["strips"]), 1)
+
+class CachedManagerTest(CacheFileCase, EmulatorPorts):
+	def setUp(self):
+		CacheFileCase.setUp(self)
+		self.emulator = self.emulated(identity=0x00c0ffe1, bootTime=0.6)
+
+		device = self.connect(self.emulator)
+		aumhNeopixel(device).np_add(0, 6, 10)
+		closeDevice(device)
+
+	def start(self, entry):
+		cache = aumhTopologyCache(self.path)
+		cache.put(entry)
+		self.written = cache.get(self.emulator.port)["time"]
+
+		manager = aumhManager(cache=cache)
+		self.addCleanup(manager.stop, 5)
+		manager.log = lambda data, mode=None: None
+		manager.addPort(self.emulator.port)
+		return manager, cache
+
+	# verified
+	#
+	# @cache, the manager's cache
+	# @ret, the port's entry once verification rewrote it.
+	def verified(self, cache):
+		deadline = time.time() + 5
+		while time.time() < deadline:
+			entry = cache.get(self.emulator.port)
+			if entry and entry["time"] > self.written:
+				return entry
+
+			time.sleep(0.05)
+
+		self.fail("not verified")
+
+	def testStaleStripsDropped(self):
+		manager, cache = self.start(self.entry(self.emulator.port, strips=[ { "id":0, "pin":6, "length":10 }, { "id":1, "pin":7, "length":5 } ]))
+
+		entry = self.verified(cache)
+		self.assertEqual(entry["strips"], [ { "id":0, "pin":6, "length":10 } ])
+		self.assertIsNone(manager.call("00c0ffe1", "neopixel", "strand", 1))
+		self.assertEqual(manager.call("00c0ffe1", "neopixel", "strand", 0).length, 10)
+
+	def testOtherIdentity(self):
+		manager, cache = self.start(self.entry(self.emulator.port, identity="00c0ffe9", strips=[ { "id":4, "pin":6, "length":3 } ]))
+
+		entry = self.verified(cache)
+		self.assertEqual(entry["identity"], "00c0ffe1")
+		self.assertEqual(manager.identities(), { "00c0ffe1":self.emulator.port })
+		self.assertIsNone(manager.call("00c0ffe1", "neopixel", "strand", 4))
+
+	def testNoHandshake(self):
+		self.emulator.reset() #Booting, nothing answers for a while.
+		bytesIn = self.emulator.stats["bytesIn"]
+
+		tStart = time.time()
+		manager, cache = self.start(self.entry(self.emulator.port, strips=[ { "id":0, "pin":6, "length":10 } ]))
+		self.assertEqual(manager.wait(5), { "00c0ffe1":self.emulator.port })
+		self.assertLess(time.time() - tStart, 0.3) #Up under the cached identity, no boot wait.
+
+		self.assertEqual(self.verified(cache)["strips"], [])
+		self.assertGreater(self.emulator.stats["bytesIn"], bytesIn)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,248 @@
+###############################################################################
+#                              tests/test_clip.py                             #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Clip files written and read back, and aumhClipPlayer on the emulator.       #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import io
+import os
+import time
+import random
+import shutil
+import tempfile
+import importlib
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+aumhClipModule = importlib.import_module("aumh.aumhClip")
+
+def rgbFrame(pixels, n):
+	return bytes(bytearray(((i + n) % 256, (i * 3) % 256, n % 256)[c] for i in range(0, pixels) for c in range(0, 3)))
+
+# paletteFrames
+#
+# @pixels, frame length
+# @count, frame count
+# @ret, index frames cycling through noise (Key frames), long runs (RLE)
+#  and a few changed pixels (Delta.)
+def paletteFrames(pixels, count):
+	rng = random.Random(3)
+	frames = []
+	current = [ 0 ] * pixels
+
+	for n in range(0, count):
+		if n % 4 == 0:
+			current = [ rng.randint(0, 15) for i in range(0, pixels) ]
+		elif n % 4 == 1:
+			current = [ (i // 20) % 16 for i in range(0, pixels) ]
+		else:
+			current = list(current)
+			for k in range(0, 5):
+				current[rng.randint(0, pixels - 1)] = rng.randint(0, 15)
+
+		frames.append(current)
+
+	return frames
+
+class ClipFileCase(unittest.TestCase):
+	def setUp(self):
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory)
+		self.path = os.path.join(directory, "test.clip")
+
+class ClipTest(ClipFileCase):
+	def testRgbRoundTrip(self):
+		writer = aumhClipWriter(self.path, 25, 40)
+		for n in range(0, 30):
+			writer.write(bytearray(rgbFrame(40, n)))
+		writer.close()
+
+		clip = aumhClip(self.path)
+		self.addCleanup(clip.close)
+		self.assertEqual(clip.fps, 25)
+		self.assertEqual(clip.frames, 30)
+		self.assertIsNone(clip.palette)
+
+		for n in (0, 29, 7, 12):
+			self.assertEqual(clip.read(n), rgbFrame(40, n), n)
+		self.assertIsNone(clip.read(30))
+
+class PaletteClipTest(ClipFileCase):
+	pixels = 150
+
+	def setUp(self):
+		ClipFileCase.setUp(self)
+		rng = random.Random(5)
+		self.palette = [ [ rng.randint(0, 255) for c in range(0, 3) ] for i in range(0, 16) ]
+		self.frames = paletteFrames(self.pixels, 200)
+
+	def rgb(self, indices):
+		return bytes(bytearray(c for i in indices for c in self.palette[i]))
+
+	def write(self, **params):
+		writer = aumhPaletteClipWriter(self.path, 30, self.pixels, self.palette, **params)
+		for frame in self.frames:
+			writer.write(bytearray(frame))
+		writer.close()
+
+	# kinds
+	#
+	# @clip, memory mapped palette aumhClip
+	# @ret, FRAME_* kind of every record.
+	def kinds(self, clip):
+		return [ clipRecordStruct.unpack_from(clip.map, offset)[0] for offset in clip.offsets ]
+
+	def testRoundTrip(self):
+		self.write(keyInterval=7)
+
+		clip = aumhClip(self.path)
+		self.addCleanup(clip.close)
+		self.assertTrue(clip.seekable)
+		self.assertEqual(clip.frames, len(self.frames))
+		self.assertLess(os.path.getsize(self.path), len(self.frames) * self.pixels)
+
+		kinds = self.kinds(clip)
+		self.assertEqual(set(kinds), set([ FRAME_KEY, FRAME_RLE, FRAME_DELTA ]))
+		self.assertLessEqual(max(b - a for a, b in zip(clip.keys, list(clip.keys[1:]) + [ clip.frames ])), 7)
+
+		for n in range(0, len(self.frames)):
+			self.assertEqual(clip.read(n), self.rgb(self.frames[n]), n)
+
+		order = list(range(0, len(self.frames)))
+		random.Random(7).shuffle(order)
+		for n in order:
+			self.assertEqual(clip.read(n), self.rgb(self.frames[n]), n)
+
+	def testUncompressed(self):
+		self.write(compress=False)
+
+		clip = aumhClip(self.path)
+		self.addCleanup(clip.close)
+		self.assertEqual(set(self.kinds(clip)), set([ FRAME_KEY ]))
+		self.assertEqual(clip.read(150), self.rgb(self.frames[150]))
+
+	def testStream(self):
+		self.write(keyInterval=7)
+		with io.open(self.path, "rb") as fd:
+			clip = aumhClip(io.BytesIO(fd.read()))
+
+		self.assertFalse(clip.seekable)
+		for n in range(0, len(self.frames), 3):
+			self.assertEqual(clip.read(n), self.rgb(self.frames[n]), n)
+		self.assertRaises(ValueError, clip.read, 0)
+
+	def testNearestIndices(self):
+		near = [ self.palette[3], [ self.palette[5][0] ^ 1, self.palette[5][1], self.palette[5][2] ] ]
+		self.assertEqual(list(bytearray(nearestIndices(near, self.palette))), [ 3, 5 ])
+
+class ClipPlayerTest(EmulatorCase, ClipFileCase):
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		ClipFileCase.setUp(self)
+		self.addStrand(0, 20)
+		self.addStrand(1, 10, pin=7)
+
+	# clip
+	#
+	# @frames, frame count
+	# @fps, frame rate
+	# @ret, an open aumhClip of rgbFrame frames across both strands.
+	def clip(self, frames, fps=50):
+		writer = aumhClipWriter(self.path, fps, 30)
+		for n in range(0, frames):
+			writer.write(bytearray(rgbFrame(30, n)))
+		writer.close()
+
+		clip = aumhClip(self.path)
+		self.addCleanup(clip.close)
+		return clip
+
+	def testPlay(self):
+		player = aumhClipPlayer([ (self.neopixel, 0), (self.neopixel, 1) ])
+		self.assertEqual(player.play(self.clip(10)), 0)
+
+		last = rgbFrame(30, 9)
+		self.assertEqual(self.shown(0), last[0:60])
+		self.assertEqual(self.shown(1), last[60:90])
+		self.assertEqual(player.stats()["played"] + player.stats()["dropped"] + player.stats()["skipped"], 10)
+
+	def testPlayPalette(self):
+		palette = [ [ 0, 0, 0 ], [ 10, 20, 30 ], [ 200, 100, 50 ] ]
+		frames = [ [ (i + n) % 3 for i in range(0, 30) ] for n in range(0, 6) ]
+
+		writer = aumhPaletteClipWriter(self.path, 50, 30, palette)
+		for frame in frames:
+			writer.write(bytearray(frame))
+		writer.close()
+
+		clip = aumhClip(self.path)
+		self.addCleanup(clip.close)
+
+		player = aumhClipPlayer([ (self.neopixel, 0), (self.neopixel, 1) ])
+		self.assertEqual(player.play(clip), 0)
+
+		last = bytes(bytearray(c for i in frames[-1] for c in palette[i]))
+		self.assertEqual(self.shown(0), last[0:60])
+		self.assertEqual(self.shown(1), last[60:90])
+
+	def testDeletedStrand(self):
+		player = aumhClipPlayer([ (self.neopixel, 0), (self.neopixel, 1) ])
+		player.start(self.clip(100), loop=True)
+		time.sleep(0.1)
+
+		del self.neopixel.strips[1]
+		time.sleep(0.1)
+
+		self.assertTrue(player.thread.is_alive())
+		player.stop()
+		self.assertTrue(player.stats()["failed"])
+
+	def testReplacedStrand(self):
+		player = aumhClipPlayer([ (self.neopixel, 0), (self.neopixel, 1) ])
+
+		self.neopixel.np_del(0)
+		self.addStrand(0, 30)
+		self.assertEqual(player.play(self.clip(3)), 0)
+
+		last = rgbFrame(30, 2)
+		self.assertEqual(self.shown(0)[0:60], last[0:60]) #Still the clip's first 20 pixels.
+		self.assertEqual(self.shown(1), last[60:90])
+
+	def testUnfinishedCommitFails(self):
+		self.patch(aumhClipModule, "clip_stop_timeout", 0.1)
+		self.patch(self.neopixel, "np_commit", lambda id, wait=True: aumhFuture()) #Never acknowledged.
+
+		player = aumhClipPlayer([ (self.neopixel, 0) ])
+		self.assertEqual(player.play(self.clip(3)), 1)
+		self.assertEqual(player.stats()["failed"], 1)
+
+	def testStopBounded(self):
+		player = aumhClipPlayer([ (self.neopixel, 0) ])
+		stuck = aumhFuture() #Never acknowledged.
+		self.patch(self.neopixel, "np_commit", lambda id, wait=True: stuck)
+
+		player.start(self.clip(5))
+		thread = player.thread
+		time.sleep(0.2)
+
+		tStart = time.time()
+		player.stop(0.2)
+		self.assertLess(time.time() - tStart, 1)
+
+		stuck.set_result(0)
+		thread.join(2)
+
+if __name__ == "__main__":
+	unittest.main()
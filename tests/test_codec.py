@@ -0,0 +1,78 @@
+###############################################################################
+#                              tests/test_codec.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Wire bytes of the frame codec, checked against frames recorded from the     #
+#  list based encoder it replaced, and delivered through the emulator.        #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import struct
+import binascii
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+# (message, hex of the frame the original encoder built)
+neopixelFrames = [
+	({ "id":1, "command":"ctrl", "type":"neopixel", "data":{ "leds":{ 3:[ 1, 2, 3 ] } } }, "aa000200000001000000a9fb010300010203"),
+	({ "id":1, "command":"ctrli", "type":"neopixel", "data":{ "leds":{ 3:[ 1, 2, 3 ], 300:[ 4, 5, 6 ] } } }, "aa000200010002000000abfb0103000102032c01040506"),
+	({ "id":2, "command":"clear", "type":"neopixel", "data":{ "id":2 } }, "aa000200020001000000abfb02"),
+	({ "id":2, "command":"get", "type":"neopixel", "data":[] }, "aa000200030001000000aafb02"),
+	({ "id":2, "command":"add", "type":"neopixel", "data":{ "pin":6, "length":300 } }, "aa000200fe000100000057fb02062c01"),
+	({ "id":2, "command":"del", "type":"neopixel", "data":{ "id":2 } }, "aa000200ff000100000056fb020202"),
+]
+
+digitalFrames = [
+	({ "command":"get", "data":{ "pin":13 } }, "aa000100000001000100abfb000d"),
+	({ "command":"set", "data":{ "pin":13, "state":1 } }, "aa000100010001000000abfb000d0001"),
+	({ "command":"cpin", "data":{ "pin":13, "direction":1, "class":0 } }, "aa0001007f0001000000d5fb0d000100"),
+	({ "command":"add", "data":{ "pin":13, "direction":1, "class":0 } }, "aa000100fe000100000054fb0d000100"),
+	({ "command":"del", "data":{ "pin":13 } }, "aa000100ff000100000055fb0d000d00"),
+]
+
+def hexFrame(frame):
+	return binascii.hexlify(frameView(frame).tobytes()).decode("ascii")
+
+def ledsFor(count):
+	return dict((i, [ i % 256, (i * 7) % 256, 255 - i % 256 ]) for i in range(0, count))
+
+class CodecTest(EmulatorCase):
+	def testNeopixelFrames(self):
+		for message, expected in neopixelFrames:
+			self.assertEqual(hexFrame(self.neopixel.createMessage(message)), expected, message["command"])
+
+	def testDigitalFrames(self):
+		digital = aumhDigital(self.device)
+		for message, expected in digitalFrames:
+			self.assertEqual(hexFrame(digital.createMessage(message)), expected, message["command"])
+
+	def testFragmentedFrame(self):
+		leds = ledsFor(300)
+		frame = self.neopixel.createMessage({ "id":1, "command":"ctrl", "type":"neopixel", "data":{ "leds":leds } })
+
+		body = b"\x01" + b"".join([ struct.pack("<HBBB", i, *leds[i]) for i in range(0, 300) ])
+		self.assertEqual(hexFrame(frame), "aa19020000002c0100009cfb" + binascii.hexlify(body).decode("ascii"))
+
+	def testTooManyFragments(self):
+		frame = self.neopixel.createMessage({ "id":1, "command":"ctrl", "type":"neopixel", "data":{ "leds":ledsFor(4000) } })
+		self.assertEqual(frame, 9)
+
+	def testDelivered(self):
+		self.addStrand(0, 60)
+		leds = ledsFor(60)
+
+		self.assertEqual(self.neopixel.sendLeds(0, "ctrl", leds), 0)
+		self.assertEqual(self.shown(0), bytes(bytearray(c for i in range(0, 60) for c in leds[i])))
+
+if __name__ == "__main__":
+	unittest.main()
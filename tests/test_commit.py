@@ -0,0 +1,97 @@
+###############################################################################
+#                             tests/test_commit.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# np_commit's choice between sparse, clear and full updates, relative to the  #
+#  frame the strand acknowledged.                                             #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+def frameBytes(frame):
+	return bytes(bytearray(c for pixel in frame for c in pixel))
+
+class CommitTest(EmulatorCase):
+	length = 100
+
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.strand = self.addStrand(0, self.length)
+
+	def counted(self, name):
+		return self.device.metrics.counter(name).value()
+
+	# commit
+	#
+	# @frame, whole strand frame
+	# @form, the form np_commit should pick
+	# @pixels, pixels it should send
+	def commit(self, frame, form, pixels):
+		before = dict((name, self.counted(name)) for name in ("commit_sparse", "commit_clear", "commit_full", "commitPixels"))
+
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+
+		self.assertEqual(self.counted("commit_" + form) - before["commit_" + form], 1, form)
+		self.assertEqual(self.counted("commitPixels") - before["commitPixels"], pixels)
+		self.assertEqual(self.shown(0), frameBytes(frame))
+		self.assertEqual(bytes(self.strand.ackBuf), frameBytes(frame))
+
+	def testSparse(self):
+		frame = [ [ 0, 0, 0 ] ] * self.length
+		frame[3] = [ 1, 2, 3 ]
+		frame[50] = [ 4, 5, 6 ]
+		self.commit(frame, "sparse", 2)
+
+		frame = list(frame)
+		frame[50] = [ 7, 8, 9 ]
+		self.commit(frame, "sparse", 1)
+
+	def testClear(self):
+		busy = [ [ i, 1, 2 ] for i in range(0, self.length) ]
+		self.commit(busy, "sparse", self.length)
+
+		dark = [ [ 0, 0, 0 ] ] * self.length
+		dark[10] = [ 9, 9, 9 ]
+		self.commit(dark, "clear", 1)
+
+	def testFull(self):
+		self.strand.synced = False #Contents unknown, as after a reconnect.
+
+		frame = [ [ 0, 0, 0 ] ] * self.length
+		frame[0] = [ 1, 1, 1 ]
+		self.commit(frame, "full", self.length)
+		self.assertTrue(self.strand.synced)
+
+	def testUnchanged(self):
+		frame = [ [ 5, 5, 5 ] ] * self.length
+		self.commit(frame, "sparse", self.length)
+
+		sent = self.device.txStats["frames"]
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.device.txStats["frames"], sent)
+
+	def testFailedPixelsRetried(self):
+		frame = [ [ 0, 0, 0 ] ] * self.length
+		frame[20] = [ 1, 2, 3 ]
+
+		self.emulator.faults["nak"] = 1.0
+		self.assertNotEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.strand.changed(), [ 20 ])
+
+		self.emulator.faults["nak"] = 0.0
+		self.commit(frame, "sparse", 1)
+
+if __name__ == "__main__":
+	unittest.main()
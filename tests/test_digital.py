@@ -0,0 +1,66 @@
+###############################################################################
+#                             tests/test_digital.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhDigital message bodies (Each with its own pin byte order) and pins     #
+#  added, set and deleted on the emulator.                                    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class DigitalTest(EmulatorCase):
+	pin = 0x012c #Both bytes set, so a swapped byte order shows.
+
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.digital = aumhDigital(self.device)
+
+	def send(self, command, **data):
+		data.setdefault("pin", self.pin)
+		return self.digital.sendMessage(self.digital.createMessage({ "command":command, "data":data }))
+
+	def body(self, command, **data):
+		data.setdefault("pin", self.pin)
+		return self.digital.createMessage({ "command":command, "data":data }).tobytes()[headerStruct.size:]
+
+	def testBodies(self):
+		self.assertEqual(self.body("get"), b"\x01\x2c")
+		self.assertEqual(self.body("set", state=2), b"\x01\x2c\x00\x02")
+		self.assertEqual(self.body("add", direction=OUTPUT, **{ "class":C_ANALOG }), b"\x2c\x01\x01\x01")
+		self.assertEqual(self.body("cpin", direction=INPUT, **{ "class":C_DIGITAL }), b"\x2c\x01\x00\x00")
+		self.assertEqual(self.body("del"), b"\x2c\x01\x2c\x01")
+		self.assertEqual(self.digital.setMessage(self.pin, 2).tobytes(), self.digital.createMessage({ "command":"set", "data":{ "pin":self.pin, "state":2 } }).tobytes())
+
+	def testSet(self):
+		self.assertEqual(self.send("add", direction=OUTPUT, **{ "class":C_DIGITAL }), 0)
+		self.assertEqual(self.digital.digi_set(self.pin, HIGH), 0)
+		self.assertEqual(self.emulator.pins[self.pin], { "direction":OUTPUT, "state":HIGH, "class":C_DIGITAL })
+
+		self.assertEqual(self.digital.digi_set(self.pin, LOW, wait=False).result(5), 0)
+		self.assertEqual(self.emulator.pins[self.pin]["state"], LOW)
+
+		entries = digitalManageEntries(self.digital.digi_manage())
+		self.assertEqual(entries, [ { "pin":self.pin, "direction":OUTPUT, "state":LOW, "class":C_DIGITAL } ])
+
+	def testDel(self):
+		self.assertEqual(self.send("add", direction=INPUT, **{ "class":C_DIGITAL }), 0)
+		self.assertIn(self.pin, self.digital.pins)
+
+		self.assertEqual(self.send("del"), 0)
+		self.assertNotIn(self.pin, self.emulator.pins)
+		self.assertNotIn(self.pin, self.digital.pins)
+
+if __name__ == "__main__":
+	unittest.main()
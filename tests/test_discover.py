@@ -0,0 +1,97 @@
+###############################################################################
+#                            tests/test_discover.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# discover() probing emulated ports in parallel, duplicate identities and    #
+#  ports with nothing behind them.                                            #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import unittest
+
+from aumh import *
+from tests.support import EmulatorPorts, closeDevice, aumhModule
+
+class DiscoverTest(EmulatorPorts):
+	bootTime = 0.6
+
+	def setUp(self):
+		self.emulators = [
+			self.emulated(seed=1, identity=0x00c0ffe1, bootTime=self.bootTime),
+			self.emulated(seed=2, identity=0x00c0ffe2, bootTime=self.bootTime),
+			self.emulated(seed=3, identity=0x00c0ffe1, bootTime=self.bootTime), #Same identity as the first.
+		]
+		self.ports = [ emulator.port for emulator in self.emulators ]
+
+		self.logged = []
+
+	def log(self, data, mode=None):
+		self.logged.append((data, mode))
+
+	def discover(self, **options):
+		for emulator in self.emulators: #Every probe has to wait out a boot.
+			emulator.reset()
+
+		tStart = time.time()
+		registry = discover(ports=self.ports, attempts=1, retryDelay=0.1, log=self.log, **options)
+		return registry, time.time() - tStart
+
+	def testParallel(self):
+		registry, elapsed = self.discover()
+		self.assertLess(elapsed, self.bootTime * 2) #Not one boot after another.
+
+		self.assertEqual(sorted(registry), [ "00c0ffe1", "00c0ffe2" ])
+		self.assertEqual(registry["00c0ffe1"]["port"], self.ports[0]) #The first port in the list wins.
+		self.assertEqual(registry["00c0ffe2"]["port"], self.ports[1])
+		self.assertNotIn("instances", registry["00c0ffe1"])
+
+		self.assertEqual([ mode for data, mode in self.logged ], [ "warn" ])
+		self.assertIn(self.ports[2], self.logged[0][0])
+
+	def testMissingPort(self):
+		self.patch(aumhModule, "reset_backoff_max", 0.01)
+		registry = discover(ports=[ "/dev/null/missing", self.ports[1] ], attempts=1, retryDelay=0.1, log=self.log)
+		self.assertEqual(list(registry), [ "00c0ffe2" ])
+
+	def testTopology(self):
+		device = aumh(self.ports[1])
+		self.addCleanup(closeDevice, device)
+		aumhConfig(device, attempts=2, retryDelay=0.1)
+		aumhNeopixel(device).np_add(3, 6, 12)
+		closeDevice(device)
+
+		registry = discover(ports=[ self.ports[1] ], attempts=1, retryDelay=0.1, log=self.log)
+		self.assertEqual(registry["00c0ffe2"]["strips"], [ { "id":3, "pin":6, "length":12 } ])
+
+	def testKeep(self):
+		registry, elapsed = self.discover(keep=True)
+		for entry in registry.values():
+			instances = entry["instances"]
+			self.addCleanup(closeDevice, instances["device"])
+			self.assertTrue(instances["device"].ser.isOpen())
+			self.assertEqual(instances["device"].identityS, entry["identity"])
+
+	def testManager(self):
+		manager = aumhManager()
+		self.addCleanup(manager.stop, 5)
+		manager.log = self.log
+
+		for emulator in self.emulators:
+			emulator.reset()
+
+		registry = manager.discover(ports=self.ports, attempts=1, retryDelay=0.1)
+		self.assertEqual(sorted(registry), [ "00c0ffe1", "00c0ffe2" ])
+		self.assertEqual(manager.identities(), { "00c0ffe1":self.ports[0], "00c0ffe2":self.ports[1] })
+		self.assertEqual(sorted(manager.workers), sorted(self.ports[0:2]))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,78 @@
+###############################################################################
+#                             tests/test_effects.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhEffectPlayer frames on the emulator, cycles replayed from the cache and #
+#  the futures play hands back.                                               #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+def frameBytes(frame):
+	return bytes(bytearray(int(c) for pixel in frame for c in pixel))
+
+class EffectPlayerTest(EmulatorCase):
+	length = 30
+
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.strand = self.addStrand(0, self.length)
+		self.player = aumhEffectPlayer(self.neopixel)
+		self.effect = effect("chase", self.length)
+
+	def replays(self):
+		return self.device.metrics.counter("effectReplays").value()
+
+	# cycle
+	#
+	# @wait, see aumhEffectPlayer.play
+	#  Plays one period of the effect, checking every frame lands.
+	def cycle(self, wait):
+		for n in range(0, self.effect.period()):
+			ret = self.player.play(0, self.effect, n, wait)
+			if not wait:
+				self.assertIsInstance(ret, aumhFuture)
+				ret = ret.result(2)
+
+			self.assertEqual(ret, 0, n)
+			self.assertEqual(self.shown(0), frameBytes(self.effect.frame(n)), n)
+
+	def testCyclesReplayed(self):
+		self.cycle(True)
+		self.assertEqual(self.replays(), 0)
+
+		self.cycle(True) #Frame 0 went out over a dark strand the first time.
+		self.assertEqual(self.replays(), self.effect.period() - 1)
+
+		self.cycle(True)
+		self.assertEqual(self.replays(), self.effect.period() * 2 - 1)
+
+	def testFutures(self):
+		self.cycle(False)
+		self.cycle(False)
+		self.cycle(False)
+		self.assertEqual(self.replays(), self.effect.period() * 2 - 1)
+		self.assertEqual(bytes(self.strand.ackBuf), frameBytes(self.effect.frame(self.effect.period() - 1)))
+
+	def testUnknownStrand(self):
+		self.assertEqual(self.player.play(3, self.effect, 0), 1)
+
+		future = self.player.play(3, self.effect, 0, wait=False)
+		self.assertIsInstance(future, aumhFuture)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 1)
+
+if __name__ == "__main__":
+	unittest.main()
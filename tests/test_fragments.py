@@ -0,0 +1,113 @@
+###############################################################################
+#                            tests/test_fragments.py                          #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# The fragment path, clean and with the emulator answering FF.                #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase, aumhModule
+
+def frameFor(length, seed=0):
+	return [ [ (i + seed) % 256, (i * 7) % 256, 255 - i % 256 ] for i in range(0, length) ]
+
+def frameBytes(frame):
+	return bytes(bytearray(c for pixel in frame for c in pixel))
+
+class FragmentTest(EmulatorCase):
+	def testFragmentsInOrder(self):
+		self.addStrand(0, 300)
+		frame = frameFor(300)
+
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.shown(0), frameBytes(frame))
+		self.assertEqual(self.device.txStats["fragments"], self.emulator.stats["fragments"])
+		self.assertEqual(self.device.txStats["fragRetransmits"], 0)
+
+	def testOversizedUpdateSplit(self):
+		self.addStrand(0, 4000)
+		frame = frameFor(4000)
+
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.shown(0), frameBytes(frame))
+
+class FragmentRejectTest(EmulatorCase):
+	faults = { "ff":0.2 }
+
+	def testRejectedChunksResent(self):
+		self.addStrand(0, 300)
+
+		for seed in range(0, 3):
+			frame = frameFor(300, seed)
+			self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+			self.assertEqual(self.shown(0), frameBytes(frame))
+
+		self.assertTrue(self.device.txStats["fragRetransmits"])
+		self.assertEqual(self.device.txStats["fragRetransmits"], self.emulator.stats["ffs"])
+
+	def testEndlessRejectsGiveUp(self):
+		self.addStrand(0, 300)
+		self.patch(aumhModule, "arduino_frag_wait_sec", 0.2)
+		self.emulator.faults["ff"] = 1.0
+
+		tStart = time.time()
+		self.assertEqual(self.neopixel.np_commit(0, frameFor(300)), 20)
+		self.assertLess(time.time() - tStart, 2)
+
+class FragmentWindowTest(EmulatorCase):
+	faults = { "ff":0.2 }
+	emulatorOptions = { "fragResync":aumhModule.arduino_frag_resync_sec }
+	deviceOptions = { "fragWindow":4 }
+
+	def testWindowBounded(self):
+		self.assertEqual(self.device.fragWindow, aumhModule.frag_window_max)
+		self.assertEqual(aumh(self.emulator.port, fragWindow=0).fragWindow, 1)
+
+	def testClean(self):
+		self.emulator.faults["ff"] = 0
+		self.addStrand(0, 300)
+		frame = frameFor(300)
+
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.shown(0), frameBytes(frame))
+		self.assertEqual(self.device.fragState["window"], self.device.fragWindow)
+		self.assertEqual(self.emulator.stats["overruns"], 0)
+
+	def testRejectedChunksResent(self):
+		self.addStrand(0, 300)
+
+		for seed in range(0, 3):
+			frame = frameFor(300, seed)
+			self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+			self.assertEqual(self.shown(0), frameBytes(frame))
+
+		self.assertTrue(self.emulator.stats["resynced"])
+		self.assertEqual(self.device.txStats["fragRetransmits"], self.emulator.stats["ffs"])
+		self.assertGreater(self.device.txStats["fragments"], self.emulator.stats["fragments"]) #Chunks behind a FF were dropped.
+
+class FragmentWindowStockTest(EmulatorCase):
+	faults = { "ff":0.2 }
+
+	def testStopAndWait(self):
+		self.assertEqual(self.device.fragWindow, 1)
+		self.addStrand(0, 300)
+		frame = frameFor(300)
+
+		self.assertEqual(self.neopixel.np_commit(0, frame), 0)
+		self.assertEqual(self.shown(0), frameBytes(frame))
+		self.assertEqual(self.device.fragState["window"], 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,99 @@
+###############################################################################
+#                            tests/test_gradient.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# np_gradient on the emulator, its computed and encoded caches, gradients    #
+#  the strand already shows and ones which can't be encoded.                  #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import importlib
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+aumhNeopixelModule = importlib.import_module("aumh.aumhNeopixel")
+
+class GradientTest(EmulatorCase):
+	dataIn = { "start":5, "end":35, "startColor":[ 255, 0, 0 ], "endColor":[ 0, 0, 255 ] }
+
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		aumhNeopixelModule.gradientCache.clear()
+		self.addCleanup(aumhNeopixelModule.gradientCache.clear)
+		self.addStrand(0, 40)
+
+	def expected(self, dataIn):
+		span = gradient(dataIn["end"] - dataIn["start"], [ dataIn["startColor"], dataIn["endColor"] ])
+		return bytes(bytearray(int(c) for pixel in span for c in pixel))
+
+	def skipped(self):
+		return self.device.metrics.counter("gradientsSkipped").value()
+
+	def testShown(self):
+		self.assertEqual(self.neopixel.np_gradient(0, self.dataIn), 0)
+		self.assertEqual(self.shown(0)[15:105], self.expected(self.dataIn))
+		self.assertEqual(self.shown(0)[0:15], bytes(bytearray(15)))
+
+	def testCached(self):
+		self.assertEqual(self.neopixel.np_gradient(0, self.dataIn), 0)
+		self.assertEqual(len(aumhNeopixelModule.gradientCache), 1)
+		self.assertEqual(len(self.neopixel.gradientFrames), 1)
+		frames = self.emulator.stats["frames"]
+
+		self.assertEqual(self.neopixel.np_gradient(0, self.dataIn), 0) #Already shown.
+		self.assertEqual(self.emulator.stats["frames"], frames)
+		self.assertEqual(self.skipped(), 1)
+
+		self.neopixel.np_set(0, { 10:[ 1, 2, 3 ] })
+		self.assertEqual(self.neopixel.np_gradient(0, self.dataIn), 0) #Resent from gradientFrames.
+		self.assertEqual(self.shown(0)[15:105], self.expected(self.dataIn))
+		self.assertEqual(len(self.neopixel.gradientFrames), 1)
+
+		moved = dict(self.dataIn, start=10, end=40)
+		self.assertEqual(self.neopixel.np_gradient(0, moved), 0) #Same pixels, encoded again.
+		self.assertEqual(len(aumhNeopixelModule.gradientCache), 1)
+		self.assertEqual(len(self.neopixel.gradientFrames), 2)
+		self.assertEqual(self.shown(0)[30:120], self.expected(moved))
+
+	def testFutures(self):
+		future = self.neopixel.np_gradient(0, self.dataIn, wait=False)
+		self.assertIsInstance(future, aumhFuture)
+		self.assertEqual(future.result(5), 0)
+
+		future = self.neopixel.np_gradient(0, self.dataIn, wait=False)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 0)
+		self.assertEqual(self.skipped(), 1)
+
+		future = self.neopixel.np_gradient(0, dict(self.dataIn, end=5), wait=False)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 0)
+
+	def testEncodeFailure(self):
+		self.patch(self.neopixel, "ledMessages", lambda id, command, leds: iter([ None ]))
+
+		self.assertEqual(self.neopixel.np_gradient(0, self.dataIn), 1)
+		future = self.neopixel.np_gradient(0, self.dataIn, wait=False)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 1)
+
+		self.assertEqual(len(self.neopixel.gradientFrames), 0)
+		self.assertEqual(self.shown(0), bytes(bytearray(120)))
+
+	def testBadDataIn(self):
+		self.assertIsNone(self.neopixel.np_gradient(0, { "start":0, "end":4 }))
+		self.assertIsNone(self.neopixel.np_gradient(0, dict(self.dataIn, space="lab")))
+		self.assertIsNone(self.neopixel.np_gradient(0, { "start":0, "end":4, "colors":[ [ 1, 2, 3 ] ] }))
+
+if __name__ == "__main__":
+	unittest.main()
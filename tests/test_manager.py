@@ -0,0 +1,97 @@
+###############################################################################
+#                             tests/test_manager.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhManager with thread and process workers on emulated devices, calls     #
+#  routed by identity and workers whose port couldn't be set up.              #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import importlib
+import unittest
+
+from aumh import *
+from tests.support import EmulatorPorts
+
+aumhManagerModule = importlib.import_module("aumh.aumhManager")
+
+class ManagerTest(EmulatorPorts):
+	mode = MANAGER_THREAD
+
+	def setUp(self):
+		self.emulators = [ self.emulated(identity=0x00c0ffe1), self.emulated(identity=0x00c0ffe2) ]
+		self.manager = aumhManager([ emulator.port for emulator in self.emulators ], mode=self.mode)
+		self.addCleanup(self.manager.stop, 5)
+
+		self.logged = []
+		self.manager.log = lambda data, mode=None: self.logged.append((data, mode))
+
+	def testRouted(self):
+		self.assertEqual(self.manager.wait(10), { "00c0ffe1":self.emulators[0].port, "00c0ffe2":self.emulators[1].port })
+
+		self.manager.call("00c0ffe2", "neopixel", "np_add", 0, 6, 12)
+		self.assertNotIn(0, self.emulators[0].strands)
+		self.assertEqual(self.emulators[1].strands[0]["length"], 12)
+
+		futures = self.manager.broadcast("neopixel", "np_manage")
+		self.assertEqual(sorted(futures), [ "00c0ffe1", "00c0ffe2" ])
+		self.assertEqual(len(neopixelManageEntries(futures["00c0ffe2"].result(5))), 1)
+		self.assertEqual(neopixelManageEntries(futures["00c0ffe1"].result(5)), [])
+
+	def testUnknownDevice(self):
+		self.manager.wait(10)
+		self.assertIsNone(self.manager.call("deadbeef", "neopixel", "np_manage"))
+		self.assertIsNone(self.manager.call("00c0ffe1", "neopixel", "_private"))
+
+	def testCallTimeout(self):
+		self.manager.wait(10)
+		self.emulators[0].faults["drop"] = 1.0
+		self.assertIsNone(self.manager.call("00c0ffe1", "mhconfig", "cfg_manage", timeout=0.2))
+		self.assertEqual([ mode for data, mode in self.logged ], [ "err" ])
+
+		self.emulators[0].faults["drop"] = 0
+		self.assertEqual(self.manager.call("00c0ffe1", "mhconfig", "cfg_manage"), "00c0ffe1")
+
+class ProcessManagerTest(ManagerTest):
+	mode = MANAGER_PROCESS
+
+class WorkerSetupTest(EmulatorPorts):
+	# A port which comes up without an identity is closed again.
+	def testUnidentifiedClosed(self):
+		emulator = self.emulated(seed=3)
+		device = aumh(emulator.port, bootTimeout=0)
+		worker = aumhThreadWorker(emulator.port, instances={ "device":device })
+		worker.start()
+		self.addCleanup(worker.stop, 5)
+
+		self.assertTrue(worker.ready.wait(5))
+		self.assertIsNone(worker.identity)
+		self.assertFalse(device.ser.isOpen())
+
+	def testFailedBuildClosed(self):
+		created = []
+		def create(*args):
+			created.append(aumh(*args))
+			return created[-1]
+
+		self.patch(aumhManagerModule, "aumh", create)
+
+		emulator = self.emulated(seed=3)
+		worker = aumhThreadWorker(emulator.port, cached={ "port":emulator.port, "identity":"not hex" })
+		worker.start()
+		self.addCleanup(worker.stop, 5)
+
+		self.assertTrue(worker.ready.wait(5))
+		self.assertIsNone(worker.identity)
+		self.assertFalse(created[0].ser.isOpen())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,111 @@
+###############################################################################
+#                             tests/test_mapping.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Segment index tables of aumhMapping (Rotation, serpentine wiring, flips)    #
+#  and images shown across strands on two emulated devices.                   #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import random
+import itertools
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class PositionsTest(unittest.TestCase):
+	def testRows(self):
+		self.assertEqual(segmentPositions(3, 2), [ (0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (0, 1) ])
+		self.assertEqual(segmentPositions(3, 2, serpentine=False), [ (0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1) ])
+
+	def testColumns(self):
+		self.assertEqual(segmentPositions(2, 3, order="columns"), [ (0, 0), (0, 1), (0, 2), (1, 2), (1, 1), (1, 0) ])
+
+	def testRotate(self):
+		self.assertEqual(segmentPositions(2, 3, rotate=90), [ (1, 0), (1, 1), (1, 2), (0, 2), (0, 1), (0, 0) ])
+		self.assertEqual(segmentPositions(3, 2, rotate=180), [ (2, 1), (1, 1), (0, 1), (0, 0), (1, 0), (2, 0) ])
+		self.assertEqual(segmentPositions(2, 3, rotate=270), [ (0, 2), (0, 1), (0, 0), (1, 0), (1, 1), (1, 2) ])
+
+	def testFlip(self):
+		self.assertEqual(segmentPositions(3, 2, flip=True), [ (2, 0), (1, 0), (0, 0), (0, 1), (1, 1), (2, 1) ])
+
+	def testCoverage(self):
+		for width, height, order, serpentine, rotate, flip in itertools.product([ 1, 3, 4 ], [ 1, 2, 5 ], [ "rows", "columns" ], [ True, False ], [ 0, 90, 180, 270 ], [ False, True ]):
+			case = (width, height, order, serpentine, rotate, flip)
+			positions = segmentPositions(width, height, order, serpentine, rotate, flip)
+
+			self.assertEqual(sorted(positions), sorted((x, y) for x in range(0, width) for y in range(0, height)), case)
+			if serpentine: #Consecutive strand pixels are neighbours.
+				self.assertTrue(all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(positions, positions[1:])), case)
+
+	def testBadArguments(self):
+		self.assertRaises(ValueError, segmentPositions, 2, 2, rotate=45)
+		self.assertRaises(ValueError, segmentPositions, 2, 2, order="diagonal")
+
+class MappingTest(EmulatorCase):
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.addStrand(0, 64)
+
+		self.emulatorB = self.emulated(seed=2)
+		self.neopixelB = aumhNeopixel(self.connect(self.emulatorB))
+		self.neopixelB.np_add(0, 6, 40)
+
+		self.mapping = mappingFromDescription({ "width":12, "height":8, "segments":[
+			{ "device":"a", "strand":0, "width":8, "height":8, "rotate":90 },
+			{ "device":"b", "strand":0, "x":8, "width":4, "height":4 },
+			{ "device":"b", "strand":0, "x":8, "y":4, "width":4, "height":4, "offset":16, "order":"columns", "rotate":180, "flip":True },
+		] }, { "a":self.neopixel, "b":self.neopixelB })
+
+		rng = random.Random(1)
+		self.image = [ [ [ rng.randint(0, 255) for c in range(0, 3) ] for x in range(0, 12) ] for y in range(0, 8) ]
+
+	def captured(self):
+		return [ [ [ int(c) for c in pixel ] for pixel in row ] for row in self.mapping.capture() ]
+
+	def testShow(self):
+		self.assertEqual(self.mapping.show(self.image), 0)
+		self.assertEqual(self.captured(), self.image)
+
+		#Strand pixel 0 of a 90 degree segment is its top right corner.
+		self.assertEqual(self.shown(0)[0:3], bytes(bytearray(self.image[0][7])))
+		self.assertEqual(self.shown(0), bytes(self.neopixel.strand(0).buf))
+
+		shownB = self.emulatorB.strands[0]["pixels"]
+		self.assertEqual(bytes(shownB[0:96]), bytes(self.neopixelB.strand(0).buf[0:96]))
+		self.assertEqual(bytes(shownB[48:51]), bytes(bytearray(self.image[7][8])))
+
+	def testShowFuture(self):
+		future = self.mapping.show(self.image, wait=False)
+		self.assertIsInstance(future, aumhFuture)
+		self.assertEqual(future.result(5), 0)
+		self.assertEqual(self.captured(), self.image)
+
+	def testEmpty(self):
+		future = aumhMapping(4, 4).show([ [ [ 0, 0, 0 ] ] * 4 ] * 4, wait=False)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 0)
+
+	def testDeletedStrand(self):
+		self.assertEqual(self.mapping.show(self.image), 0)
+		del self.neopixelB.strips[0]
+
+		self.assertEqual(self.mapping.show(self.image, wait=False).result(5), 1)
+		self.assertEqual(self.captured()[0][11], [ 0, 0, 0 ])
+
+	def testBadSegments(self):
+		self.assertRaises(ValueError, self.mapping.addSegment, self.neopixelB, 0, x=8, width=4, height=4, offset=30)
+		self.assertRaises(ValueError, self.mapping.addSegment, self.neopixelB, 0, x=10, width=4, height=4)
+		self.assertRaises(ValueError, self.mapping.show, [ [ [ 0, 0, 0 ] ] * 11 ] * 8)
+
+if __name__ == "__main__":
+	unittest.main()
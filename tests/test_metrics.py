@@ -0,0 +1,93 @@
+###############################################################################
+#                             tests/test_metrics.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhMetrics counters and latency histograms, on their own and as a device   #
+#  talking to the emulator fills them in.                                     #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import threading
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class HistogramTest(unittest.TestCase):
+	def testBuckets(self):
+		histogram = aumhHistogram()
+		for value in (0.00005, 0.00015, 0.00015, 0.0003, 100):
+			histogram.observe(value)
+
+		snapshot = histogram.snapshot()
+		self.assertEqual(snapshot["count"], 5)
+		self.assertAlmostEqual(snapshot["sum"], 100.00065)
+		self.assertAlmostEqual(snapshot["mean"], 100.00065 / 5)
+		self.assertEqual(snapshot["buckets"], { "0.0001":1, "0.0002":2, "0.0004":1, "inf":1 })
+		self.assertEqual(snapshot["p50"], 0.0002)
+		self.assertEqual(snapshot["p95"], float("inf"))
+
+	def testEmpty(self):
+		snapshot = aumhHistogram().snapshot()
+		self.assertEqual(snapshot["count"], 0)
+		self.assertIsNone(snapshot["mean"])
+		self.assertIsNone(snapshot["p99"])
+		self.assertEqual(snapshot["buckets"], {})
+
+	def testThreads(self):
+		metrics = aumhMetrics()
+
+		def work():
+			for i in range(0, 1000):
+				metrics.add("events")
+				metrics.observe("latency", 0.001)
+
+		threads = [ threading.Thread(target=work) for i in range(0, 4) ]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(metrics.counter("events").value(), 4000)
+		self.assertEqual(metrics.histogram("latency").snapshot()["count"], 4000)
+
+		self.assertEqual(metrics.counter("events").cells, []) #Exited threads are folded in...
+		self.assertEqual(metrics.counter("events").value(), 4000) #...and still counted.
+
+	def testCommandNames(self):
+		metrics = aumhMetrics({ 0x0002:"neopixel" })
+		self.assertEqual(metrics.commandName((0x0002, 0xfe)), "neopixel.0xfe")
+		self.assertEqual(metrics.commandName((0x0009, 0x01)), "0x0009.0x01")
+
+class DeviceMetricsTest(EmulatorCase):
+	def testSends(self):
+		self.addStrand(0, 10)
+		before = self.device.metrics.snapshot()
+
+		for i in range(0, 3):
+			self.assertEqual(self.neopixel.sendLeds(0, "ctrl", { i:[ 1, 2, 3 ] }), 0)
+
+		after = self.device.metrics.snapshot()
+		self.assertEqual(after["counters"]["framesSent"] - before["counters"]["framesSent"], 3)
+		self.assertEqual(after["counters"]["responses"] - before["counters"]["responses"], 3)
+		self.assertEqual(after["commands"]["neopixel.0x00"]["count"], 3)
+		self.assertGreaterEqual(after["histograms"]["lockWait"]["count"] - before["histograms"]["lockWait"]["count"], 3)
+		self.assertNotIn("errors", after["counters"])
+
+	def testErrors(self):
+		self.assertEqual(self.neopixel.sendLeds(5, "ctrl", { 0:[ 1, 2, 3 ] }), 7) #No such strand, NAK.
+
+		counters = self.device.metrics.snapshot()["counters"]
+		self.assertEqual(counters["errors"], 1)
+		self.assertEqual(counters["naks"], 1)
+
+if __name__ == "__main__":
+	unittest.main()
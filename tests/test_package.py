@@ -0,0 +1,58 @@
+###############################################################################
+#                             tests/test_package.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# The package's lazy exports, each checked in an interpreter of its own so    #
+#  nothing is imported beforehand.                                            #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import subprocess
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class PackageTest(unittest.TestCase):
+	# fresh
+	#
+	# @code, python source, which prints its findings
+	# @ret, stripped output of running it in a new interpreter.
+	def fresh(self, code):
+		env = dict(os.environ, PYTHONPATH=root)
+		process = subprocess.Popen([ sys.executable, "-c", "from __future__ import print_function\n" + code ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=root)
+		out, err = process.communicate()
+		self.assertEqual(process.returncode, 0, err)
+		return out.decode("ascii").strip()
+
+	def testLazy(self):
+		self.assertEqual(self.fresh("import sys, aumh; print(sorted(name for name in sys.modules if name.startswith('aumh.') and sys.modules[name]))"), "[]")
+		self.assertEqual(self.fresh("import sys, aumh; aumh.aumhDigital; print('aumh.aumhDigital' in sys.modules, 'aumh.aumhMapping' in sys.modules)"), "True False")
+
+	def testDottedImport(self):
+		for submodule in ("aumh", "aumhNeopixel", "aumhDigital", "aumhEmulator"):
+			code = "import sys; import aumh.%s; import aumh; print(aumh.%s is sys.modules['aumh.%s'].%s)" % ((submodule,) * 4)
+			self.assertEqual(self.fresh(code), "True", submodule)
+
+	def testDottedImportAfterLoad(self):
+		code = "import sys, aumh; aumh.aumhDigital; import aumh.aumhNeopixel; print(aumh.aumhNeopixel is sys.modules['aumh.aumhNeopixel'].aumhNeopixel, aumh.aumh is sys.modules['aumh.aumh'].aumh)"
+		self.assertEqual(self.fresh(code), "True True")
+
+	def testStarImport(self):
+		code = "import sys; import aumh.aumhNeopixel; from aumh import *; print(aumhNeopixel is sys.modules['aumh.aumhNeopixel'].aumhNeopixel, aumh is sys.modules['aumh.aumh'].aumh, LANE_FRAME)"
+		self.assertEqual(self.fresh(code), "True True 1")
+
+	def testUnknownName(self):
+		self.assertEqual(self.fresh("import aumh; print(hasattr(aumh, 'noSuchName'))"), "False")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+###############################################################################
+#                             tests/test_reader.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhReader on a pty: responses arriving in pieces, fragment reply lines,    #
+#  queued statuses and timeouts, plus ports without an fd to select on.       #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import os
+import tty
+import time
+import serial
+import threading
+import unittest
+
+from aumh import *
+
+class ReaderTest(unittest.TestCase):
+	def setUp(self):
+		self.master, slave = os.openpty()
+		tty.setraw(slave)
+		self.addCleanup(os.close, self.master)
+
+		self.ser = serial.Serial(os.ttyname(slave), timeout=5)
+		os.close(slave)
+		self.addCleanup(self.ser.close)
+
+		self.metrics = aumhMetrics()
+		self.reader = aumhReader(self.ser, self.metrics)
+
+	def later(self, delay, data):
+		timer = threading.Timer(delay, os.write, (self.master, data))
+		timer.start()
+		self.addCleanup(timer.join)
+
+	def testPartialResponse(self):
+		os.write(self.master, b"\x01\x02")
+		self.later(0.1, b"\x03" + r_ack)
+
+		tStart = time.time()
+		self.assertEqual(self.reader.response(5), (r_ack, b"\x01\x02\x03" + r_ack))
+		self.assertLess(time.time() - tStart, 1)
+		self.assertEqual(self.reader.buf, bytearray())
+		self.assertEqual(self.metrics.counter("responses").value(), 1)
+
+	def testSplitTerminator(self):
+		os.write(self.master, b"AC")
+		self.later(0.1, b"K\r\n")
+		self.assertEqual(self.reader.response(5), (r_ack, r_ack))
+
+	def testNak(self):
+		os.write(self.master, r_nak)
+		self.assertEqual(self.reader.response(5), (r_nak, r_nak))
+		self.assertEqual(self.metrics.counter("naks").value(), 1)
+
+	def testResponseTimeout(self):
+		os.write(self.master, b"\x01")
+
+		tStart = time.time()
+		self.assertEqual(self.reader.response(0.2), (None, b"\x01"))
+		self.assertGreaterEqual(time.time() - tStart, 0.2)
+		self.assertLess(time.time() - tStart, 1)
+		self.assertEqual(self.metrics.counter("timeouts").value(), 1)
+
+	def testFragmentReplies(self):
+		os.write(self.master, b"CT\r\nFF\r\n??\r\n")
+		self.assertEqual(self.reader.fragmentReply(1), g_uart_frag_ok)
+		self.assertEqual(self.reader.fragmentReply(1), g_uart_frag_bad)
+		self.assertEqual(self.reader.fragmentReply(1), "")
+
+		self.later(0.1, b"C")
+		self.assertIsNone(self.reader.fragmentReply(0.3)) #No line yet.
+		os.write(self.master, b"T\r\n")
+		self.assertEqual(self.reader.fragmentReply(1), g_uart_frag_ok)
+
+	def testQueuedStatuses(self):
+		os.write(self.master, r_ack + b"\x05" + r_nak + r_ack)
+		self.assertEqual(self.reader.nextStatus(1), r_ack)
+		self.assertEqual(self.reader.nextStatus(1), r_nak)
+		self.assertEqual(self.reader.nextStatus(1), r_ack)
+		self.assertIsNone(self.reader.nextStatus(0.1))
+
+class ReaderNoFdTest(unittest.TestCase):
+	def setUp(self):
+		self.ser = serial.serial_for_url("loop://", timeout=5)
+		self.addCleanup(self.ser.close)
+		self.reader = aumhReader(self.ser)
+
+	def testResponse(self):
+		self.assertIsNone(self.reader.fd)
+		self.ser.write(b"\x09" + r_ack)
+		self.assertEqual(self.reader.response(1), (r_ack, b"\x09" + r_ack))
+
+	def testTimeout(self):
+		tStart = time.time()
+		self.assertEqual(self.reader.response(0.2), (None, b""))
+		self.assertLess(time.time() - tStart, 1)
+		self.assertEqual(self.ser.timeout, 5)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,75 @@
+###############################################################################
+#                              tests/test_reset.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# serialReset's open backoff and waitForBoot probing the emulator until it    #
+#  has booted.                                                                #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase, aumhModule
+
+class ResetTest(EmulatorCase):
+	emulatorOptions = { "bootTime":0.3 }
+
+	def testWaitForBoot(self):
+		self.emulator.reset()
+
+		tStart = time.time()
+		self.assertEqual(self.device.waitForBoot(5), 0)
+		self.assertGreaterEqual(time.time() - tStart, 0.2)
+		self.assertLess(time.time() - tStart, 1.5)
+
+	def testWaitForBootTimeout(self):
+		self.emulator.faults["drop"] = 1.0
+
+		tStart = time.time()
+		self.assertEqual(self.device.waitForBoot(0.3), 1)
+		self.assertLess(time.time() - tStart, 1)
+		self.assertEqual(self.device.reader.buf, bytearray())
+
+	def testReset(self):
+		before = dict(self.device.resetStats)
+
+		tStart = time.time()
+		self.assertEqual(self.device.serialReset(), 0)
+		self.assertLess(time.time() - tStart, 1) #Answered straight away, no fixed sleep.
+
+		self.assertEqual(self.device.resetStats["resets"] - before["resets"], 1)
+		self.assertEqual(self.device.resetStats["reconnects"] - before["reconnects"], 1)
+		self.assertEqual(self.device.resetStats["openFailures"], before["openFailures"])
+
+		self.addStrand(0, 5) #Still talking.
+
+	def testBackoff(self):
+		self.patch(aumhModule, "reset_backoff_base", 0.02)
+		self.patch(aumhModule, "reset_backoff_max", 0.04)
+		self.device.ser.close()
+		self.device.serName = "/dev/null/missing"
+
+		delays = [ min(0.04, 0.02 * (2 ** (attempt - 1))) for attempt in range(1, aumhModule.reset_attempts) ]
+
+		tStart = time.time()
+		self.assertNotEqual(self.device.serialReset(), 0)
+		elapsed = time.time() - tStart
+
+		self.assertGreaterEqual(elapsed, sum(delays) / 2.0)
+		self.assertLess(elapsed, sum(delays) + 0.5)
+		self.assertEqual(self.device.resetStats["openFailures"], aumhModule.reset_attempts)
+		self.assertEqual(self.device.resetStats["failures"], 1)
+		self.assertEqual(self.device.metrics.counter("resetFailures").value(), 1)
+
+if __name__ == "__main__":
+	unittest.main()
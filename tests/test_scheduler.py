@@ -0,0 +1,147 @@
+###############################################################################
+#                            tests/test_scheduler.py                          #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Lane ordering, deadlines and burst fairness of aumhScheduler, and the       #
+#  lanes device traffic is accounted to.                                      #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import time
+import threading
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class SchedulerTest(unittest.TestCase):
+	# grantOrder
+	#
+	# @scheduler, aumhScheduler
+	# @waiters, list of (name, lane, delay before queueing)
+	# @ret, names in the order they were granted the scheduler, with every
+	#  waiter queued while the test holds it.
+	def grantOrder(self, scheduler, waiters):
+		order = []
+
+		def wait(name, lane):
+			scheduler.acquire(lane)
+			order.append(name)
+			scheduler.release()
+
+		self.assertTrue(scheduler.acquire(LANE_FRAME))
+
+		threads = []
+		for name, lane, delay in waiters:
+			time.sleep(delay)
+			thread = threading.Thread(target=wait, args=(name, lane))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+			while scheduler.waiting() < len(threads):
+				time.sleep(0.001)
+
+		scheduler.release()
+		for thread in threads:
+			thread.join(5)
+
+		return order
+
+	def testLanePriority(self):
+		order = self.grantOrder(aumhScheduler(), [
+			("background", LANE_BACKGROUND, 0),
+			("frame", LANE_FRAME, 0),
+			("interactive", LANE_INTERACTIVE, 0),
+		])
+
+		self.assertEqual(order, [ "interactive", "frame", "background" ])
+
+	def testFifoWithinLane(self):
+		order = self.grantOrder(aumhScheduler(), [ (n, LANE_FRAME, 0) for n in range(0, 5) ])
+		self.assertEqual(order, list(range(0, 5)))
+
+	def testDeadline(self):
+		scheduler = aumhScheduler(deadlines={ LANE_BACKGROUND:0.05 })
+		order = self.grantOrder(scheduler, [
+			("background", LANE_BACKGROUND, 0),
+			("interactive", LANE_INTERACTIVE, 0.1),
+		])
+
+		self.assertEqual(order, [ "background", "interactive" ])
+		self.assertEqual(scheduler.snapshot()["background"]["overdue"], 1)
+
+	def testBurst(self):
+		order = self.grantOrder(aumhScheduler(burst=2), [
+			("background", LANE_BACKGROUND, 0),
+			("i1", LANE_INTERACTIVE, 0),
+			("i2", LANE_INTERACTIVE, 0),
+			("i3", LANE_INTERACTIVE, 0),
+		])
+
+		self.assertEqual(order, [ "i1", "i2", "background", "i3" ])
+
+	def testAcquireTimeout(self):
+		scheduler = aumhScheduler()
+		self.assertTrue(scheduler.acquire(LANE_FRAME))
+		self.assertFalse(scheduler.acquire(LANE_INTERACTIVE, 0.05))
+		self.assertEqual(scheduler.waiting(), 0)
+		scheduler.release()
+
+	def testAsyncTickets(self):
+		scheduler = aumhScheduler()
+		granted = []
+
+		def blocking():
+			scheduler.acquire(LANE_FRAME)
+			granted.append("blocking")
+			scheduler.release()
+
+		scheduler.acquireAsync(LANE_FRAME, lambda: granted.append("first"))
+		self.assertEqual(granted, [ "first" ])
+
+		scheduler.acquireAsync(LANE_BACKGROUND, lambda: granted.append("background"))
+		scheduler.acquireAsync(LANE_INTERACTIVE, lambda: granted.append("interactive"))
+		self.assertEqual(scheduler.waiting(), 2)
+
+		scheduler.release()
+		self.assertEqual(granted, [ "first", "interactive" ])
+
+		thread = threading.Thread(target=blocking)
+		thread.daemon = True
+		thread.start()
+		while scheduler.waiting() < 2:
+			time.sleep(0.001)
+
+		scheduler.release() #To the blocking frame waiter, which hands it to background.
+		thread.join(5)
+		self.assertEqual(granted, [ "first", "interactive", "blocking", "background" ])
+
+		self.assertTrue(scheduler.busy)
+		scheduler.release()
+		self.assertFalse(scheduler.busy)
+		self.assertEqual(scheduler.snapshot()["background"]["grants"], 1)
+
+class DeviceLaneTest(EmulatorCase):
+	def testTrafficLanes(self):
+		self.addStrand(0, 10)
+		before = self.device.scheduler.snapshot()
+
+		self.neopixel.np_manage()
+		self.neopixel.np_commit(0, [ [ 1, 2, 3 ] ] * 10)
+		aumhDigital(self.device).digi_set(13, 1)
+
+		after = self.device.scheduler.snapshot()
+		for lane in ("interactive", "frame", "background"):
+			self.assertEqual(after[lane]["grants"] - before[lane]["grants"], 1, lane)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,74 @@
+###############################################################################
+#                             tests/test_stages.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# Stage hooks on the send path (aumh.addStageHook) and aumhStageRecorder.    #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class StageTest(EmulatorCase):
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.addStrand(0, 10)
+
+		self.events = []
+		self.device.addStageHook(self.hook)
+
+	def hook(self, stage, seconds, frame):
+		self.events.append((stage, seconds, frameCommand(frame)))
+
+	def testSendStages(self):
+		msg = self.neopixel.createMessage({ "id":0, "command":"ctrl", "type":"neopixel", "data":{ "leds":{ 1:[ 1, 2, 3 ] } } })
+		self.assertEqual(self.device.sendMessage(msg), 0)
+
+		self.assertEqual([ event[0] for event in self.events ], [ "build", "lock", "write", "firstByte", "drain" ])
+		self.assertEqual(set(event[2] for event in self.events), set([ (0x0002, 0x00) ]))
+		self.assertFalse([ event for event in self.events if event[1] < 0 ])
+
+	def testDecode(self):
+		self.neopixel.np_manage()
+		self.assertEqual([ event[0] for event in self.events ][-1], "decode")
+		self.assertIn("firstByte", [ event[0] for event in self.events ])
+
+	def testFailingHook(self):
+		def broken(stage, seconds, frame):
+			raise RuntimeError(stage)
+
+		self.device.addStageHook(broken)
+		self.assertEqual(self.neopixel.sendLeds(0, "ctrl", { 2:[ 4, 5, 6 ] }), 0)
+		self.assertIn("drain", [ event[0] for event in self.events ])
+
+	def testRemoved(self):
+		self.device.removeStageHook(self.hook)
+		self.assertEqual(self.neopixel.sendLeds(0, "ctrl", { 2:[ 4, 5, 6 ] }), 0)
+		self.assertEqual(self.events, [])
+
+	def testRecorder(self):
+		recorder = aumhStageRecorder(every=2, recent=4)
+		self.device.addStageHook(recorder)
+
+		for i in range(0, 6):
+			self.assertEqual(self.neopixel.sendLeds(0, "ctrl", { i:[ i, 0, 0 ] }), 0)
+
+		snapshot = recorder.snapshot()
+		self.assertEqual(sorted(snapshot["stages"]), sorted(stageNames))
+		self.assertEqual(snapshot["stages"]["write"]["count"], 3)
+		self.assertEqual(snapshot["stages"]["decode"]["count"], 0)
+		self.assertEqual(len(snapshot["recent"]), 4)
+		self.assertEqual(snapshot["recent"][-1][3], (0x0002, 0x00))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,159 @@
+###############################################################################
+#                              tests/test_strand.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# StrandInfo framebuffers, their numpy views and resizes, with and without    #
+#  numpy.                                                                     #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import importlib
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+np = importlib.import_module("aumh.aumhNeopixel").np
+
+# StrandCase
+#
+#  Tests run on both sides of StrandInfo, mixed into the TestCases below.
+class StrandCase(object):
+	arrays = True
+
+	# strand
+	#
+	# @ret, StrandInfo, without its array views unless arrays is set.
+	def strand(self, length, synced=True):
+		strand = StrandInfo(0, 6, length, synced)
+		if not self.arrays:
+			strand.pixels = strand.dirty = strand.acked = None
+
+		return strand
+
+	def testPut(self):
+		strand = self.strand(5)
+		strand.put(3, [ [ 1, 2, 3 ], [ 4, 5, 6 ], [ 7, 8, 9 ] ]) #The last one is past the end.
+		self.assertEqual(bytes(strand.buf), b"\x00" * 9 + b"\x01\x02\x03\x04\x05\x06")
+		self.assertEqual(strand.leds(), { 3:[ 1, 2, 3 ], 4:[ 4, 5, 6 ] })
+
+		strand.putLeds({ 0:[ 256 + 9, 0, 0 ], 7:[ 1, 1, 1 ], -1:[ 1, 1, 1 ] })
+		self.assertEqual(strand.color(0), [ 9, 0, 0 ])
+		self.assertEqual(sorted(strand.leds()), [ 0, 3, 4 ])
+
+		strand.clean([ 3, 9 ])
+		self.assertEqual(sorted(strand.leds()), [ 0, 4 ])
+
+	def testChanged(self):
+		strand = self.strand(4)
+		strand.putBytes(1, b"\x01\x01\x01\x02\x02\x02")
+		self.assertEqual(strand.changed(), [ 1, 2 ])
+		self.assertEqual(strand.lit(), [ 1, 2 ])
+
+		strand.ack({ 1:[ 1, 1, 1 ] })
+		self.assertEqual(strand.changed(), [ 2 ])
+
+		strand.blank()
+		self.assertEqual(strand.changed(), [])
+		self.assertEqual(strand.leds(), {})
+		self.assertEqual(self.strand(3, synced=False).changed(), [ 0, 1, 2 ])
+
+	def testLoad(self):
+		strand = self.strand(3, synced=False)
+		strand.put(0, [ [ 5, 5, 5 ] ] * 3)
+		strand.load(b"\x00\x01\x02\x03\x00\x04\x05\x06\x00\x07\x08\x09", 3)
+
+		self.assertEqual(bytes(strand.buf), b"\x01\x02\x03\x04\x05\x06\x07\x08\x09")
+		self.assertEqual(bytes(strand.ackBuf), bytes(strand.buf))
+		self.assertEqual(strand.leds(), {})
+		self.assertTrue(strand.synced)
+
+	def testResized(self):
+		strand = self.strand(3)
+		strand.put(0, [ [ 1, 2, 3 ], [ 4, 5, 6 ], [ 7, 8, 9 ] ])
+		strand.ack({ 0:[ 1, 2, 3 ] })
+		strand.clean([ 1 ])
+
+		grown = strand.resized(5)
+		self.assertEqual(grown.length, 5)
+		self.assertEqual(bytes(grown.buf), bytes(strand.buf) + b"\x00" * 6)
+		self.assertEqual(bytes(grown.ackBuf[0:3]), b"\x01\x02\x03")
+		self.assertEqual(sorted(grown.leds()), [ 0, 2 ])
+
+		shrunk = strand.resized(2)
+		self.assertEqual(bytes(shrunk.buf), b"\x01\x02\x03\x04\x05\x06")
+		self.assertEqual(sorted(shrunk.leds()), [ 0 ])
+		self.assertEqual(shrunk.changed(), [ 1 ])
+
+		self.assertEqual(strand.resized(0).leds(), {})
+
+@unittest.skipIf(np is None, "needs numpy")
+class StrandArrayTest(StrandCase, unittest.TestCase):
+	def testViews(self):
+		strand = self.strand(4)
+		self.assertEqual(strand.pixels.shape, (4, 3))
+
+		strand.pixels[1] = [ 7, 8, 9 ]
+		strand.dirty[1] = True
+		self.assertEqual(bytes(strand.buf[3:6]), b"\x07\x08\x09")
+		self.assertEqual(strand.dirtyBuf[1], 1)
+
+		strand.ackBuf[0:3] = b"\x01\x02\x03"
+		self.assertEqual(strand.acked[0].tolist(), [ 1, 2, 3 ])
+
+	def testResizedViews(self):
+		strand = self.strand(2).resized(6)
+		self.assertEqual(strand.pixels.shape, (6, 3))
+		self.assertEqual(strand.dirty.shape, (6,))
+
+		strand.pixels[5] = [ 1, 2, 3 ]
+		self.assertEqual(bytes(strand.buf[15:18]), b"\x01\x02\x03")
+
+	def testIndices(self):
+		strand = self.strand(4)
+		palette = np.zeros((256, 3), dtype=np.uint8)
+		palette[3] = [ 9, 8, 7 ]
+		strand.putIndices(2, palette, np.array([ 3, 0, 3 ], dtype=np.uint8))
+		self.assertEqual(bytes(strand.buf[6:12]), b"\x09\x08\x07\x00\x00\x00")
+
+class StrandListTest(StrandCase, unittest.TestCase):
+	arrays = False
+
+	def testIndices(self):
+		strand = self.strand(4)
+		palette = [ b"\x00\x00\x00" ] * 256
+		palette[3] = b"\x09\x08\x07"
+		strand.putIndices(2, palette, bytearray([ 3, 0, 3 ]))
+		self.assertEqual(bytes(strand.buf[6:12]), b"\x09\x08\x07\x00\x00\x00")
+
+class SetStrandTest(EmulatorCase):
+	def testResizeKeepsPixels(self):
+		strand = self.addStrand(0, 10)
+		strand.put(0, [ [ 1, 2, 3 ] ] * 10)
+		self.assertIs(self.neopixel.setStrand(0, 6, 10), strand)
+
+		resized = self.neopixel.setStrand(0, 7, 15)
+		self.assertIs(self.neopixel.strand(0), resized)
+		self.assertEqual((resized.pin, resized.length), (7, 15))
+		self.assertEqual(bytes(resized.buf), b"\x01\x02\x03" * 10 + b"\x00" * 15)
+
+	def testManageResizes(self):
+		strand = self.addStrand(0, 10)
+		strand.put(0, [ [ 1, 2, 3 ] ] * 10)
+		self.neopixel.setStrand(0, 6, 4) #What we believed.
+
+		self.neopixel.np_manage()
+		strand = self.neopixel.strand(0)
+		self.assertEqual(strand.length, 10)
+		self.assertEqual(bytes(strand.buf[0:12]), b"\x01\x02\x03" * 4)
+
+if __name__ == "__main__":
+	unittest.main()
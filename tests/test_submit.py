@@ -0,0 +1,122 @@
+###############################################################################
+#                             tests/test_submit.py                            #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# aumhFuture and combine(), plus submitMessage and batch() pipelining frames  #
+#  to the emulator.                                                           #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase, aumhModule
+
+class FutureTest(unittest.TestCase):
+	def testResolved(self):
+		future = aumhFuture.resolved(3)
+		self.assertTrue(future.done())
+		self.assertEqual(future.result(0), 3)
+
+		called = []
+		future.add_done_callback(called.append)
+		self.assertEqual(called, [ future ])
+
+	def testTimeout(self):
+		future = aumhFuture()
+		self.assertIsNone(future.result(0.05))
+		self.assertFalse(future.done())
+
+	def testCombine(self):
+		self.assertEqual(aumhFuture.combine([]).result(0), 0)
+
+		single = aumhFuture()
+		self.assertIs(aumhFuture.combine([ single ]), single)
+
+		futures = [ aumhFuture() for i in range(0, 3) ]
+		combined = aumhFuture.combine(futures)
+
+		futures[2].set_result(4)
+		futures[0].set_result(0)
+		self.assertFalse(combined.done())
+
+		futures[1].set_result(7)
+		self.assertTrue(combined.done())
+		self.assertEqual(combined.result(0), 7) #First non-zero in list order, not completion order.
+
+	def testCombineClean(self):
+		futures = [ aumhFuture.resolved(0) for i in range(0, 3) ]
+		self.assertEqual(aumhFuture.combine(futures).result(0), 0)
+
+class SubmitTest(EmulatorCase):
+	def setUp(self):
+		EmulatorCase.setUp(self)
+		self.addStrand(0, 300)
+
+		self.groups = []
+		sendPipelined = self.device.sendPipelined
+
+		def recording(views, lane):
+			self.groups.append(len(views))
+			return sendPipelined(views, lane)
+
+		self.patch(self.device, "sendPipelined", recording)
+
+	def message(self, pixel, color):
+		return self.neopixel.createMessage({ "id":0, "command":"ctrli", "type":"neopixel", "data":{ "leds":{ pixel:color } } })
+
+	def testSubmit(self):
+		futures = [ self.device.submitMessage(self.message(i, [ i, 1, 2 ])) for i in range(0, 8) ]
+		self.assertEqual([ future.result(5) for future in futures ], [ 0 ] * 8)
+
+		for i in range(0, 8):
+			self.assertEqual(self.shown(0)[i * 3:i * 3 + 3], bytes(bytearray([ i, 1, 2 ])))
+
+	def testBatchPipelined(self):
+		frames = self.emulator.stats["frames"]
+
+		with self.device.batch() as batch:
+			futures = [ self.device.submitMessage(self.message(i, [ 9, 9, i ])) for i in range(0, 8) ]
+			self.assertFalse([ future for future in futures if future.done() ]) #Held until the block exits.
+
+		self.assertEqual(batch.wait(0), [ 0 ] * 8)
+		self.assertEqual(self.emulator.stats["frames"] - frames, 8)
+		self.assertGreater(max(self.groups), 1)
+		self.assertLessEqual(max(self.groups), aumhModule.max_in_flight)
+		self.assertEqual(self.shown(0)[21:24], b"\x09\x09\x07")
+
+	def testNestedBatch(self):
+		with self.device.batch() as outer:
+			first = self.device.submitMessage(self.message(0, [ 1, 1, 1 ]))
+			with self.device.batch():
+				inner = self.device.submitMessage(self.message(1, [ 2, 2, 2 ]))
+
+			self.assertEqual(inner.result(0), 0)
+			self.assertFalse(first.done())
+			last = self.device.submitMessage(self.message(2, [ 3, 3, 3 ]))
+
+		self.assertEqual(outer.wait(0), [ 0, 0 ])
+		self.assertEqual(last.result(0), 0)
+
+	def testUnpipelinable(self):
+		leds = dict((i, [ i % 256, 0, 0 ]) for i in range(0, 300)) #Fragmented.
+		futures = [ self.device.submitMessage(msg) for msg in self.neopixel.ledMessages(0, "ctrl", leds) ]
+		futures.append(self.device.submitMessage(self.message(0, [ 5, 5, 5 ])))
+
+		self.assertEqual(aumhFuture.combine(futures).result(5), 0)
+		self.assertEqual(self.shown(0)[0:3], b"\x05\x05\x05")
+		self.assertEqual(self.shown(0)[3:6], b"\x01\x00\x00")
+
+	def testUnbuilt(self):
+		self.assertEqual(self.device.submitMessage(2).result(0), 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,75 @@
+###############################################################################
+#                              tests/test_writes.py                           #
+#                                                                             #
+# Python library for controlling an arduino using Arduino_UART_MessageHandler #
+#                                                                             #
+# The write path, one serial write per frame or fragment whichever way the   #
+#  frame is held.                                                             #
+#                                                                             #
+# Copyright(C) 2015, Destrudo Dole                                            #
+#                                                                             #
+# This program is free software; you can redistribute it and/or modify it     #
+# under the terms of the GNU General Public License as published by the Free  #
+# Software Foundation, version 2 of the license.                              #
+###############################################################################
+
+from __future__ import print_function
+
+import unittest
+
+from aumh import *
+from tests.support import EmulatorCase
+
+class WriteTest(EmulatorCase):
+	# counted
+	#
+	#  Counts the port's write calls from here on.
+	def counted(self):
+		calls = []
+		write = self.device.ser.write
+
+		def counting(data):
+			calls.append(len(data))
+			return write(data)
+
+		self.patch(self.device.ser, "write", counting)
+		return calls
+
+	def testSingleWrite(self):
+		self.addStrand(0, 10)
+		before = dict(self.device.txStats)
+		bytesIn = self.emulator.stats["bytesIn"]
+		calls = self.counted()
+
+		self.assertEqual(self.neopixel.sendLeds(0, "ctrl", { 1:[ 1, 2, 3 ], 2:[ 4, 5, 6 ] }), 0)
+		self.assertEqual(self.device.txStats["lastFrameWrites"], 1)
+		self.assertEqual(self.device.txStats["writes"] - before["writes"], 1)
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(calls[0], self.device.txStats["bytes"] - before["bytes"])
+		self.assertEqual(self.emulator.stats["bytesIn"] - bytesIn, calls[0])
+
+	def testWritePerFragment(self):
+		self.addStrand(0, 300)
+		before = dict(self.device.txStats)
+		calls = self.counted()
+
+		self.assertEqual(self.neopixel.sendLeds(0, "ctrl", dict((i, [ i % 256, 0, 0 ]) for i in range(0, 300))), 0)
+		fragments = self.device.txStats["fragments"] - before["fragments"]
+		self.assertGreater(fragments, 1)
+		self.assertEqual(self.device.txStats["lastFrameWrites"], fragments)
+		self.assertEqual(len(calls), fragments)
+		self.assertLessEqual(max(calls), arduino_frag_size)
+
+	def testGathered(self):
+		self.addStrand(0, 10)
+		frame = self.neopixel.createMessage({ "id":0, "command":"ctrl", "type":"neopixel", "data":{ "leds":{ 3:[ 7, 8, 9 ] } } }).tobytes()
+		before = dict(self.device.txStats)
+
+		self.device.serialWrite(frame[:headerStruct.size], frame[headerStruct.size:])
+		self.assertEqual(self.device.reader.response(5)[0], r_ack)
+		self.assertEqual(self.device.txStats["writes"] - before["writes"], 1)
+		self.assertEqual(self.device.txStats["bytes"] - before["bytes"], len(frame))
+		self.assertEqual(self.shown(0)[9:12], b"\x07\x08\x09")
+
+if __name__ == "__main__":
+	unittest.main()